@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# Layout benchmarks for fa2_adjustSize.
+#
+# Times the ForceAtlas2 backends on synthetic graphs shaped like Debian
+# dependency graphs, without GTK, apt or a display.  Build the Cython
+# extension in place first to include it:
+#
+#   cd src/fa2_adjustSize && python3 setup.py fa2util.pyx build_ext --inplace
+#
+# then, from the top of the tree:
+#
+#   python3 benchmarks/layout_benchmark.py --output results.json
+#   python3 benchmarks/layout_benchmark.py --baseline results.json
+#
+# Every result records the median seconds per iteration and a limit, the
+# median plus the tolerance.  Given a baseline, the run fails with exit
+# status 1 when a case is slower than the limit recorded in the baseline.
+#
+# Available under the GPLv3
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from src.fa2_adjustSize import PHASES, ForceAtlas2, available_backends
+from src.utils import normalized_size
+
+SIZES = (1000, 5000, 20000, 50000)
+
+# Benchmarked configurations: ForceAtlas2 options, and the largest graph
+# each one is run on so that the quadratic ones finish in reasonable time.
+# The python backend always runs the uncompiled kernels of fa2util.py,
+# even with the Cython extension built in place.  The numpy backend has no
+# Barnes-Hut approximation, its case times the exact repulsion it runs
+# either way.
+CASES = {
+    'python': ({'backend': 'python'}, 5000),
+    'numpy': ({'backend': 'numpy', 'barnesHutOptimize': False}, 5000),
+    'cython-exact': ({'backend': 'cython', 'barnesHutOptimize': False}, 20000),
+    'cython': ({'backend': 'cython'}, None),
+    'cython-multilevel': ({'backend': 'cython', 'multilevel': True}, None),
+}
+
+# Options shared by every case, as the application sets them
+LAYOUT_OPTIONS = {
+    'adjustSizes': True,
+    'scalingRatio': 1,
+    'strongGravityMode': True,
+    'gravity': 0.1,
+    'outboundAttractionDistribution': True,
+    'verbose': False,
+}
+
+
+def dependency_graph(node_count, seed=0):
+    """Generate a random DAG shaped like a Debian dependency graph.
+
+    Packages arrive one at a time and depend on earlier ones.  The number
+    of dependencies follows a Pareto distribution, with one package in ten
+    depending on nothing, and dependencies are mostly picked in proportion
+    to how many packages already depend on them, so that a few libraries
+    become hubs the way libc does.
+
+    Returns (adjacency, size): the package -> dependency edges as a CSR
+    tuple and the node sizes the application would use.
+    """
+    rng = random.Random(seed)
+    dependencies = []
+    dependents = []  # One entry per edge, for picking by in-degree
+    for i in range(node_count):
+        targets = set()
+        if i and rng.random() >= 0.1:
+            for _ in range(min(i, int(rng.paretovariate(1.5)))):
+                if dependents and rng.random() < 0.8:
+                    targets.add(rng.choice(dependents))
+                else:
+                    targets.add(rng.randrange(i))
+        dependencies.append(sorted(targets))
+        dependents.extend(targets)
+
+    indptr = [0]
+    indices = []
+    degree = [len(targets) for targets in dependencies]
+    for targets in dependencies:
+        indices.extend(targets)
+        indptr.append(len(indices))
+        for j in targets:
+            degree[j] += 1
+
+    return (indptr, indices), [normalized_size(d) for d in degree]
+
+
+def run_case(name, adjacency, size, iterations, threads, seed):
+    """Lay out one graph with one case and summarize the timings"""
+    options, _ = CASES[name]
+    fa2 = ForceAtlas2(multiThreaded=threads or True, seed=seed, **LAYOUT_OPTIONS, **options)
+    fa2.forceatlas2(adjacency, iterations=iterations, size=size)
+
+    stats = fa2.stats
+    perIteration = [sum(row[1:1 + len(PHASES)]) for row in stats.iterationTimes]
+    return {
+        'case': name,
+        'backend': stats.backend,
+        'threads': stats.threads,
+        'nodes': stats.nodeCount,
+        'edges': stats.edgeCount,
+        'levels': stats.levels,
+        'iterations': stats.iterations,
+        'refineIterations': stats.refineIterations,
+        'setupTime': stats.setupTime,
+        'totalTime': stats.totalTime,
+        'perIteration': {
+            'median': statistics.median(perIteration),
+            'mean': statistics.fmean(perIteration),
+            'min': min(perIteration),
+        },
+        'phaseTimes': {phase: seconds / len(stats.iterationTimes) for phase, seconds in stats.phaseTimes.items()},
+    }
+
+
+def check_regressions(results, baseline):
+    """Compare results with the limits of a baseline, return the regressions"""
+    limits = {(r['case'], r['nodes']): r['limit'] for r in baseline['results']}
+    regressions = []
+    for result in results:
+        limit = limits.get((result['case'], result['nodes']))
+        if limit is not None and result['perIteration']['median'] > limit:
+            regressions.append((result, limit))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ForceAtlas2 layout backends")
+    parser.add_argument('--sizes', type=lambda s: [int(n) for n in s.split(',')], default=list(SIZES),
+                        help="comma separated node counts (default: %(default)s)")
+    parser.add_argument('--cases', type=lambda s: s.split(','), default=list(CASES),
+                        help="comma separated cases out of %(default)s")
+    parser.add_argument('--iterations', type=int, default=20, help="iterations per run (default: %(default)s)")
+    parser.add_argument('--threads', type=int, default=0, help="kernel threads, 0 for every core")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the graphs and the layouts")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="slowdown allowed before a case counts as a regression (default: %(default)s)")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="results of an earlier run to check for regressions")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    backends = available_backends()
+
+    results = []
+    skipped = []
+    for node_count in args.sizes:
+        start = time.perf_counter()
+        adjacency, size = dependency_graph(node_count, args.seed)
+        print(f"{node_count} nodes, {len(adjacency[1])} edges, generated in {time.perf_counter() - start:.2f}s",
+              flush=True)
+        for name in args.cases:
+            options, maxNodes = CASES[name]
+            if options['backend'] not in backends:
+                skipped.append({'case': name, 'nodes': node_count, 'reason': 'backend not available'})
+                continue
+            if maxNodes is not None and node_count > maxNodes:
+                skipped.append({'case': name, 'nodes': node_count, 'reason': f'limited to {maxNodes} nodes'})
+                continue
+
+            result = run_case(name, adjacency, size, args.iterations, args.threads, args.seed)
+            result['limit'] = result['perIteration']['median'] * (1 + args.tolerance)
+            results.append(result)
+            print(f"  {name:<18} {result['threads']:>3} threads  "
+                  f"{result['perIteration']['median'] * 1000:9.2f} ms/iteration  "
+                  f"{result['totalTime']:7.2f}s total", flush=True)
+
+    report = {
+        'machine': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpuCount': os.cpu_count(),
+        },
+        'settings': {
+            'iterations': args.iterations,
+            'threads': args.threads,
+            'seed': args.seed,
+            'tolerance': args.tolerance,
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check_regressions(results, json.load(f))
+        for result, limit in regressions:
+            print(f"REGRESSION {result['case']} at {result['nodes']} nodes: "
+                  f"{result['perIteration']['median'] * 1000:.2f} ms/iteration, limit {limit * 1000:.2f}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
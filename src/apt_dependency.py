@@ -1,63 +1,478 @@
-import apt
-from apt.cache import Filter, FilteredCache, Package
+import mmap
+import re
+import time
+from array import array
+from collections import Counter
 
-import networkx as nx
+try:
+    import apt_pkg
+    from apt.progress.base import OpProgress
+except ImportError:
+    # Only needed to read the apt cache, not the dpkg status file.
+    apt_pkg = None
+    OpProgress = object
 
+from .dependency_graph import DependencyGraph
 from .utils import *
 
-class MarkedManualFilter(Filter):
-    """Filter that returns all packages marked as manual"""
+DPKG_STATUS = '/var/lib/dpkg/status'
+EXTENDED_STATES = '/var/lib/apt/extended_states'
 
-    def apply(self, pkg: Package) -> bool:
-        if pkg.is_installed and not pkg.is_auto_installed:
-            return True
-        else:
-            return False
+# Dependency fields followed by the graph, in the order they are resolved
+DEPENDENCY_FIELDS = ('Pre-Depends', 'Depends')
 
+# Packages in weakly connected components smaller than this are orphans
+ORPHAN_THRESHOLD = 3
 
-def format_pkg_name(pkg: Package) -> str:
-    """Format the package name in {name}={version}:{arch} format"""
 
-    return f"{pkg.shortname}={pkg.installed.version}:{pkg.architecture()}"
+class BuildProgress(OpProgress):
+    """Progress of a dependency graph build.
 
+    apt drives update() while it reads the package cache, the build then
+    reports the packages it went through.  `callback`, if given, is called
+    with a description of the current step and the fraction of it done.
+    phaseTimes holds the seconds spent in each phase of the build.
+    """
 
-def build_dependency_graph() -> nx.DiGraph:
-    cache = apt.Cache()
-    filtered = FilteredCache(cache)
-    filtered.set_filter(MarkedManualFilter())
+    def __init__(self, callback=None):
+        super().__init__()
+        self.op = ''
+        self.percent = 0.0
+        self.callback = callback
+        self.phaseTimes = {}
+        self._phase = None
+        self._phaseStart = 0.0
 
-    graph = nx.DiGraph()
+    def begin(self, phase):
+        """Start timing the next phase of the build"""
+        self.end()
+        self._phase = phase
+        self._phaseStart = time.perf_counter()
 
-    for pkg in filtered:
-        formatted_name = format_pkg_name(pkg)
-        if pkg.installed.section == "metapackages":
+    def end(self):
+        if self._phase is not None:
+            self.phaseTimes[self._phase] = time.perf_counter() - self._phaseStart
+            self._phase = None
+
+    def update(self, percent=None):
+        if percent is not None:
+            self.percent = percent
+        self.report(self.op, self.percent / 100)
+
+    def report(self, text, fraction):
+        if self.callback is not None:
+            self.callback(text, fraction)
+
+
+def available_graph_sources():
+    """Return the names of the usable graph sources, preferred first"""
+    sources = []
+    if apt_pkg is not None:
+        sources.append('apt')
+    sources.append('dpkg')
+    return sources
+
+
+def _open_cache(progress):
+    # The same initialization `import apt` does, without the rest of it.
+    if 'APT' not in apt_pkg.config:
+        apt_pkg.init_config()
+    apt_pkg.init_system()
+    cache = apt_pkg.Cache(progress)
+    return cache, apt_pkg.DepCache(cache)
+
+
+def build_dependency_graph(progress: BuildProgress = None) -> DependencyGraph:
+    """Graph the manually installed packages and everything they depend on.
+
+    Nodes are named {name}={version}:{arch}.  The package cache is read
+    with apt_pkg directly and walked once for the manually installed
+    packages; every package gets its node id and name the first time it is
+    seen, and its dependencies are read in turn, so the automatically
+    installed packages they pull in, directly or not, are in the graph with
+    their own dependencies.  Packages nothing manually installed needs are
+    left out.
+    """
+    if progress is None:
+        progress = BuildProgress()
+
+    progress.begin('cache')
+    cache, depcache = _open_cache(progress)
+
+    progress.begin('dependencies')
+    graph_nodes = _GraphNodes()
+    ids = {}  # Package id -> node id
+    pending = []  # (node id, version) of the packages whose dependencies are still to be read
+
+    def node_id(pkg, version):
+        node = ids.get(pkg.id)
+        if node is None:
+            node = ids[pkg.id] = graph_nodes.add(f"{pkg.name}={version.ver_str}:{pkg.architecture}")
+            pending.append((node, version))
+        return node
+
+    installed_count = 0
+    package_count = cache.package_count
+    for i, pkg in enumerate(cache.packages):
+        if i % 1000 == 0:
+            progress.report("Finding manually installed packages", i / package_count)
+
+        version = pkg.current_ver
+        if version is None:
+            continue
+        installed_count += 1
+        if depcache.is_auto_installed(pkg):
+            continue
+        if version.section == "metapackages":
             # Skip metapackages for now
             continue
+        graph_nodes.set_manual(node_id(pkg, version), version.section)
+
+    edges = []
+    # Grows as dependencies turn up packages not seen before
+    for k, (node, version) in enumerate(pending):
+        if k % 1000 == 0:
+            progress.report("Reading dependencies", k / installed_count)
+        or_groups = [group for field in DEPENDENCY_FIELDS
+                     for group in version.depends_list.get(field.replace('-', ''), ())]
+        for or_group in or_groups:
+            # The first installed package that satisfies the dependency,
+            # through any of the alternatives and their providers.
+            target = next((t for dep in or_group for t in dep.all_targets()
+                           if t.parent_pkg.current_ver is not None and t.parent_pkg.current_ver.id == t.id), None)
+            if target is None:
+                continue
+            edges.append((node, node_id(target.parent_pkg, target)))
 
-        graph.add_node(formatted_name, manual=True, section=pkg.installed.section)
-        for dep in pkg.installed.dependencies:
-            if dep.rawtype == 'Depends':
-                # TODO: handle OR-dependencies, or make sure that [0] indicates the installed candidate
-                dep_name = format_pkg_name(dep.installed_target_versions[0].package) 
-                graph.add_node(dep_name)
-                graph.add_edge(formatted_name, dep_name)
-
-    # Assign weight to nodes based on the number of both inward and outward dependencies
-    for node in graph.nodes:
-        graph.nodes[node]["weight"] = len(graph.in_edges(node)) + len(graph.out_edges(node))
-        graph.nodes[node]["size"] = normalized_size(graph.nodes[node]["weight"])
-    
-    cache.close()
+    progress.begin('graph')
+    graph = graph_nodes.build(edges)
+    progress.end()
 
     return graph
 
 
-def get_orphan_nodes(graph: nx.DiGraph) -> list[str]:
-    """Return nodes that belong to weakly connected components smaller than 3."""
-    orphan_nodes = []
+class _GraphNodes:
+    """Node table of a DependencyGraph under construction"""
+
+    def __init__(self):
+        self.names = []
+        self.manual = []
+        self.sections = []
+
+    def add(self, name):
+        self.names.append(name)
+        self.manual.append(False)
+        self.sections.append(None)
+        return len(self.names) - 1
+
+    def set_manual(self, node, section):
+        self.manual[node] = True
+        self.sections[node] = section
+
+    def build(self, edges):
+        return DependencyGraph(self.names, self.manual, self.sections, edges)
+
+
+def read_stanzas(path, fields=None):
+    """Read a deb822 file, such as the dpkg status file, one stanza at a time.
+
+    Yields a dictionary per stanza, holding only the given `fields` if
+    any.  Continuation lines are joined with a space.  The file is mapped
+    into memory rather than read into a string.
+    """
+    wanted = None if fields is None else {field.encode() for field in fields}
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped.
+            return
+
+        with data:
+            stanza = {}
+            key = None
+            for line in iter(data.readline, b''):
+                if line[:1] in (b' ', b'\t'):
+                    if key is not None:
+                        stanza[key] += ' ' + line.strip().decode(errors='replace')
+                    continue
+
+                line = line.rstrip()
+                if not line:
+                    if stanza:
+                        yield stanza
+                        stanza = {}
+                    key = None
+                    continue
+
+                name, _, value = line.partition(b':')
+                if wanted is not None and name not in wanted:
+                    key = None
+                    continue
+                key = name.decode()
+                stanza[key] = value.strip().decode(errors='replace')
+            if stanza:
+                yield stanza
+
+
+_DEPENDENCY_RE = re.compile(r'\s*([^\s:(\[<]+)(?::([a-z0-9-]+))?\s*(?:\(\s*([<>=]+)\s*([^)\s]+)\s*\))?')
+
+
+def parse_dependencies(value):
+    """Split a Depends-style field into OR groups of (name, arch, op, version)"""
+    groups = []
+    for group in value.split(','):
+        atoms = []
+        for atom in group.split('|'):
+            match = _DEPENDENCY_RE.match(atom)
+            if match and match.group(1):
+                atoms.append(match.groups())
+        if atoms:
+            groups.append(atoms)
+    return groups
+
+
+def _order(c):
+    # Sort weight of a non-digit character, as dpkg defines it
+    if '0' <= c <= '9':
+        return 0
+    if c.isascii() and c.isalpha():
+        return ord(c)
+    if c == '~':
+        return -1
+    return ord(c) + 256 if c else 0
+
+
+def _compare_fragment(a, b):
+    # dpkg's verrevcmp(): alternating runs of non-digits and numbers
+    i = j = 0
+    while i < len(a) or j < len(b):
+        while (i < len(a) and not '0' <= a[i] <= '9') or (j < len(b) and not '0' <= b[j] <= '9'):
+            ac = _order(a[i] if i < len(a) else '')
+            bc = _order(b[j] if j < len(b) else '')
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+        start = i
+        while i < len(a) and '0' <= a[i] <= '9':
+            i += 1
+        number_a = int(a[start:i] or 0)
+        start = j
+        while j < len(b) and '0' <= b[j] <= '9':
+            j += 1
+        number_b = int(b[start:j] or 0)
+        if number_a != number_b:
+            return number_a - number_b
+    return 0
+
+
+def compare_versions(a, b):
+    """Compare two Debian version strings like dpkg, returning <0, 0 or >0"""
+    def split(version):
+        epoch, _, rest = version.partition(':') if ':' in version else ('0', '', version)
+        upstream, _, revision = rest.rpartition('-') if '-' in rest else (rest, '', '')
+        return int(epoch or 0), upstream, revision
+
+    epoch_a, upstream_a, revision_a = split(a)
+    epoch_b, upstream_b, revision_b = split(b)
+    if epoch_a != epoch_b:
+        return epoch_a - epoch_b
+    return _compare_fragment(upstream_a, upstream_b) or _compare_fragment(revision_a, revision_b)
+
+
+def _version_satisfies(version, op, required):
+    if op is None:
+        return True
+    if version is None:
+        # A provided name without a version only satisfies unversioned dependencies.
+        return False
+    result = compare_versions(version, required)
+    return {'<<': result < 0, '<=': result <= 0, '<': result <= 0, '=': result == 0,
+            '>=': result >= 0, '>': result >= 0, '>>': result > 0}.get(op, False)
+
+
+def _arch_satisfies(package, depender_arch, qualifier, native_arch):
+    # Multi-Arch rules for whether `package` can satisfy a dependency of a
+    # package of `depender_arch`.
+    multi_arch = package['Multi-Arch']
+    if qualifier == 'any':
+        return package['arch'] == depender_arch or multi_arch in ('allowed', 'foreign')
+    if qualifier == 'native':
+        return package['arch'] == native_arch
+    if qualifier:
+        return package['arch'] == qualifier
+    return package['arch'] == depender_arch or multi_arch == 'foreign'
+
+
+def build_dependency_graph_from_status(status_path=DPKG_STATUS, extended_states_path=EXTENDED_STATES,
+                                       progress: BuildProgress = None) -> DependencyGraph:
+    """Graph the manually installed packages and their dependencies from dpkg's own records.
+
+    Builds the graph build_dependency_graph() does without python-apt or
+    an apt cache, from a status file and an apt extended_states file that
+    may come from another machine.  Every OR group is resolved to
+    its first alternative that is installed in a suitable version, or
+    provided by an installed package.  A missing extended_states file
+    makes every package count as manually installed.
+    """
+    if progress is None:
+        progress = BuildProgress()
+
+    progress.begin('status')
+    progress.report("Reading dpkg status", 0.0)
+    installed = []
+    for stanza in read_stanzas(status_path, ('Package', 'Status', 'Architecture', 'Version', 'Section',
+                                             'Multi-Arch', 'Provides') + DEPENDENCY_FIELDS):
+        status = stanza.get('Status', '').split()
+        if len(status) == 3 and status[2] not in ('not-installed', 'config-files') and 'Version' in stanza:
+            installed.append(stanza)
+
+    # apt files Architecture: all packages under the native architecture,
+    # which is dpkg's own.
+    architectures = Counter(p.get('Architecture') for p in installed if p.get('Architecture') != 'all')
+    native_arch = next((p.get('Architecture') for p in installed if p['Package'] == 'dpkg'), None)
+    if native_arch is None and architectures:
+        native_arch = architectures.most_common(1)[0][0]
+
+    packages = {}  # Name -> installed packages of that name
+    providers = {}  # Name -> (package, provided version) of installed packages providing it
+    for package in installed:
+        arch = package.get('Architecture', native_arch)
+        package['arch'] = native_arch if arch == 'all' else arch
+        package.setdefault('Multi-Arch', 'no')
+        package['node'] = f"{package['Package']}={package['Version']}:{package['arch']}"
+        packages.setdefault(package['Package'], []).append(package)
+        for group in parse_dependencies(package.get('Provides', '')):
+            name, _, _, version = group[0]
+            providers.setdefault(name, []).append((package, version))
+
+    auto = set()
+    try:
+        for stanza in read_stanzas(extended_states_path, ('Package', 'Architecture', 'Auto-Installed')):
+            if stanza.get('Auto-Installed') == '1':
+                auto.add((stanza.get('Package'), stanza.get('Architecture', native_arch)))
+    except FileNotFoundError:
+        pass
+
+    progress.begin('dependencies')
+    graph_nodes = _GraphNodes()
+    ids = {}  # Node name -> node id
+    pending = []  # (node id, package) of the packages whose dependencies are still to be read
+
+    def node_id(package):
+        node = ids.get(package['node'])
+        if node is None:
+            node = ids[package['node']] = graph_nodes.add(package['node'])
+            pending.append((node, package))
+        return node
+
+    for package in installed:
+        if (package['Package'], package['arch']) in auto:
+            continue
+        if package.get('Section') == "metapackages":
+            # Skip metapackages for now
+            continue
+        graph_nodes.set_manual(node_id(package), package.get('Section'))
+
+    edges = []
+    # Grows as dependencies turn up packages not seen before
+    for k, (node, package) in enumerate(pending):
+        if k % 1000 == 0:
+            progress.report("Reading dependencies", k / len(installed))
+        for field in DEPENDENCY_FIELDS:
+            for or_group in parse_dependencies(package.get(field, '')):
+                target = next((t for name, qualifier, op, version in or_group
+                               for t in _resolve(name, qualifier, op, version, package['arch'],
+                                                 packages, providers, native_arch)), None)
+                if target is None:
+                    continue
+                edges.append((node, node_id(target)))
+
+    progress.begin('graph')
+    graph = graph_nodes.build(edges)
+    progress.end()
+
+    return graph
+
+
+def _resolve(name, qualifier, op, version, depender_arch, packages, providers, native_arch):
+    """Yield the installed packages satisfying one alternative of a dependency"""
+    for package in packages.get(name, ()):
+        if _arch_satisfies(package, depender_arch, qualifier, native_arch) and \
+                _version_satisfies(package['Version'], op, version):
+            yield package
+    for package, provided in providers.get(name, ()):
+        if _arch_satisfies(package, depender_arch, qualifier, native_arch) and \
+                _version_satisfies(provided, op, version):
+            yield package
+
+
+class GraphDiff:
+    """Package-level difference between two dependency graphs.
+
+    Packages are matched by name and architecture, so a new version of an
+    installed package shows up in `upgraded` rather than as a removal and
+    an addition.
+    """
+
+    def __init__(self):
+        self.added = []           # Nodes of the new graph
+        self.removed = []         # Nodes of the old graph
+        self.upgraded = {}        # Old node -> new node
+        self.manual_changed = []  # Nodes of the new graph
+        self.kept = {}            # Old node -> new node, for every package in both graphs
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.upgraded or self.manual_changed)
+
+
+def diff_dependency_graphs(old: DependencyGraph, new: DependencyGraph) -> GraphDiff:
+    """Compare the packages of two dependency graphs"""
+    diff = GraphDiff()
+    old_ids = {get_pkg_id_from_node(name): node for node, name in enumerate(old.names)}
+    for node, name in enumerate(new.names):
+        old_node = old_ids.pop(get_pkg_id_from_node(name), None)
+        if old_node is None:
+            diff.added.append(node)
+            continue
+        diff.kept[old_node] = node
+        if old.names[old_node] != name:
+            diff.upgraded[old_node] = node
+        if old.manual[old_node] != new.manual[node]:
+            diff.manual_changed.append(node)
+    diff.removed.extend(old_ids.values())
+    return diff
+
+
+def changed_nodes(old: DependencyGraph, new: DependencyGraph, diff: GraphDiff) -> set[int]:
+    """Return the nodes of `new` whose dependencies or dependents differ from `old`.
+
+    That is the region of the layout that needs another look after the
+    change described by `diff`; everything else can stay where it was.
+    """
+    kept = diff.kept
+    affected = set(diff.added)
+    for node in diff.added:
+        affected.update(new.successors(node))
+        affected.update(new.predecessors(node))
+    for node in diff.removed:
+        affected.update(kept[n] for n in (*old.successors(node), *old.predecessors(node)) if n in kept)
+
+    for old_node, node in kept.items():
+        before = {kept.get(n) for n in old.successors(old_node)}
+        after = set(new.successors(node))
+        if before != after:
+            affected.add(node)
+            affected.update(n for n in before ^ after if n is not None)
+    return affected
+
+
+def get_orphan_nodes(graph: DependencyGraph, threshold: int = ORPHAN_THRESHOLD) -> array:
+    """Return nodes that belong to weakly connected components smaller than `threshold`."""
+    return graph.component_members(0, graph.components_smaller_than(threshold))
 
-    for component in nx.weakly_connected_components(graph):
-        if len(component) < 3:
-            orphan_nodes.extend(component)
 
-    return orphan_nodes
+def get_orphan_edges(graph: DependencyGraph, threshold: int = ORPHAN_THRESHOLD):
+    """Return the dependencies between the nodes get_orphan_nodes() returns."""
+    return graph.component_edges(0, graph.components_smaller_than(threshold))
@@ -5,7 +5,7 @@ from gi.repository import Gtk, Adw, Gdk, Gio
 
 from .utils import *
 from .state_manager import GraphState
-from .apt_dependency import get_orphan_nodes
+from .apt_dependency import get_orphan_edges, get_orphan_nodes
 
 SCALE_MIN = 0.1
 SCALE_MAX = 10.0
@@ -26,22 +26,25 @@ class Canvas(Adw.Bin):
     is_dragging = False
 
     node_graph = None
-    pos_dict = None
-    orig_pos_dict = None
     state = None
 
     colors = {}
 
-    normal_edges = set()
-    outward_edges = set()
-    inward_edges = set()
-    dimmed_nodes = set()
-    normal_nodes = set()
+    # Highlight state, as collections of node ids and (dependent, dependency)
+    # pairs.  normal_nodes and normal_edges are None while everything is
+    # drawn normally; otherwise the nodes outside normal_nodes are dimmed.
+    # chain_edges trace the selected package back to manually installed ones.
+    normal_edges = None
+    outward_edges = ()
+    inward_edges = ()
+    chain_edges = ()
+    normal_nodes = None
 
     drawing_area = Gtk.Template.Child()
     legend_drawing_area = Gtk.Template.Child()
     label_popover = Gtk.Template.Child()
     pkg_name_label = Gtk.Template.Child()
+    layout_progress_bar = Gtk.Template.Child()
 
     def __init__(self):
         super().__init__()
@@ -56,6 +59,10 @@ class Canvas(Adw.Bin):
         self.drawing_area.set_cursor(self.default_cursor)
 
         self.appearance_settings = Gio.Settings.new("io.github.cacheuseonly.graphite.appearance")
+        self.settings = Gio.Settings.new("io.github.cacheuseonly.graphite.common")
+        self.settings.connect("changed::orphan-threshold", self._on_orphan_threshold_changed)
+        self.settings.connect("changed::transitive-highlight", self._on_highlight_setting_changed)
+        self.settings.connect("changed::install-chains", self._on_highlight_setting_changed)
         self.style_manager = Adw.StyleManager()
         self.style_manager.connect("notify::dark", self.load_theme_colors)
 
@@ -124,6 +131,11 @@ class Canvas(Adw.Bin):
         # Draw outward edge example (arrow pointing right)
         _draw_legend_edge(cr, margin + 5, y_pos, margin + 35, y_pos,
                               self.colors['outward-edge-color'], arrow_right=True)
+        y_pos += item_spacing
+
+        # Draw installation chain example (arrow pointing right)
+        _draw_legend_edge(cr, margin + 5, y_pos, margin + 35, y_pos,
+                          self.colors['chain-edge-color'], arrow_right=True)
 
     def _on_regenerate_requested(self, _):
         self.motion_enabled = False
@@ -134,33 +146,52 @@ class Canvas(Adw.Bin):
         self.state.connect('node-deselected', self._on_node_deselected)
         self.state.connect('regenerate-requested', self._on_regenerate_requested)
         self.state.connect('show-orphans-requested', self._on_show_orphans_requested)
+        self.state.connect('job-finished', self._on_job_finished)
 
-    def set_data(self, node_graph, pos_dict):
-        self.normal_edges.clear()
-        self.outward_edges.clear() 
-        self.inward_edges.clear()
-        self.dimmed_nodes.clear()
-        self.normal_nodes.clear()
-        
-        self.node_graph = node_graph
-        self.all_nodes_set = set(node_graph.nodes())
-        self.all_edges_set = set(node_graph.edges())
+    def set_data(self, node_graph):
+        self._set_graph(node_graph)
 
-        self.pos_dict = pos_dict
-        self.orig_pos_dict = pos_dict.copy()
         self.scale = 1.0
         self.x_translate = None
         self.y_translate = None
 
-        for node, neighbors in self.node_graph.adjacency():
-            for neighbor in neighbors:
-                self.normal_edges.add((node, neighbor))
-
-        self.normal_nodes.update(self.node_graph.nodes())
+        self.normal_edges = None
+        self.outward_edges = ()
+        self.inward_edges = ()
+        self.chain_edges = ()
+        self.normal_nodes = None
 
         self.drawing_area.queue_draw()
         self.legend_drawing_area.queue_draw()
 
+    def _set_graph(self, node_graph):
+        self.node_graph = node_graph
+        # Section id of metapackages, which are drawn hollow
+        sections = node_graph.sections
+        self._metapackages = sections.index("metapackages") if "metapackages" in sections else None
+
+    def positions_changed(self):
+        """Redraw after the coordinates of the graph changed, keeping zoom, pan and highlights"""
+        self.drawing_area.queue_draw()
+
+    def update_graph(self, node_graph):
+        """Show another version of the current graph, keeping zoom and pan"""
+        self._set_graph(node_graph)
+        if self.state.selected_node is not None:
+            self._on_node_selected(self.state, self.state.selected_node)
+        elif self.state.show_orphans:
+            self._on_show_orphans_requested(self.state)
+        else:
+            self._on_node_deselected(self.state)
+
+    def set_layout_progress(self, fraction):
+        """Show how far a running layout is, or hide the bar when fraction is None"""
+        if fraction is None:
+            self.layout_progress_bar.set_visible(False)
+        else:
+            self.layout_progress_bar.set_fraction(fraction)
+            self.layout_progress_bar.set_visible(True)
+
     def _setup_controllers(self):
         # Drag controller
         gesture = Gtk.GestureDrag()
@@ -187,13 +218,14 @@ class Canvas(Adw.Bin):
 
     def draw_edge(self,
                   cr: cairo.Context,
-                  node_1: str,
-                  node_2: str,
+                  node_1: int,
+                  node_2: int,
                   type: str,
                   width=1,
                   has_arrow=False):
-        x1, y1 = self.pos_dict[node_1]
-        x2, y2 = self.pos_dict[node_2]
+        graph = self.node_graph
+        x1, y1 = graph.x[node_1] * self.scale, graph.y[node_1] * self.scale
+        x2, y2 = graph.x[node_2] * self.scale, graph.y[node_2] * self.scale
 
         color = self.colors[f"{type}-edge-color"]
         cr.set_source_rgb(color[0]/255, color[1]/255, color[2]/255)
@@ -213,8 +245,8 @@ class Canvas(Adw.Bin):
             arrow_angle = math.pi / 6  # 30 degrees
 
             # Calculate arrow points
-            arrow_x = x2 - (self.node_graph.nodes[node_2]["size"] * self.scale) * math.cos(angle)
-            arrow_y = y2 - (self.node_graph.nodes[node_2]["size"] * self.scale) * math.sin(angle)
+            arrow_x = x2 - (graph.size[node_2] * self.scale) * math.cos(angle)
+            arrow_y = y2 - (graph.size[node_2] * self.scale) * math.sin(angle)
 
             # Draw arrow head
             cr.move_to(arrow_x, arrow_y)
@@ -227,7 +259,7 @@ class Canvas(Adw.Bin):
 
     def draw_node(self,
                   cr: cairo.Context,
-                  node: str,
+                  node: int,
                   type: str,
                   dimmed: bool = False
                   ):
@@ -244,19 +276,20 @@ class Canvas(Adw.Bin):
         # call new_sub_path()
         cr.new_sub_path()
 
-        radius = self.node_graph.nodes[node]["size"] * self.scale
-        cr.arc(self.pos_dict[node][0],
-               self.pos_dict[node][1],
+        graph = self.node_graph
+        radius = graph.size[node] * self.scale
+        cr.arc(graph.x[node] * self.scale,
+               graph.y[node] * self.scale,
                radius,
                0, 2 * math.pi)
 
-        if self.node_graph.nodes[node].get("section", None) == "metapackages":
+        if graph.section[node] == self._metapackages:
             cr.stroke()
         else:
             cr.fill()
 
     def draw_func(self, _event, cr: cairo.Context, width, height):
-        if not self.node_graph or not self.pos_dict:
+        if not self.node_graph:
             return
 
         if self.x_translate is None or self.y_translate is None:
@@ -266,30 +299,38 @@ class Canvas(Adw.Bin):
 
         cr.translate(self.x_translate, self.y_translate)
 
-        for edge in self.normal_edges:
-            self.draw_edge(cr, edge[0], edge[1], type='default')
+        # Plain edges all look the same, stroke them as one path.
+        graph = self.node_graph
+        x, y, scale = graph.x, graph.y, self.scale
+        color = self.colors["default-edge-color"]
+        cr.set_source_rgb(color[0]/255, color[1]/255, color[2]/255)
+        cr.set_line_width(1)
+        for node_1, node_2 in graph.edges() if self.normal_edges is None else self.normal_edges:
+            cr.move_to(x[node_1] * scale, y[node_1] * scale)
+            cr.line_to(x[node_2] * scale, y[node_2] * scale)
+        cr.stroke()
 
-        # Draw dimmed nodes
-        for node in self.dimmed_nodes:
-            if self.node_graph.nodes[node].get("manual", False):
-                self.draw_node(cr, node, type='manual', dimmed=True)
-            else:
-                self.draw_node(cr, node, type='auto', dimmed=True)
+        # Draw dimmed nodes, which is every node outside normal_nodes
+        manual = graph.manual
+        normal_nodes = self.normal_nodes
+        if normal_nodes is not None:
+            for node in graph.nodes():
+                if node not in normal_nodes:
+                    self.draw_node(cr, node, type='manual' if manual[node] else 'auto', dimmed=True)
 
         # Draw highlighted edges
         for edge in self.inward_edges:
             self.draw_edge(cr, edge[0], edge[1], type='inward', width=2, has_arrow=True)
         for edge in self.outward_edges:
             self.draw_edge(cr, edge[0], edge[1], type='outward', width=2, has_arrow=True)
+        for edge in self.chain_edges:
+            self.draw_edge(cr, edge[0], edge[1], type='chain', width=3, has_arrow=True)
 
         # Draw normal nodes last
-        for node in self.normal_nodes:
-            if self.node_graph.nodes[node].get("manual", False):
-                self.draw_node(cr, node, type='manual')
-            else:
-                self.draw_node(cr, node, type='auto')
+        for node in graph.nodes() if normal_nodes is None else normal_nodes:
+            self.draw_node(cr, node, type='manual' if manual[node] else 'auto')
 
-        if self.state.selected_node:
+        if self.state.selected_node is not None:
             self.draw_node(cr, self.state.selected_node, type='selected')
 
     def on_drag_begin(self, _event, _x, _y):
@@ -321,18 +362,12 @@ class Canvas(Adw.Bin):
 
         self.scale = new_scale
 
-        for entry in self.pos_dict:
-            x, y = self.orig_pos_dict[entry]
-            new_x = x * self.scale
-            new_y = y * self.scale
-            self.pos_dict[entry] = (new_x, new_y)
-
         self.x_translate = self.x_cursor - (self.x_cursor - self.x_translate) * (self.scale / old_scale)
         self.y_translate = self.y_cursor - (self.y_cursor - self.y_translate) * (self.scale / old_scale)
 
         event.get_widget().queue_draw()
 
-    def _get_node_at_position(self, x: float, y: float) -> str | None:
+    def _get_node_at_position(self, x: float, y: float) -> int | None:
         """Get the node at the given screen coordinates, or None if no node is there."""
         if not self.motion_enabled:
             return None
@@ -340,11 +375,9 @@ class Canvas(Adw.Bin):
         x_graph = (x - self.x_translate) / self.scale
         y_graph = (y - self.y_translate) / self.scale
 
-        for node in self.node_graph.nodes():
-            node_x, node_y = self.orig_pos_dict[node]
-            distance = math.sqrt((x_graph - node_x)**2 + (y_graph - node_y)**2)
-            node_radius = self.node_graph.nodes[node]["size"]
-            if distance <= node_radius:
+        graph = self.node_graph
+        for node, (node_x, node_y, node_radius) in enumerate(zip(graph.x, graph.y, graph.size)):
+            if (x_graph - node_x)**2 + (y_graph - node_y)**2 <= node_radius**2:
                 return node
         return None
 
@@ -353,15 +386,16 @@ class Canvas(Adw.Bin):
         self.y_cursor = y
         hovered_node = self._get_node_at_position(x, y)
 
-        if hovered_node:
+        if hovered_node is not None:
             self.drawing_area.set_cursor(self.hand_cursor)
-            name = get_pkg_name_from_node(hovered_node)
+            graph = self.node_graph
+            name = get_pkg_name_from_node(graph.names[hovered_node])
 
             self.pkg_name_label.set_markup(f"<b>{name}</b>")
 
             rect = Gdk.Rectangle()
-            rect.x = self.pos_dict[hovered_node][0] + self.x_translate
-            rect.y = self.pos_dict[hovered_node][1] + self.y_translate - self.node_graph.nodes[hovered_node]["size"] * self.scale
+            rect.x = graph.x[hovered_node] * self.scale + self.x_translate
+            rect.y = (graph.y[hovered_node] - graph.size[hovered_node]) * self.scale + self.y_translate
             rect.width = 1
             rect.height = 1
             self.label_popover.set_pointing_to(rect)
@@ -387,42 +421,67 @@ class Canvas(Adw.Bin):
             self.state.selected_node = clicked_node
         self.drawing_area.queue_draw()
 
-    def _on_node_selected(self, _state, node: str):
-        successors = set(self.node_graph.successors(node))
-        predecessors = set(self.node_graph.predecessors(node))
-        related_nodes = successors | predecessors
-        self.normal_nodes = related_nodes
-        self.dimmed_nodes = self.all_nodes_set - self.normal_nodes
-
-        self.inward_edges = self.node_graph.in_edges(nbunch=node)
-        self.outward_edges = self.node_graph.out_edges(nbunch=node)
+    def _on_node_selected(self, _state, node: int):
+        graph = self.node_graph
+        # Indexes still being built in the background are not waited for:
+        # direct highlights and no chains until they are there.
+        reachability = graph.reachability(build=False) if self.settings.get_boolean('transitive-highlight') else None
+        if reachability is not None:
+            successors = reachability.dependencies(node)
+            predecessors = reachability.dependents(node)
+            # Every edge below the node leads to a dependency, and every
+            # edge above it comes from a dependent.
+            self.outward_edges = [(n, m) for n in (node, *successors) for m in graph.successors(n)]
+            self.inward_edges = [(m, n) for n in (node, *predecessors) for m in graph.predecessors(n)]
+        else:
+            successors = graph.successors(node)
+            predecessors = graph.predecessors(node)
+            self.outward_edges = [(node, n) for n in successors]
+            self.inward_edges = [(n, node) for n in predecessors]
+        self.normal_nodes = set(successors) | set(predecessors)
+
+        # Why an automatically installed package is there
+        chains = []
+        install_paths = graph.install_paths(build=False)
+        if not graph.manual[node] and install_paths is not None:
+            chains = install_paths.chains(node, self.settings.get_int('install-chains'))
+        self.chain_edges = {edge for chain in chains for edge in zip(chain, chain[1:])}
+        self.normal_nodes.update(n for chain in chains for n in chain)
 
         self.drawing_area.queue_draw()
 
     def _on_node_deselected(self, _state):
-        self.normal_nodes = self.all_nodes_set
-        self.dimmed_nodes = set()
-
-        self.normal_edges = set(self.node_graph.edges())
-        self.inward_edges = set()
-        self.outward_edges = set()
+        # None stands for every node and every edge of the graph
+        self.normal_nodes = None
+        self.normal_edges = None
+        self.inward_edges = ()
+        self.outward_edges = ()
+        self.chain_edges = ()
         self.drawing_area.queue_draw()
 
     def _on_show_orphans_requested(self, _):
-        orphan_nodes = get_orphan_nodes(self.node_graph)
-        self.normal_nodes = set(orphan_nodes)
-        self.dimmed_nodes = self.all_nodes_set - self.normal_nodes
-
-        orphan_edges = set()
-        for node in orphan_nodes:
-            orphan_edges.update(self.node_graph.in_edges(nbunch=node))
-            orphan_edges.update(self.node_graph.out_edges(nbunch=node))
-        self.normal_edges = orphan_edges
-        self.inward_edges = set()
-        self.outward_edges = set()
+        threshold = self.settings.get_int('orphan-threshold')
+        self.normal_nodes = set(get_orphan_nodes(self.node_graph, threshold))
+
+        self.normal_edges = set(get_orphan_edges(self.node_graph, threshold))
+        self.inward_edges = ()
+        self.outward_edges = ()
+        self.chain_edges = ()
 
         self.drawing_area.queue_draw()
 
+    def _on_job_finished(self, _state, name):
+        if name == 'query-index':
+            self._on_highlight_setting_changed()
+
+    def _on_highlight_setting_changed(self, *_):
+        if self.node_graph is not None and self.state.selected_node is not None:
+            self._on_node_selected(self.state, self.state.selected_node)
+
+    def _on_orphan_threshold_changed(self, *_):
+        if self.node_graph is not None and self.state.show_orphans:
+            self._on_show_orphans_requested(self.state)
+
     def load_theme_colors(self, *_):
         """Update the color palette based on the current theme."""
         color_palette = self.appearance_settings.get_child("dark" if self.style_manager.get_dark() else "light")
@@ -0,0 +1,232 @@
+# cli.py
+#
+# Copyright 2025 Yuxuan Luo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Build, lay out and export dependency graphs without a display.
+
+Nothing here imports GTK.  Graphs are cached like the application caches
+them, so the local system shares its layout with the application.
+"""
+
+import argparse
+import os
+import random
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from .apt_dependency import (DPKG_STATUS, EXTENDED_STATES, BuildProgress, available_graph_sources,
+                             build_dependency_graph, build_dependency_graph_from_status)
+from .export import FORMATS, IMAGE_FORMATS, export_graph
+from .fa2_adjustSize import ForceAtlas2, available_initial_layouts
+from .graph_cache import cache_path, load_graph, write_graph
+from .layout_job import WARM_START_SPEED, layout_options, warm_start_positions
+
+# Seconds between two layout progress lines
+PROGRESS_INTERVAL = 1.0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='graphite-export',
+        description="Lay out the dependency graph of installed APT packages and export it.")
+    parser.add_argument('inputs', nargs='*', metavar='STATUS',
+                        help="dpkg status file, or the root directory of a system to read "
+                             "var/lib/dpkg/status from; the local system if none is given")
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help="directory the exports are written to (default: %(default)s)")
+    parser.add_argument('-f', '--format', default='json',
+                        help="comma separated export formats out of " + ', '.join(FORMATS)
+                             + " (default: %(default)s)")
+    parser.add_argument('--size', default='2000x2000', metavar='WxH',
+                        help="size of rendered images, in pixels or points (default: %(default)s)")
+    parser.add_argument('--dark', action='store_true', help="render with the dark color scheme")
+    parser.add_argument('--source', choices=('apt', 'dpkg'),
+                        help="how to read the local system, apt when python-apt is available")
+    parser.add_argument('--iterations', type=int, default=800,
+                        help="layout iterations (default: %(default)s)")
+    parser.add_argument('--warm-start-iterations', type=int, default=150,
+                        help="layout iterations when refining a cached layout (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="layout seed (default: %(default)s)")
+    parser.add_argument('--initial-layout', default='pivot-mds', choices=available_initial_layouts(),
+                        help="initial layout of the nodes (default: %(default)s)")
+    parser.add_argument('--gravity', type=float, default=0.1, help="gravity (default: %(default)s)")
+    parser.add_argument('--lin-log-mode', action='store_true', help="use LinLog attraction")
+    parser.add_argument('--multilevel', action='store_true', help="lay out coarsened graphs first")
+    parser.add_argument('--component-layout', action='store_true',
+                        help="lay out connected components separately")
+    parser.add_argument('--threads', type=int,
+                        help="layout threads per input, 0 for every core "
+                             "(default: 0, or 1 when running several jobs)")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of inputs processed in parallel (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="neither reuse nor store cached graphs and layouts")
+    args = parser.parse_args(argv)
+
+    args.formats = [fmt.strip() for fmt in args.format.split(',') if fmt.strip()]
+    for fmt in args.formats:
+        if fmt not in FORMATS:
+            parser.error(f"unknown format {fmt!r}")
+    try:
+        width, height = args.size.lower().split('x')
+        args.width, args.height = int(width), int(height)
+    except ValueError:
+        parser.error(f"invalid size {args.size!r}")
+    if args.source == 'apt' and 'apt' not in available_graph_sources():
+        parser.error("the apt source needs python-apt")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.threads is not None and args.threads < 0:
+        parser.error("--threads must not be negative")
+    if args.threads is None:
+        args.threads = 1 if args.jobs > 1 and len(args.inputs) > 1 else 0
+    return args
+
+
+def input_files(path):
+    """Return the status and extended_states files an input names"""
+    if os.path.isdir(path):
+        return (os.path.join(path, DPKG_STATUS.lstrip('/')),
+                os.path.join(path, EXTENDED_STATES.lstrip('/')))
+    return path, os.path.join(os.path.dirname(path), 'extended_states')
+
+
+def output_name(path):
+    """Base name of the exports of an input"""
+    if path is None:
+        return 'graphite'
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        return os.path.basename(path.rstrip(os.sep)) or 'root'
+    if path.endswith(DPKG_STATUS) and len(path) > len(DPKG_STATUS):
+        # The status file of a system root is named after the root.
+        return os.path.basename(path[:-len(DPKG_STATUS)])
+    name = os.path.basename(path)
+    if name == 'status':
+        return os.path.basename(os.path.dirname(path))
+    return os.path.splitext(name)[0]
+
+
+def same_structure(graph, other):
+    return (other is not None and graph.names == other.names and graph.manual == other.manual
+            and graph.out_indptr == other.out_indptr and graph.out_indices == other.out_indices)
+
+
+def process_input(path, args):
+    """Build, lay out and export one input; returns the paths written"""
+    label = output_name(path)
+
+    def report(message):
+        print(f"{label}: {message}", file=sys.stderr, flush=True)
+
+    def report_build(text, fraction):
+        report(f"{text} {fraction:.0%}")
+
+    progress = BuildProgress(report_build)
+    if path is not None:
+        status, extended_states = input_files(path)
+        node_graph = build_dependency_graph_from_status(status, extended_states, progress)
+        cache = cache_path(status)
+    else:
+        source = args.source or available_graph_sources()[0]
+        if source == 'dpkg':
+            node_graph = build_dependency_graph_from_status(progress=progress)
+        else:
+            node_graph = build_dependency_graph(progress)
+        cache = cache_path()
+    report(f"{len(node_graph)} packages, {node_graph.number_of_edges()} dependencies")
+
+    previous_graph = None if args.no_cache else load_graph(cache)
+    if same_structure(node_graph, previous_graph):
+        report("reusing the cached layout")
+        node_graph = previous_graph
+    else:
+        layout(node_graph, previous_graph, args, report)
+        if not args.no_cache:
+            write_graph(node_graph, cache)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    written = []
+    for fmt in args.formats:
+        output = os.path.join(args.output_dir, f'{label}.{fmt}')
+        export_graph(node_graph, output, fmt, args.width, args.height, 'dark' if args.dark else 'light')
+        report(f"wrote {output}")
+        written.append(output)
+    return written
+
+
+def layout(node_graph, previous_graph, args, report):
+    # In this process: parallel runs already get a process per input.
+    fa2 = ForceAtlas2(**layout_options(gravity=args.gravity,
+                                       linLogMode=args.lin_log_mode,
+                                       multilevel=args.multilevel,
+                                       componentLayout=args.component_layout,
+                                       initialLayout=args.initial_layout,
+                                       seed=args.seed,
+                                       threads=args.threads))
+    kwargs = {
+        'iterations': args.iterations,
+        'roots': [bool(manual) for manual in node_graph.manual],
+    }
+    if previous_graph is not None:
+        report("refining the cached layout")
+        pos, _unchanged = warm_start_positions(node_graph, previous_graph, random.Random(args.seed))
+        kwargs.update(pos=pos, iterations=args.warm_start_iterations, initialSpeed=WARM_START_SPEED)
+
+    def report_layout(progress):
+        report(f"layout {progress.iteration}/{progress.totalIterations} {progress.fraction:.0%}, "
+               f"{progress.eta:.0f} s left")
+
+    positions = fa2.forceatlas2(node_graph.adjacency(), size=node_graph.size.tolist(),
+                                progress=report_layout, progressInterval=PROGRESS_INTERVAL, **kwargs)
+    node_graph.set_positions(positions)
+    stopped = "converged" if fa2.stopReason == 'converged' else "stopped"
+    refined = f", refined in {fa2.refineIterationsRun} more" if fa2.refineIterationsRun else ""
+    report(f"layout {stopped} after {fa2.iterationsRun} iterations{refined}")
+
+
+def _run(path, args):
+    # Failures are reported and counted rather than ending the other jobs.
+    try:
+        process_input(path, args)
+        return True
+    except Exception:
+        print(f"{output_name(path)}: failed\n{traceback.format_exc()}", file=sys.stderr, flush=True)
+        return False
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if any(fmt in IMAGE_FORMATS for fmt in args.formats):
+        from .export import cairo
+        if cairo is None:
+            print("graphite-export: rendering images needs pycairo", file=sys.stderr)
+            return 2
+
+    inputs = args.inputs or [None]
+    if args.jobs > 1 and len(inputs) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(_run, inputs, [args] * len(inputs)))
+    else:
+        results = [_run(path, args) for path in inputs]
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
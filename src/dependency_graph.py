@@ -0,0 +1,262 @@
+from array import array
+from bisect import bisect_left
+
+from .install_paths import InstallPaths
+from .reachability import ReachabilityIndex
+from .utils import normalized_size
+
+# Version of what a graph holds, stored with it.  Bumped whenever the
+# builders or the indexes change what a graph of the same packages contains,
+# so that cached graphs of earlier versions get rebuilt.
+#   1: manually installed packages and their direct dependencies
+#   2: components indexed, and the dependencies of automatically installed
+#      packages followed
+GRAPH_VERSION = 2
+
+
+def _csr(node_count, edges):
+    """Compress (row, column) pairs into CSR arrays, keeping their order within a row"""
+    indptr = array('i', bytes(4 * (node_count + 1)))
+    for i, _ in edges:
+        indptr[i + 1] += 1
+    for i in range(node_count):
+        indptr[i + 1] += indptr[i]
+
+    indices = array('i', bytes(4 * len(edges)))
+    cursor = indptr[:-1]
+    for i, j in edges:
+        indices[cursor[i]] = j
+        cursor[i] += 1
+    return indptr, indices
+
+
+class DependencyGraph:
+    """Dependency graph of the installed packages, stored in flat arrays.
+
+    Nodes are the integers 0 to n - 1.  Their names, {name}={version}:{arch},
+    are kept once in the `names` string table, and every attribute is a
+    typed array indexed by node: `manual`, `section` (an index into the
+    `sections` table), `weight`, `size`, and the layout coordinates `x`
+    and `y`.  Dependencies are stored in CSR form in both directions: the
+    dependencies of node i are out_indices[out_indptr[i]:out_indptr[i + 1]]
+    and its dependents in_indices[in_indptr[i]:in_indptr[i + 1]].
+
+    Weakly connected components are indexed as the graph is built:
+    `component` maps nodes to components, numbered from the smallest to
+    the largest, and the nodes and dependencies of component c are
+    component_nodes[component_indptr[c]:component_indptr[c + 1]] and the
+    pairs of component_edge_sources and component_edge_targets between
+    component_edge_indptr[c] and component_edge_indptr[c + 1].
+
+    reachability() answers transitive queries and install_paths() finds the
+    manually installed packages that pull a package in, each from an index
+    built the first time it is needed.  Building takes a while on large
+    graphs: the main loop passes build=False and makes do without an index
+    that a background job has not built yet.
+
+    A graph does not change once built, except for its coordinates.
+    nodes(), successors(), predecessors() and neighbors() behave like their
+    NetworkX counterparts, and to_networkx() exports the graph.
+    """
+
+    def __init__(self, names, manual, sections, edges):
+        """Build a graph from per-node names, manual flags and section names,
+        and (dependent, dependency) pairs of node ids."""
+        node_count = len(names)
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.manual = array('b', manual)
+
+        table = {}
+        self.section = array('H', (table.setdefault(section, len(table)) for section in sections))
+        self.sections = list(table)
+
+        # Duplicate dependencies, e.g. from Pre-Depends and Depends, count once.
+        edges = list(dict.fromkeys(edges))
+        self.out_indptr, self.out_indices = _csr(node_count, edges)
+        self.in_indptr, self.in_indices = _csr(node_count, [(j, i) for i, j in edges])
+
+        # Weight is the number of both inward and outward dependencies
+        out_indptr, in_indptr = self.out_indptr, self.in_indptr
+        self.weight = array('i', (out_indptr[i + 1] - out_indptr[i] + in_indptr[i + 1] - in_indptr[i]
+                                  for i in range(node_count)))
+        self.size = array('d', (normalized_size(w) for w in self.weight))
+        self.x = array('d', bytes(8 * node_count))
+        self.y = array('d', bytes(8 * node_count))
+        self.version = GRAPH_VERSION
+        self._index_components()
+        self._reachability = None
+        self._install_paths = None
+
+    def _index_components(self):
+        components = sorted(self.weakly_connected_components(), key=lambda c: (len(c), min(c)))
+        self.component = array('i', bytes(4 * len(self.names)))
+        self.component_indptr = array('i', [0])
+        self.component_nodes = array('i')
+        self.component_edge_indptr = array('i', [0])
+        self.component_edge_sources = array('i')
+        self.component_edge_targets = array('i')
+        for c, nodes in enumerate(components):
+            for node in sorted(nodes):
+                self.component[node] = c
+                self.component_nodes.append(node)
+                targets = self.successors(node)
+                self.component_edge_sources.extend([node] * len(targets))
+                self.component_edge_targets.extend(targets)
+            self.component_indptr.append(len(self.component_nodes))
+            self.component_edge_indptr.append(len(self.component_edge_sources))
+
+    def __getstate__(self):
+        # The name index is cheaper to rebuild than to store, and the
+        # query indexes are only built when used.
+        state = self.__dict__.copy()
+        del state['ids']
+        state['_reachability'] = None
+        state['_install_paths'] = None
+        return state
+
+    def __setstate__(self, state):
+        if state.get('version') != GRAPH_VERSION:
+            # Cached by another version: load_graph() treats the cache as
+            # unusable and the graph gets rebuilt.
+            raise KeyError('version')
+        self.__dict__.update(state)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self._reachability = None
+        self._install_paths = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def nodes(self):
+        return range(len(self.names))
+
+    def is_directed(self):
+        return True
+
+    def number_of_edges(self):
+        return len(self.out_indices)
+
+    def successors(self, node):
+        """Dependencies of `node`"""
+        return self.out_indices[self.out_indptr[node]:self.out_indptr[node + 1]]
+
+    neighbors = successors
+
+    def predecessors(self, node):
+        """Dependents of `node`"""
+        return self.in_indices[self.in_indptr[node]:self.in_indptr[node + 1]]
+
+    def edges(self):
+        """Yield every (dependent, dependency) pair"""
+        indptr, indices = self.out_indptr, self.out_indices
+        for i in range(len(self.names)):
+            for k in range(indptr[i], indptr[i + 1]):
+                yield i, indices[k]
+
+    def adjacency(self):
+        """The dependencies as an (indptr, indices) CSR tuple, as forceatlas2() takes it"""
+        return self.out_indptr, self.out_indices
+
+    def section_name(self, node):
+        return self.sections[self.section[node]]
+
+    def positions(self):
+        return list(zip(self.x, self.y))
+
+    def set_positions(self, positions):
+        """Take the coordinates of every node from a list of (x, y), in node order"""
+        self.x = array('d', (xy[0] for xy in positions))
+        self.y = array('d', (xy[1] for xy in positions))
+
+    def subgraph(self, nodes):
+        """Return the graph induced by `nodes`, which become nodes 0, 1, ...
+
+        Sizes, weights and coordinates are carried over rather than
+        recomputed from the smaller graph.
+        """
+        nodes = list(nodes)
+        local = {node: i for i, node in enumerate(nodes)}
+        edges = [(local[node], local[target]) for node in nodes
+                 for target in self.successors(node) if target in local]
+        graph = DependencyGraph([self.names[node] for node in nodes],
+                                [self.manual[node] for node in nodes],
+                                [self.section_name(node) for node in nodes],
+                                edges)
+        for attribute in ('weight', 'size', 'x', 'y'):
+            values = getattr(self, attribute)
+            setattr(graph, attribute, array(values.typecode, (values[node] for node in nodes)))
+        return graph
+
+    def weakly_connected_components(self):
+        """Yield the sets of nodes connected by dependencies in either direction"""
+        seen = bytearray(len(self.names))
+        for start in range(len(self.names)):
+            if seen[start]:
+                continue
+            seen[start] = 1
+            component = [start]
+            for node in component:
+                for neighbor in (*self.successors(node), *self.predecessors(node)):
+                    if not seen[neighbor]:
+                        seen[neighbor] = 1
+                        component.append(neighbor)
+            yield set(component)
+
+    def component_count(self):
+        return len(self.component_indptr) - 1
+
+    def component_size(self, c):
+        return self.component_indptr[c + 1] - self.component_indptr[c]
+
+    def components_smaller_than(self, size):
+        """Return how many components have fewer than `size` nodes.
+
+        Components are numbered by size, so those are components 0 to the
+        returned number - 1.
+        """
+        return bisect_left(range(self.component_count()), size, key=self.component_size)
+
+    def component_members(self, start, stop=None):
+        """Nodes of component `start`, or of components start to stop - 1"""
+        stop = start + 1 if stop is None else stop
+        return self.component_nodes[self.component_indptr[start]:self.component_indptr[stop]]
+
+    def component_edges(self, start, stop=None):
+        """(dependent, dependency) pairs of component `start`, or of components start to stop - 1"""
+        stop = start + 1 if stop is None else stop
+        begin, end = self.component_edge_indptr[start], self.component_edge_indptr[stop]
+        return zip(self.component_edge_sources[begin:end], self.component_edge_targets[begin:end])
+
+    def reachability(self, build=True):
+        """Return the ReachabilityIndex of the graph, building it on first use.
+
+        With build False, return None rather than build it.
+        """
+        if self._reachability is None and build:
+            self._reachability = ReachabilityIndex(self)
+        return self._reachability
+
+    def install_paths(self, build=True):
+        """Return the InstallPaths of the graph, building them on first use.
+
+        With build False, return None rather than build them.
+        """
+        if self._install_paths is None and build:
+            self._install_paths = InstallPaths(self)
+        return self._install_paths
+
+    def to_networkx(self):
+        """Export the graph as a NetworkX DiGraph keyed by node name"""
+        import networkx as nx
+
+        graph = nx.DiGraph()
+        for node, name in enumerate(self.names):
+            attributes = {'weight': self.weight[node], 'size': self.size[node]}
+            if self.manual[node]:
+                attributes['manual'] = True
+            if self.section_name(node) is not None:
+                attributes['section'] = self.section_name(node)
+            graph.add_node(name, **attributes)
+        graph.add_edges_from((self.names[i], self.names[j]) for i, j in self.edges())
+        return graph
@@ -0,0 +1,152 @@
+import json
+import math
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    import cairo
+except ImportError:
+    # Only needed to render images.
+    cairo = None
+
+from .utils import *
+
+FORMATS = ('json', 'graphml', 'png', 'svg', 'pdf')
+IMAGE_FORMATS = ('png', 'svg', 'pdf')
+
+# Colors of the default appearance settings, plus the libadwaita window
+# background the canvas is drawn on
+PALETTES = {
+    'light': {
+        'background-color': (250, 250, 250),
+        'default-edge-color': (229, 229, 229),
+        'manual-node-color': (95, 169, 255),
+        'auto-node-color': (180, 180, 180),
+    },
+    'dark': {
+        'background-color': (36, 36, 36),
+        'default-edge-color': (49, 49, 49),
+        'manual-node-color': (71, 156, 255),
+        'auto-node-color': (220, 220, 220),
+    },
+}
+
+# Space left around the graph in a rendered image, in pixels or points
+MARGIN = 20
+
+
+def export_graph(graph, path, fmt, width=2000, height=2000, theme='light'):
+    """Write a laid out DependencyGraph to `path` in one of FORMATS"""
+    if fmt == 'json':
+        write_json(graph, path)
+    elif fmt == 'graphml':
+        write_graphml(graph, path)
+    elif fmt in IMAGE_FORMATS:
+        render(graph, path, fmt, width, height, theme)
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}")
+
+
+def write_json(graph, path):
+    nodes = []
+    for node, name in enumerate(graph.names):
+        nodes.append({
+            'id': node,
+            'name': name,
+            'package': get_pkg_name_from_node(name),
+            'version': get_pkg_version_from_node(name),
+            'arch': get_pkg_arch_from_node(name),
+            'manual': bool(graph.manual[node]),
+            'section': graph.section_name(node),
+            'weight': graph.weight[node],
+            'size': graph.size[node],
+            'x': graph.x[node],
+            'y': graph.y[node],
+        })
+    with open(path, 'w') as f:
+        json.dump({'nodes': nodes, 'edges': [list(edge) for edge in graph.edges()]}, f)
+
+
+def write_graphml(graph, path):
+    # Written by hand rather than through NetworkX, which is optional.
+    keys = (('name', 'string'), ('manual', 'boolean'), ('section', 'string'),
+            ('weight', 'int'), ('size', 'double'), ('x', 'double'), ('y', 'double'))
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for key, kind in keys:
+            f.write(f'  <key id="{key}" for="node" attr.name="{key}" attr.type="{kind}"/>\n')
+        f.write('  <graph id="dependencies" edgedefault="directed">\n')
+        for node, name in enumerate(graph.names):
+            f.write(f'    <node id="n{node}">'
+                    f'<data key="name">{escape(name)}</data>'
+                    f'<data key="manual">{"true" if graph.manual[node] else "false"}</data>')
+            section = graph.section_name(node)
+            if section is not None:
+                f.write(f'<data key="section">{escape(section)}</data>')
+            f.write(f'<data key="weight">{graph.weight[node]}</data>'
+                    f'<data key="size">{graph.size[node]!r}</data>'
+                    f'<data key="x">{graph.x[node]!r}</data>'
+                    f'<data key="y">{graph.y[node]!r}</data></node>\n')
+        for i, j in graph.edges():
+            f.write(f'    <edge source={quoteattr(f"n{i}")} target={quoteattr(f"n{j}")}/>\n')
+        f.write('  </graph>\n</graphml>\n')
+
+
+def render(graph, path, fmt, width, height, theme='light'):
+    """Draw the graph the way the canvas shows it, fitted into width x height.
+
+    PNG sizes are in pixels, SVG and PDF sizes in points.
+    """
+    if cairo is None:
+        raise RuntimeError("Rendering images needs pycairo")
+
+    if fmt == 'png':
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+    elif fmt == 'svg':
+        surface = cairo.SVGSurface(path, width, height)
+    else:
+        surface = cairo.PDFSurface(path, width, height)
+
+    colors = PALETTES[theme]
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(*_rgb(colors['background-color']))
+    cr.paint()
+
+    if len(graph):
+        x, y, size = graph.x, graph.y, graph.size
+        left = min(x[i] - size[i] for i in graph.nodes())
+        right = max(x[i] + size[i] for i in graph.nodes())
+        top = min(y[i] - size[i] for i in graph.nodes())
+        bottom = max(y[i] + size[i] for i in graph.nodes())
+        scale = min((width - 2 * MARGIN) / max(right - left, 1e-9),
+                    (height - 2 * MARGIN) / max(bottom - top, 1e-9))
+        cr.translate(width / 2, height / 2)
+        cr.scale(scale, scale)
+        cr.translate(-(left + right) / 2, -(top + bottom) / 2)
+
+        cr.set_source_rgb(*_rgb(colors['default-edge-color']))
+        cr.set_line_width(1 / scale)
+        for i, j in graph.edges():
+            cr.move_to(x[i], y[i])
+            cr.line_to(x[j], y[j])
+        cr.stroke()
+
+        sections = graph.sections
+        metapackages = sections.index("metapackages") if "metapackages" in sections else None
+        for node in graph.nodes():
+            kind = 'manual' if graph.manual[node] else 'auto'
+            cr.set_source_rgb(*_rgb(colors[f'{kind}-node-color']))
+            cr.new_sub_path()
+            cr.arc(x[node], y[node], size[node], 0, 2 * math.pi)
+            if graph.section[node] == metapackages:
+                cr.stroke()
+            else:
+                cr.fill()
+
+    if fmt == 'png':
+        surface.write_to_png(path)
+    surface.finish()
+
+
+def _rgb(color):
+    return color[0] / 255, color[1] / 255, color[2] / 255
@@ -0,0 +1,180 @@
+# NumPy implementation of the fa2util routines, for when the Cython
+# extension has not been compiled.  It mirrors the Layout interface of
+# the compiled module and follows the pure Python functions in fa2util.py
+# formula for formula, so the three backends produce the same layouts up
+# to floating point summation order.
+#
+# Available under the GPLv3
+
+import numpy as np
+
+from . import fa2util
+
+# Upper bound on the number of node pairs evaluated at once by the
+# repulsion.  Each of the eight or so float64 temporaries of a block then
+# takes 256 kB, which keeps a block in cache and is faster than larger
+# blocks.
+REPULSION_BLOCK_PAIRS = 1 << 15
+
+
+class Layout:
+    """Layout state held in NumPy arrays.
+
+    Barnes-Hut is not vectorized: `apply_repulsion_barneshut` computes the
+    exact repulsion in blocks instead.  With barnesHutOptimize this backend
+    is therefore quadratic, and its layouts
+    follow those of the exact repulsion of the other backends, not their
+    approximation.  NumPy runs the kernels on a single thread, `threads`
+    is only accepted for compatibility.
+    """
+
+    def __init__(self, x, y, mass, size, edge_node1, edge_node2, edge_weight, fixed=None, threads=0):
+        self.node_count = len(x)
+        self.edge_count = len(edge_node1)
+        self.threads = 1
+        self.quadtree_time = 0.0
+
+        self.x = np.array(x, dtype=np.float64)
+        self.y = np.array(y, dtype=np.float64)
+        self.dx = np.zeros(self.node_count)
+        self.dy = np.zeros(self.node_count)
+        self.old_dx = np.zeros(self.node_count)
+        self.old_dy = np.zeros(self.node_count)
+        self.mass = np.array(mass, dtype=np.float64)
+        self.size = np.array(size, dtype=np.float64)
+        if fixed is None:
+            self.fixed = np.zeros(self.node_count, dtype=bool)
+        else:
+            self.fixed = np.array(fixed, dtype=bool)
+
+        self.edge_node1 = np.array(edge_node1, dtype=np.intp)
+        self.edge_node2 = np.array(edge_node2, dtype=np.intp)
+        self.edge_weight = np.array(edge_weight, dtype=np.float64)
+
+    @classmethod
+    def from_nodes(cls, nodes, edges):
+        """Create a layout from lists of Node and Edge objects"""
+        layout = cls([n.x for n in nodes], [n.y for n in nodes],
+                     [n.mass for n in nodes], [n.size for n in nodes],
+                     [e.node1 for e in edges], [e.node2 for e in edges], [e.weight for e in edges],
+                     [n.fixed for n in nodes])
+        layout.dx[:] = [n.dx for n in nodes]
+        layout.dy[:] = [n.dy for n in nodes]
+        layout.old_dx[:] = [n.old_dx for n in nodes]
+        layout.old_dy[:] = [n.old_dy for n in nodes]
+        return layout
+
+    def update_nodes(self, nodes):
+        """Copy positions and forces back into `nodes`"""
+        for i, n in enumerate(nodes):
+            n.x = float(self.x[i])
+            n.y = float(self.y[i])
+            n.dx = float(self.dx[i])
+            n.dy = float(self.dy[i])
+            n.old_dx = float(self.old_dx[i])
+            n.old_dy = float(self.old_dy[i])
+
+    def positions(self):
+        return list(zip(self.x.tolist(), self.y.tolist()))
+
+    def reset_forces(self):
+        self.old_dx, self.dx = self.dx, self.old_dx
+        self.old_dy, self.dy = self.dy, self.old_dy
+        self.dx.fill(0.0)
+        self.dy.fill(0.0)
+
+    def apply_repulsion(self, adjustSize, coefficient):
+        n = self.node_count
+        if n < 2:
+            return
+
+        block = max(1, REPULSION_BLOCK_PAIRS // n)
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            xDist = self.x[start:stop, None] - self.x[None, :]
+            yDist = self.y[start:stop, None] - self.y[None, :]
+            distance2 = xDist * xDist + yDist * yDist
+            massFactor = self.mass[start:stop, None] * self.mass[None, :]
+
+            # A node facing itself has xDist == yDist == 0 and contributes
+            # nothing, so the diagonal needs no masking.
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if adjustSize:
+                    distance = np.sqrt(distance2) - self.size[start:stop, None] - self.size[None, :]
+                    factor = np.where(distance > 0, coefficient * massFactor / distance / distance,
+                                      np.where(distance < 0, 100 * coefficient * massFactor, 0.0))
+                else:
+                    factor = np.where(distance2 > 0, coefficient * massFactor / distance2, 0.0)
+
+            self.dx[start:stop] += (xDist * factor).sum(axis=1)
+            self.dy[start:stop] += (yDist * factor).sum(axis=1)
+
+    def apply_repulsion_barneshut(self, adjustSize, coefficient, theta):
+        self.apply_repulsion(adjustSize, coefficient)
+
+    def apply_gravity(self, gravity, scalingRatio, useStrongGravity=False):
+        if not useStrongGravity:
+            distance = np.sqrt(self.x * self.x + self.y * self.y)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                factor = np.where(distance > 0, self.mass * gravity / distance, 0.0)
+        else:
+            factor = np.where((self.x != 0) & (self.y != 0), scalingRatio * self.mass * gravity, 0.0)
+
+        self.dx -= self.x * factor
+        self.dy -= self.y * factor
+
+    def apply_attraction(self, distributedAttraction, coefficient, edgeWeightInfluence, linLogMode=False):
+        if self.edge_count == 0:
+            return
+
+        n1 = self.edge_node1
+        n2 = self.edge_node2
+        xDist = self.x[n1] - self.x[n2]
+        yDist = self.y[n1] - self.y[n2]
+        distance = np.sqrt(xDist * xDist + yDist * yDist) - self.size[n1] - self.size[n2]
+
+        if edgeWeightInfluence == 0:
+            e = 1
+        elif edgeWeightInfluence == 1:
+            e = self.edge_weight
+        else:
+            e = np.power(self.edge_weight, edgeWeightInfluence)
+
+        if not distributedAttraction:
+            factor = -coefficient * e
+        else:
+            factor = -coefficient * e / self.mass[n1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if linLogMode:
+                factor = factor * np.log1p(distance) / distance
+            factor = np.where(distance > 0, factor, 0.0)
+
+        fx = xDist * factor
+        fy = yDist * factor
+        # bincount is the unbuffered scatter-add of np.add.at, only faster.
+        self.dx += np.bincount(n1, weights=fx, minlength=self.node_count)
+        self.dx -= np.bincount(n2, weights=fx, minlength=self.node_count)
+        self.dy += np.bincount(n1, weights=fy, minlength=self.node_count)
+        self.dy -= np.bincount(n2, weights=fy, minlength=self.node_count)
+
+    def adjustSpeedAndApplyForces(self, speed, speedEfficiency, jitterTolerance):
+        swinging = np.sqrt((self.old_dx - self.dx) ** 2 + (self.old_dy - self.dy) ** 2)
+        totalSwinging = float(np.sum(self.mass * swinging))
+        totalEffectiveTraction = float(np.sum(.5 * self.mass * np.sqrt(
+            (self.old_dx + self.dx) ** 2 + (self.old_dy + self.dy) ** 2)))
+
+        speed, speedEfficiency = fa2util.adjustSpeed(self.node_count, totalSwinging, totalEffectiveTraction,
+                                                     speed, speedEfficiency, jitterTolerance)
+
+        swinging *= self.mass
+        factor = 0.1 * speed / (1.0 + np.sqrt(speed * swinging))
+        df = np.sqrt(self.dx * self.dx + self.dy * self.dy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factor = np.where((df > 0) & ~self.fixed, np.minimum(factor * df, 10) / df, 0.0)
+        self.x += self.dx * factor
+        self.y += self.dy * factor
+
+        return fa2util.speedValues(self.node_count, speed, speedEfficiency, totalSwinging, totalEffectiveTraction,
+                                   float(np.sum(df * factor)), int(np.count_nonzero(~self.fixed)),
+                                   float(np.sum(self.x)), float(np.sum(self.y)),
+                                   float(np.sum(self.x * self.x + self.y * self.y)))
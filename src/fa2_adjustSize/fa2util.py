@@ -10,7 +10,8 @@
 #
 # Available under the GPLv3
 
-from math import sqrt
+import time
+from math import log, sqrt
 
 # This will substitute for the nLayout object
 class Node:
@@ -23,6 +24,7 @@ class Node:
         self.dy = 0.0
         self.x = 0.0
         self.y = 0.0
+        self.fixed = False  # Pinned nodes feel forces but never move
 
 
 # This is not in the original java code, but it makes it easier to deal with edges
@@ -82,6 +84,31 @@ def linRepulsion_region(n, r, coefficient=0):
         n.dy += yDist * factor
 
 
+# Repulsion function for Barnes-Hut.  Every node walks the tree on its
+# own, so only `n` is adjusted here; `other` collects its share when it
+# is the one walking.
+def linRepulsion_node(n, other, coefficient=0, adjustSize=False):
+    xDist = n.x - other.x
+    yDist = n.y - other.y
+
+    if adjustSize:
+        distance = sqrt(xDist * xDist + yDist * yDist) - n.size - other.size
+        if distance > 0:
+            factor = coefficient * n.mass * other.mass / distance / distance
+        elif distance < 0:
+            factor = 100 * coefficient * n.mass * other.mass
+        else:
+            return
+    else:
+        distance2 = xDist * xDist + yDist * yDist
+        if distance2 == 0:
+            return
+        factor = coefficient * n.mass * other.mass / distance2
+
+    n.dx += xDist * factor
+    n.dy += yDist * factor
+
+
 # Gravity repulsion function.  For some reason, gravity was included
 # within the linRepulsion function in the original gephi java code,
 # which doesn't make any sense (considering a. gravity is unrelated to
@@ -129,6 +156,24 @@ def linAttraction_antiCollision(n1, n2, e, distributedAttraction, coefficient=0)
         n2.dy -= yDist * factor
 
 
+# LinLog variant of the attraction above, the force grows with the
+# logarithm of the distance instead of linearly.
+def logAttraction_antiCollision(n1, n2, e, distributedAttraction, coefficient=0):
+    xDist = n1.x - n2.x
+    yDist = n1.y - n2.y
+    distance = sqrt(xDist * xDist + yDist * yDist) - n1.size - n2.size
+
+    if distance > 0:
+        if not distributedAttraction:
+            factor = -coefficient * e * log(1 + distance) / distance
+        else:
+            factor = -coefficient * e / n1.mass * log(1 + distance) / distance
+        n1.dx += xDist * factor
+        n1.dy += yDist * factor
+        n2.dx -= xDist * factor
+        n2.dy -= yDist * factor
+
+
 # The following functions iterate through the nodes or edges and apply
 # the forces directly to the node objects.  These iterations are here
 # instead of the main file because Python is slow with loops.
@@ -147,6 +192,12 @@ def apply_repulsion(nodes, adjustSize, coefficient):
         i += 1
 
 
+def apply_repulsion_barneshut(nodes, adjustSize, coefficient, theta):
+    rootRegion = Region(nodes)
+    rootRegion.buildSubRegions()
+    rootRegion.applyForceOnNodes(nodes, theta, coefficient, adjustSize)
+
+
 def apply_gravity(nodes, gravity, scalingRatio, useStrongGravity=False):
     if not useStrongGravity:
         for n in nodes:
@@ -156,18 +207,19 @@ def apply_gravity(nodes, gravity, scalingRatio, useStrongGravity=False):
             strongGravity(n, gravity, scalingRatio)
 
 
-def apply_attraction(nodes, edges, distributedAttraction, coefficient, edgeWeightInfluence):
+def apply_attraction(nodes, edges, distributedAttraction, coefficient, edgeWeightInfluence, linLogMode=False):
+    attraction = logAttraction_antiCollision if linLogMode else linAttraction_antiCollision
     # Optimization, since usually edgeWeightInfluence is 0 or 1, and pow is slow
     if edgeWeightInfluence == 0:
         for edge in edges:
-            linAttraction_antiCollision(nodes[edge.node1], nodes[edge.node2], 1, distributedAttraction, coefficient)
+            attraction(nodes[edge.node1], nodes[edge.node2], 1, distributedAttraction, coefficient)
     elif edgeWeightInfluence == 1:
         for edge in edges:
-            linAttraction_antiCollision(nodes[edge.node1], nodes[edge.node2], edge.weight, distributedAttraction, coefficient)
+            attraction(nodes[edge.node1], nodes[edge.node2], edge.weight, distributedAttraction, coefficient)
     else:
         for edge in edges:
-            linAttraction_antiCollision(nodes[edge.node1], nodes[edge.node2], pow(edge.weight, edgeWeightInfluence),
-                          distributedAttraction, coefficient)
+            attraction(nodes[edge.node1], nodes[edge.node2], pow(edge.weight, edgeWeightInfluence),
+                       distributedAttraction, coefficient)
 
 
 # For Barnes Hut Optimization
@@ -258,20 +310,21 @@ class Region:
             for subregion in self.subregions:
                 subregion.buildSubRegions()
 
-    def applyForce(self, n, theta, coefficient=0):
+    def applyForce(self, n, theta, coefficient=0, adjustSize=False):
         if len(self.nodes) < 2:
-            linRepulsion(n, self.nodes[0], coefficient)
+            if self.nodes[0] is not n:
+                linRepulsion_node(n, self.nodes[0], coefficient, adjustSize)
         else:
             distance = sqrt((n.x - self.massCenterX) ** 2 + (n.y - self.massCenterY) ** 2)
             if distance * theta > self.size:
                 linRepulsion_region(n, self, coefficient)
             else:
                 for subregion in self.subregions:
-                    subregion.applyForce(n, theta, coefficient)
+                    subregion.applyForce(n, theta, coefficient, adjustSize)
 
-    def applyForceOnNodes(self, nodes, theta, coefficient=0):
+    def applyForceOnNodes(self, nodes, theta, coefficient=0, adjustSize=False):
         for n in nodes:
-            self.applyForce(n, theta, coefficient)
+            self.applyForce(n, theta, coefficient, adjustSize)
 
 
 # Adjust speed and apply forces step
@@ -285,15 +338,48 @@ def adjustSpeedAndApplyForces(nodes, speed, speedEfficiency, jitterTolerance):
         totalEffectiveTraction += .5 * n.mass * sqrt(
             (n.old_dx + n.dx) * (n.old_dx + n.dx) + (n.old_dy + n.dy) * (n.old_dy + n.dy))
 
+    speed, speedEfficiency = adjustSpeed(len(nodes), totalSwinging, totalEffectiveTraction,
+                                         speed, speedEfficiency, jitterTolerance)
+
+    # Apply forces.
+    #
+    # Need to add a case if adjustSizes ("prevent overlap") is
+    # implemented.
+    totalDisplacement = 0.0
+    movableCount = 0
+    sumX = sumY = sumR2 = 0.0
+    for n in nodes:
+        if not n.fixed:
+            movableCount += 1
+            swinging = n.mass * sqrt((n.old_dx - n.dx) * (n.old_dx - n.dx) + (n.old_dy - n.dy) * (n.old_dy - n.dy))
+            factor = 0.1 * speed / (1.0 + sqrt(speed * swinging))
+            df = sqrt(n.dx * n.dx + n.dy * n.dy)
+            if df > 0:
+                # A node without any force stays where it is.
+                factor = min(factor * df, 10) / df
+                n.x = n.x + (n.dx * factor)
+                n.y = n.y + (n.dy * factor)
+                totalDisplacement += df * factor
+        sumX += n.x
+        sumY += n.y
+        sumR2 += n.x * n.x + n.y * n.y
+
+    return speedValues(len(nodes), speed, speedEfficiency, totalSwinging, totalEffectiveTraction,
+                       totalDisplacement, movableCount, sumX, sumY, sumR2)
+
+
+# The speed update of adjustSpeedAndApplyForces, split out so that the
+# array-backed layouts can reuse it with their own swinging sums.
+def adjustSpeed(nodeCount, totalSwinging, totalEffectiveTraction, speed, speedEfficiency, jitterTolerance):
     # Optimize jitter tolerance.  The 'right' jitter tolerance for
     # this network. Bigger networks need more tolerance. Denser
     # networks need less tolerance. Totally empiric.
-    estimatedOptimalJitterTolerance = .05 * sqrt(len(nodes))
+    estimatedOptimalJitterTolerance = .05 * sqrt(nodeCount)
     minJT = sqrt(estimatedOptimalJitterTolerance)
     maxJT = 10
     jt = jitterTolerance * max(minJT,
                                min(maxJT, estimatedOptimalJitterTolerance * totalEffectiveTraction / (
-                                   len(nodes) * len(nodes))))
+                                   nodeCount * nodeCount)))
 
     minSpeedEfficiency = 0.05
 
@@ -319,29 +405,103 @@ def adjustSpeedAndApplyForces(nodes, speed, speedEfficiency, jitterTolerance):
     maxRise = .5
     speed = speed + min(targetSpeed - speed, maxRise * speed)
 
-    # Apply forces.
-    #
-    # Need to add a case if adjustSizes ("prevent overlap") is
-    # implemented.
-    for n in nodes:
-        swinging = n.mass * sqrt((n.old_dx - n.dx) * (n.old_dx - n.dx) + (n.old_dy - n.dy) * (n.old_dy - n.dy))
-        factor = 0.1 * speed / (1.0 + sqrt(speed * swinging))
-        df = sqrt(n.dx * n.dx + n.dy * n.dy)
-        factor = min(factor * df, 10) / df
-        n.x = n.x + (n.dx * factor)
-        n.y = n.y + (n.dy * factor)
+    return speed, speedEfficiency
+
+
+# Pack the outcome of an adjustSpeedAndApplyForces step.  Besides the new
+# speed, this reports the mean distance a movable node moved and the RMS
+# radius of the layout around its centroid, which together tell how far
+# the layout is from settling.
+def speedValues(nodeCount, speed, speedEfficiency, totalSwinging, totalEffectiveTraction,
+                totalDisplacement, movableCount, sumX, sumY, sumR2):
+    centerX = sumX / nodeCount
+    centerY = sumY / nodeCount
 
     values = {}
     values['speed'] = speed
     values['speedEfficiency'] = speedEfficiency
+    values['totalSwinging'] = totalSwinging
+    values['totalEffectiveTraction'] = totalEffectiveTraction
+    values['displacement'] = totalDisplacement / movableCount if movableCount else 0.0
+    values['radius'] = sqrt(max(sumR2 / nodeCount - centerX * centerX - centerY * centerY, 0.0))
 
     return values
 
 
-try:
-    import cython
+# Drives the functions above over lists of Node and Edge objects.  The
+# compiled module also provides Layout, which keeps the same state in
+# flat arrays and exposes the same methods.  NodeLayout always runs on a
+# single thread, `threads` is only accepted for compatibility.
+class NodeLayout:
+    def __init__(self, x, y, mass, size, edge_node1, edge_node2, edge_weight, fixed=None, threads=0):
+        nodes = []
+        for i in range(len(x)):
+            n = Node()
+            n.x = x[i]
+            n.y = y[i]
+            n.mass = mass[i]
+            n.size = size[i]
+            n.fixed = fixed is not None and bool(fixed[i])
+            nodes.append(n)
+
+        edges = []
+        for i in range(len(edge_node1)):
+            e = Edge()
+            e.node1 = edge_node1[i]
+            e.node2 = edge_node2[i]
+            e.weight = edge_weight[i]
+            edges.append(e)
+
+        self._set_nodes(nodes, edges)
+
+    @classmethod
+    def from_nodes(cls, nodes, edges):
+        layout = cls.__new__(cls)
+        layout._set_nodes(nodes, edges)
+        return layout
+
+    def _set_nodes(self, nodes, edges):
+        self.nodes = nodes
+        self.edges = edges
+        self.node_count = len(nodes)
+        self.edge_count = len(edges)
+        self.threads = 1
+        # Seconds spent building Barnes-Hut trees
+        self.quadtree_time = 0.0
+
+    def update_nodes(self, nodes):
+        if nodes is not self.nodes:
+            for n, own in zip(nodes, self.nodes):
+                n.x, n.y = own.x, own.y
+                n.dx, n.dy = own.dx, own.dy
+                n.old_dx, n.old_dy = own.old_dx, own.old_dy
+
+    def positions(self):
+        return [(n.x, n.y) for n in self.nodes]
+
+    def reset_forces(self):
+        for n in self.nodes:
+            n.old_dx = n.dx
+            n.old_dy = n.dy
+            n.dx = 0
+            n.dy = 0
+
+    def apply_repulsion(self, adjustSize, coefficient):
+        apply_repulsion(self.nodes, adjustSize, coefficient)
+
+    def apply_repulsion_barneshut(self, adjustSize, coefficient, theta):
+        start = time.perf_counter()
+        rootRegion = Region(self.nodes)
+        rootRegion.buildSubRegions()
+        self.quadtree_time += time.perf_counter() - start
+        rootRegion.applyForceOnNodes(self.nodes, theta, coefficient, adjustSize)
+
+    def apply_gravity(self, gravity, scalingRatio, useStrongGravity=False):
+        apply_gravity(self.nodes, gravity, scalingRatio, useStrongGravity)
+
+    def apply_attraction(self, distributedAttraction, coefficient, edgeWeightInfluence, linLogMode=False):
+        apply_attraction(self.nodes, self.edges, distributedAttraction, coefficient, edgeWeightInfluence, linLogMode)
+
+    def adjustSpeedAndApplyForces(self, speed, speedEfficiency, jitterTolerance):
+        return adjustSpeedAndApplyForces(self.nodes, speed, speedEfficiency, jitterTolerance)
 
-    if not cython.compiled:
-        print("Warning: uncompiled fa2util module.  Compile with cython for a 10-100x speed boost.")
-except:
-    print("No cython detected.  Install cython and compile the fa2util module for a 10-100x speed boost.")
@@ -3,11 +3,303 @@
 from cython.parallel cimport prange, threadid
 from cython cimport view
 cimport openmp
-from libc.math cimport sqrt as csqrt
+from libc.math cimport sqrt as csqrt, pow as cpow, log as clog
+from libc.stdlib cimport realloc, free
+from libc.string cimport memcpy, memset
 
 include "fa2util.py"
 
 
+# Barnes-Hut quadtree
+# ===================
+#
+# The tree lives in flat C arrays instead of recursive Region objects.  Cells
+# are appended breadth-first, so children always come after their parent and
+# the masses can be accumulated with a single backwards sweep.  Each cell owns
+# a contiguous slice of `order`, which holds node indices grouped by cell.
+
+cdef enum:
+    QUADTREE_MAX_DEPTH = 40
+    # A depth-first walk pops one cell and pushes at most four.
+    QUADTREE_STACK_SIZE = 3 * QUADTREE_MAX_DEPTH + 4
+
+
+cdef struct QuadtreeCell:
+    int first
+    int last
+    int depth
+    bint leaf
+    int child[4]
+    double center_x
+    double center_y
+    double half
+    double mass
+    double mass_x
+    double mass_y
+
+
+cdef struct Quadtree:
+    Py_ssize_t node_capacity
+    Py_ssize_t cell_count
+    Py_ssize_t cell_capacity
+    int *order
+    int *scratch
+    QuadtreeCell *cells
+
+
+cdef void _quadtree_free(Quadtree *tree) noexcept nogil:
+    free(tree.order)
+    free(tree.scratch)
+    free(tree.cells)
+    memset(tree, 0, sizeof(Quadtree))
+
+
+cdef int _quadtree_reserve(Quadtree *tree, Py_ssize_t node_count, Py_ssize_t cell_count) noexcept nogil:
+    cdef void *p
+
+    if node_count > tree.node_capacity:
+        p = realloc(tree.order, node_count * sizeof(int))
+        if p == NULL:
+            return -1
+        tree.order = <int *> p
+        p = realloc(tree.scratch, node_count * sizeof(int))
+        if p == NULL:
+            return -1
+        tree.scratch = <int *> p
+        tree.node_capacity = node_count
+
+    if cell_count > tree.cell_capacity:
+        if cell_count < 2 * tree.cell_capacity:
+            cell_count = 2 * tree.cell_capacity
+        p = realloc(tree.cells, cell_count * sizeof(QuadtreeCell))
+        if p == NULL:
+            return -1
+        tree.cells = <QuadtreeCell *> p
+        tree.cell_capacity = cell_count
+
+    return 0
+
+
+cdef inline int _quadrant(QuadtreeCell *cell, double x, double y) noexcept nogil:
+    return (x >= cell.center_x) | ((y >= cell.center_y) << 1)
+
+
+cdef void _quadtree_split(Quadtree *tree, Py_ssize_t c, double *x, double *y) noexcept nogil:
+    cdef QuadtreeCell *cell = &tree.cells[c]
+    cdef QuadtreeCell *sub
+    cdef int counts[4]
+    cdef int offsets[4]
+    cdef int k, q, node, first
+    cdef double quarter = 0.5 * cell.half
+
+    memset(counts, 0, sizeof(counts))
+    for k in range(cell.first, cell.last):
+        node = tree.order[k]
+        counts[_quadrant(cell, x[node], y[node])] += 1
+
+    offsets[0] = cell.first
+    for q in range(1, 4):
+        offsets[q] = offsets[q - 1] + counts[q - 1]
+
+    for k in range(cell.first, cell.last):
+        node = tree.order[k]
+        q = _quadrant(cell, x[node], y[node])
+        tree.scratch[offsets[q]] = node
+        offsets[q] += 1
+    memcpy(&tree.order[cell.first], &tree.scratch[cell.first], (cell.last - cell.first) * sizeof(int))
+
+    cell.leaf = False
+    first = cell.first
+    for q in range(4):
+        if counts[q] == 0:
+            cell.child[q] = -1
+            continue
+
+        sub = &tree.cells[tree.cell_count]
+        sub.first = first
+        sub.last = first + counts[q]
+        sub.depth = cell.depth + 1
+        sub.leaf = True
+        sub.child[0] = sub.child[1] = sub.child[2] = sub.child[3] = -1
+        sub.center_x = cell.center_x + (quarter if q & 1 else -quarter)
+        sub.center_y = cell.center_y + (quarter if q & 2 else -quarter)
+        sub.half = quarter
+        cell.child[q] = tree.cell_count
+        tree.cell_count += 1
+        first += counts[q]
+
+
+cdef int _quadtree_build(Quadtree *tree, Py_ssize_t node_count, double *x, double *y, double *mass) noexcept nogil:
+    cdef Py_ssize_t i, c, k
+    cdef int node, q
+    cdef double min_x, max_x, min_y, max_y
+    cdef double m, mx, my
+    cdef QuadtreeCell *cell
+    cdef QuadtreeCell *sub
+
+    if _quadtree_reserve(tree, node_count, 2 * node_count + 1) < 0:
+        return -1
+
+    min_x = max_x = x[0]
+    min_y = max_y = y[0]
+    for i in range(node_count):
+        tree.order[i] = i
+        if x[i] < min_x:
+            min_x = x[i]
+        elif x[i] > max_x:
+            max_x = x[i]
+        if y[i] < min_y:
+            min_y = y[i]
+        elif y[i] > max_y:
+            max_y = y[i]
+
+    cell = &tree.cells[0]
+    cell.first = 0
+    cell.last = node_count
+    cell.depth = 0
+    cell.leaf = True
+    cell.child[0] = cell.child[1] = cell.child[2] = cell.child[3] = -1
+    cell.center_x = 0.5 * (min_x + max_x)
+    cell.center_y = 0.5 * (min_y + max_y)
+    # Pad the root a little so that nodes on the boundary fall inside.
+    cell.half = 0.5 * max(max_x - min_x, max_y - min_y) * 1.0001 + 1e-9
+    tree.cell_count = 1
+
+    c = 0
+    while c < tree.cell_count:
+        cell = &tree.cells[c]
+        if cell.last - cell.first > 1 and cell.depth < QUADTREE_MAX_DEPTH:
+            if _quadtree_reserve(tree, node_count, tree.cell_count + 4) < 0:
+                return -1
+            _quadtree_split(tree, c, x, y)
+        c += 1
+
+    for c in range(tree.cell_count - 1, -1, -1):
+        cell = &tree.cells[c]
+        m = mx = my = 0.0
+        if cell.leaf:
+            for k in range(cell.first, cell.last):
+                node = tree.order[k]
+                m += mass[node]
+                mx += mass[node] * x[node]
+                my += mass[node] * y[node]
+        else:
+            for q in range(4):
+                if cell.child[q] >= 0:
+                    sub = &tree.cells[cell.child[q]]
+                    m += sub.mass
+                    mx += sub.mass * sub.mass_x
+                    my += sub.mass * sub.mass_y
+        cell.mass = m
+        if m > 0:
+            cell.mass_x = mx / m
+            cell.mass_y = my / m
+        else:
+            cell.mass_x = cell.center_x
+            cell.mass_y = cell.center_y
+
+    return 0
+
+
+cdef void _quadtree_repulsion(
+    Quadtree *tree,
+    int i,
+    double *x,
+    double *y,
+    double *mass,
+    double *size,
+    bint adjust_size,
+    double coefficient,
+    double theta,
+    double *dx,
+    double *dy,
+) noexcept nogil:
+    cdef int stack[QUADTREE_STACK_SIZE]
+    cdef int top = 1
+    cdef int k, j, q
+    cdef double x_dist
+    cdef double y_dist
+    cdef double distance2
+    cdef double distance
+    cdef double factor
+    cdef double fx = 0.0
+    cdef double fy = 0.0
+    cdef QuadtreeCell *cell
+
+    stack[0] = 0
+    while top > 0:
+        top -= 1
+        cell = &tree.cells[stack[top]]
+
+        if cell.leaf:
+            for k in range(cell.first, cell.last):
+                j = tree.order[k]
+                if j == i:
+                    continue
+                x_dist = x[i] - x[j]
+                y_dist = y[i] - y[j]
+
+                if adjust_size:
+                    distance = csqrt(x_dist * x_dist + y_dist * y_dist) - size[i] - size[j]
+                    if distance == 0:
+                        continue
+                    if distance > 0:
+                        factor = coefficient * mass[i] * mass[j] / distance / distance
+                    else:
+                        factor = 100.0 * coefficient * mass[i] * mass[j]
+                else:
+                    distance2 = x_dist * x_dist + y_dist * y_dist
+                    if distance2 == 0:
+                        continue
+                    factor = coefficient * mass[i] * mass[j] / distance2
+
+                fx += x_dist * factor
+                fy += y_dist * factor
+            continue
+
+        x_dist = x[i] - cell.mass_x
+        y_dist = y[i] - cell.mass_y
+        distance2 = x_dist * x_dist + y_dist * y_dist
+        if csqrt(distance2) * theta > 2.0 * cell.half:
+            # Far enough away: treat the whole cell as a single mass.
+            if distance2 > 0:
+                factor = coefficient * mass[i] * cell.mass / distance2
+                fx += x_dist * factor
+                fy += y_dist * factor
+        else:
+            for q in range(4):
+                if cell.child[q] >= 0:
+                    stack[top] = cell.child[q]
+                    top += 1
+
+    dx[0] += fx
+    dy[0] += fy
+
+
+cdef void _apply_repulsion_barneshut_parallel(
+    Quadtree *tree,
+    Py_ssize_t node_count,
+    double *x,
+    double *y,
+    double *mass,
+    double *size,
+    double *dx,
+    double *dy,
+    bint adjust_size,
+    double coefficient,
+    double theta,
+    int num_threads,
+) noexcept nogil:
+    cdef Py_ssize_t k
+    cdef int i
+
+    # Walk the nodes in tree order so that neighbouring iterations, which
+    # land on the same thread, traverse mostly the same cells.
+    for k in prange(node_count, schedule="guided", nogil=True, num_threads=num_threads):
+        i = tree.order[k]
+        _quadtree_repulsion(tree, i, x, y, mass, size, adjust_size, coefficient, theta, &dx[i], &dy[i])
+
+
 cdef void _apply_repulsion_parallel(
     double[:] x,
     double[:] y,
@@ -17,6 +309,7 @@ cdef void _apply_repulsion_parallel(
     double[:, :] dy_accum,
     bint adjust_size,
     double coefficient,
+    int num_threads,
 ) noexcept nogil:
     cdef Py_ssize_t i, j, node_count = x.shape[0]
     cdef int tid
@@ -27,7 +320,7 @@ cdef void _apply_repulsion_parallel(
     cdef double factor
     cdef double mass_factor
 
-    for i in prange(node_count, schedule="guided", nogil=True):
+    for i in prange(node_count, schedule="guided", nogil=True, num_threads=num_threads):
         tid = threadid()
         for j in range(i):
             x_dist = x[i] - x[j]
@@ -54,61 +347,445 @@ cdef void _apply_repulsion_parallel(
             dy_accum[tid, j] -= y_dist * factor
 
 
-def apply_repulsion(nodes, adjustSize, coefficient):
-    cdef Py_ssize_t node_count = len(nodes)
+cdef void _reduce_accumulators(
+    Py_ssize_t node_count,
+    int thread_count,
+    double[:, ::1] dx_accum,
+    double[:, ::1] dy_accum,
+    double *dx,
+    double *dy,
+) noexcept nogil:
     cdef Py_ssize_t i
-    cdef int thread_count
-    cdef bint adjust_size = adjustSize
-    cdef double coeff = coefficient
-    cdef view.array x_buf
-    cdef view.array y_buf
-    cdef view.array mass_buf
-    cdef view.array size_buf
-    cdef view.array dx_accum_buf
-    cdef view.array dy_accum_buf
-    cdef double[:] x
-    cdef double[:] y
-    cdef double[:] mass
-    cdef double[:] size
-    cdef double[:, :] dx_accum
-    cdef double[:, :] dy_accum
-
-    if node_count < 2:
-        return
-
-    thread_count = openmp.omp_get_max_threads()
-
-    x_buf = view.array(shape=(node_count,), itemsize=sizeof(double), format="d")
-    y_buf = view.array(shape=(node_count,), itemsize=sizeof(double), format="d")
-    mass_buf = view.array(shape=(node_count,), itemsize=sizeof(double), format="d")
-    size_buf = view.array(shape=(node_count,), itemsize=sizeof(double), format="d")
-    dx_accum_buf = view.array(shape=(thread_count, node_count), itemsize=sizeof(double), format="d")
-    dy_accum_buf = view.array(shape=(thread_count, node_count), itemsize=sizeof(double), format="d")
-
-    x = x_buf
-    y = y_buf
-    mass = mass_buf
-    size = size_buf
-    dx_accum = dx_accum_buf
-    dy_accum = dy_accum_buf
+    cdef int j
 
-    for i in range(node_count):
-        x[i] = nodes[i].x
-        y[i] = nodes[i].y
-        mass[i] = nodes[i].mass
-        size[i] = nodes[i].size
+    for i in prange(node_count, schedule="static", nogil=True, num_threads=thread_count):
+        for j in range(thread_count):
+            dx[i] += dx_accum[j, i]
+            dy[i] += dy_accum[j, i]
+
+
+cdef void _apply_gravity(
+    Py_ssize_t node_count,
+    double *x,
+    double *y,
+    double *mass,
+    double *dx,
+    double *dy,
+    double gravity,
+    double coefficient,
+    bint use_strong_gravity,
+    int num_threads,
+) noexcept nogil:
+    cdef Py_ssize_t i
+    cdef double distance
+    cdef double factor
 
-    for i in range(thread_count):
-        for j in range(node_count):
-            dx_accum[i, j] = 0.0
-            dy_accum[i, j] = 0.0
+    for i in prange(node_count, schedule="static", nogil=True, num_threads=num_threads):
+        if use_strong_gravity:
+            if x[i] == 0 or y[i] == 0:
+                continue
+            factor = coefficient * mass[i] * gravity
+        else:
+            distance = csqrt(x[i] * x[i] + y[i] * y[i])
+            if distance == 0:
+                continue
+            factor = mass[i] * gravity / distance
+        dx[i] -= x[i] * factor
+        dy[i] -= y[i] * factor
 
-    with nogil:
-        _apply_repulsion_parallel(x, y, mass, size, dx_accum, dy_accum, adjust_size, coeff)
 
-    for i in range(node_count):
-        nodes[i].dx = 0.0
-        nodes[i].dy = 0.0
-        for j in range(thread_count):
-            nodes[i].dx += dx_accum[j, i]
-            nodes[i].dy += dy_accum[j, i]
+cdef inline void _node_attraction(
+    int i,
+    int *incident_first,
+    int *incident_edge,
+    int *edge_node1,
+    int *edge_node2,
+    double *edge_weight,
+    double *x,
+    double *y,
+    double *mass,
+    double *size,
+    bint distributed_attraction,
+    double coefficient,
+    double edge_weight_influence,
+    bint lin_log_mode,
+    double *dx,
+    double *dy,
+) noexcept nogil:
+    cdef int k, e, n1, n2
+    cdef double x_dist
+    cdef double y_dist
+    cdef double distance
+    cdef double weight
+    cdef double factor
+    cdef double fx = 0.0
+    cdef double fy = 0.0
+
+    for k in range(incident_first[i], incident_first[i + 1]):
+        e = incident_edge[k]
+        n1 = edge_node1[e]
+        n2 = edge_node2[e]
+        x_dist = x[n1] - x[n2]
+        y_dist = y[n1] - y[n2]
+        distance = csqrt(x_dist * x_dist + y_dist * y_dist) - size[n1] - size[n2]
+        if distance <= 0:
+            continue
+
+        if edge_weight_influence == 0:
+            weight = 1.0
+        elif edge_weight_influence == 1:
+            weight = edge_weight[e]
+        else:
+            weight = cpow(edge_weight[e], edge_weight_influence)
+
+        if distributed_attraction:
+            factor = -coefficient * weight / mass[n1]
+        else:
+            factor = -coefficient * weight
+        if lin_log_mode:
+            factor *= clog(1.0 + distance) / distance
+
+        if n1 == i:
+            fx += x_dist * factor
+            fy += y_dist * factor
+        else:
+            fx -= x_dist * factor
+            fy -= y_dist * factor
+
+    dx[0] += fx
+    dy[0] += fy
+
+
+cdef void _apply_attraction(
+    Py_ssize_t node_count,
+    int *incident_first,
+    int *incident_edge,
+    int *edge_node1,
+    int *edge_node2,
+    double *edge_weight,
+    double *x,
+    double *y,
+    double *mass,
+    double *size,
+    double *dx,
+    double *dy,
+    bint distributed_attraction,
+    double coefficient,
+    double edge_weight_influence,
+    bint lin_log_mode,
+    int num_threads,
+) noexcept nogil:
+    cdef Py_ssize_t i
+
+    # Every node gathers the pull of its own incident edges, so each edge
+    # is evaluated from both ends but no two threads write the same node.
+    for i in prange(node_count, schedule="guided", nogil=True, num_threads=num_threads):
+        _node_attraction(i, incident_first, incident_edge, edge_node1, edge_node2, edge_weight,
+                         x, y, mass, size, distributed_attraction, coefficient, edge_weight_influence,
+                         lin_log_mode, &dx[i], &dy[i])
+
+
+cdef void _measure_swinging(
+    Py_ssize_t node_count,
+    double *mass,
+    double *dx,
+    double *dy,
+    double *old_dx,
+    double *old_dy,
+    double *total_swinging,
+    double *total_effective_traction,
+    int num_threads,
+) noexcept nogil:
+    cdef Py_ssize_t i
+    cdef double swinging = 0.0
+    cdef double traction = 0.0
+
+    for i in prange(node_count, schedule="static", nogil=True, num_threads=num_threads):
+        swinging += mass[i] * csqrt((old_dx[i] - dx[i]) * (old_dx[i] - dx[i]) +
+                                    (old_dy[i] - dy[i]) * (old_dy[i] - dy[i]))
+        traction += .5 * mass[i] * csqrt((old_dx[i] + dx[i]) * (old_dx[i] + dx[i]) +
+                                         (old_dy[i] + dy[i]) * (old_dy[i] + dy[i]))
+
+    total_swinging[0] = swinging
+    total_effective_traction[0] = traction
+
+
+cdef void _apply_forces(
+    Py_ssize_t node_count,
+    double *x,
+    double *y,
+    double *mass,
+    double *dx,
+    double *dy,
+    double *old_dx,
+    double *old_dy,
+    char *fixed,
+    double speed,
+    double *sums,
+    int num_threads,
+) noexcept nogil:
+    cdef Py_ssize_t i
+    cdef double swinging
+    cdef double factor
+    cdef double df
+    cdef double displacement = 0.0
+    cdef Py_ssize_t movable_count = 0
+    cdef double sum_x = 0.0
+    cdef double sum_y = 0.0
+    cdef double sum_r2 = 0.0
+
+    for i in prange(node_count, schedule="static", nogil=True, num_threads=num_threads):
+        swinging = mass[i] * csqrt((old_dx[i] - dx[i]) * (old_dx[i] - dx[i]) +
+                                   (old_dy[i] - dy[i]) * (old_dy[i] - dy[i]))
+        factor = 0.1 * speed / (1.0 + csqrt(speed * swinging))
+        df = csqrt(dx[i] * dx[i] + dy[i] * dy[i])
+        if not fixed[i]:
+            movable_count += 1
+        if df > 0 and not fixed[i]:
+            factor = min(factor * df, 10.0) / df
+            x[i] += dx[i] * factor
+            y[i] += dy[i] * factor
+            displacement += df * factor
+        sum_x += x[i]
+        sum_y += y[i]
+        sum_r2 += x[i] * x[i] + y[i] * y[i]
+
+    sums[0] = displacement
+    sums[1] = sum_x
+    sums[2] = sum_y
+    sums[3] = sum_r2
+    sums[4] = movable_count
+
+
+cdef double[::1] _new_array(Py_ssize_t length):
+    # view.array refuses zero-length shapes, so always keep one spare slot.
+    cdef double[::1] values = view.array(shape=(max(length, 1),), itemsize=sizeof(double), format="d")
+    values[:] = 0.0
+    return values
+
+
+cdef class Layout:
+    """Array-backed layout state for a whole ForceAtlas2 run.
+
+    Node and edge attributes are copied into contiguous arrays once, and
+    every step works on those arrays in place.  `Node` and `Edge` objects
+    are only touched by `from_nodes` and `update_nodes`.
+    """
+
+    cdef readonly Py_ssize_t node_count
+    cdef readonly Py_ssize_t edge_count
+    # Number of threads every kernel runs on
+    cdef readonly int threads
+    # Seconds spent building Barnes-Hut trees
+    cdef readonly double quadtree_time
+    cdef double[::1] x
+    cdef double[::1] y
+    cdef double[::1] dx
+    cdef double[::1] dy
+    cdef double[::1] old_dx
+    cdef double[::1] old_dy
+    cdef double[::1] mass
+    cdef double[::1] size
+    cdef char[::1] fixed
+    cdef int[::1] edge_node1
+    cdef int[::1] edge_node2
+    cdef double[::1] edge_weight
+    # Edges incident to node i are incident_edge[incident_first[i]:incident_first[i + 1]]
+    cdef int[::1] incident_first
+    cdef int[::1] incident_edge
+
+    # Scratch space, allocated on first use and kept for the whole run.
+    cdef int accum_threads
+    cdef double[:, ::1] dx_accum
+    cdef double[:, ::1] dy_accum
+    cdef Quadtree tree
+
+    def __cinit__(self):
+        memset(&self.tree, 0, sizeof(Quadtree))
+
+    def __dealloc__(self):
+        _quadtree_free(&self.tree)
+
+    def __init__(self, x, y, mass, size, edge_node1, edge_node2, edge_weight, fixed=None, int threads=0):
+        cdef Py_ssize_t i
+
+        # 0 leaves the choice to OpenMP, which honours OMP_NUM_THREADS.
+        self.threads = threads if threads > 0 else openmp.omp_get_max_threads()
+        self.node_count = len(x)
+        self.edge_count = len(edge_node1)
+
+        self.x = _new_array(self.node_count)
+        self.y = _new_array(self.node_count)
+        self.dx = _new_array(self.node_count)
+        self.dy = _new_array(self.node_count)
+        self.old_dx = _new_array(self.node_count)
+        self.old_dy = _new_array(self.node_count)
+        self.mass = _new_array(self.node_count)
+        self.size = _new_array(self.node_count)
+        self.fixed = view.array(shape=(max(self.node_count, 1),), itemsize=sizeof(char), format="c")
+        for i in range(self.node_count):
+            self.x[i] = x[i]
+            self.y[i] = y[i]
+            self.mass[i] = mass[i]
+            self.size[i] = size[i]
+            self.fixed[i] = fixed is not None and fixed[i]
+
+        self.edge_node1 = view.array(shape=(max(self.edge_count, 1),), itemsize=sizeof(int), format="i")
+        self.edge_node2 = view.array(shape=(max(self.edge_count, 1),), itemsize=sizeof(int), format="i")
+        self.edge_weight = _new_array(self.edge_count)
+        for i in range(self.edge_count):
+            self.edge_node1[i] = edge_node1[i]
+            self.edge_node2[i] = edge_node2[i]
+            self.edge_weight[i] = edge_weight[i]
+        self._build_incidence()
+
+        self.accum_threads = 0
+        self.quadtree_time = 0.0
+
+    @classmethod
+    def from_nodes(cls, nodes, edges):
+        """Create a layout from lists of Node and Edge objects"""
+        cdef Py_ssize_t i
+        cdef Layout layout = cls([n.x for n in nodes], [n.y for n in nodes],
+                                 [n.mass for n in nodes], [n.size for n in nodes],
+                                 [e.node1 for e in edges], [e.node2 for e in edges], [e.weight for e in edges],
+                                 [n.fixed for n in nodes])
+
+        for i in range(layout.node_count):
+            n = nodes[i]
+            layout.dx[i] = n.dx
+            layout.dy[i] = n.dy
+            layout.old_dx[i] = n.old_dx
+            layout.old_dy[i] = n.old_dy
+
+        return layout
+
+    cdef _build_incidence(self):
+        cdef Py_ssize_t i
+        cdef int n1, n2
+        cdef int[::1] fill
+
+        self.incident_first = view.array(shape=(self.node_count + 1,), itemsize=sizeof(int), format="i")
+        self.incident_edge = view.array(shape=(max(2 * self.edge_count, 1),), itemsize=sizeof(int), format="i")
+        fill = view.array(shape=(self.node_count + 1,), itemsize=sizeof(int), format="i")
+
+        self.incident_first[:] = 0
+        for i in range(self.edge_count):
+            self.incident_first[self.edge_node1[i] + 1] += 1
+            self.incident_first[self.edge_node2[i] + 1] += 1
+        for i in range(self.node_count):
+            self.incident_first[i + 1] += self.incident_first[i]
+
+        fill[:] = self.incident_first
+        for i in range(self.edge_count):
+            n1 = self.edge_node1[i]
+            n2 = self.edge_node2[i]
+            self.incident_edge[fill[n1]] = i
+            fill[n1] += 1
+            self.incident_edge[fill[n2]] = i
+            fill[n2] += 1
+
+    def update_nodes(self, nodes):
+        """Copy positions and forces back into `nodes`"""
+        cdef Py_ssize_t i
+
+        for i in range(self.node_count):
+            n = nodes[i]
+            n.x = self.x[i]
+            n.y = self.y[i]
+            n.dx = self.dx[i]
+            n.dy = self.dy[i]
+            n.old_dx = self.old_dx[i]
+            n.old_dy = self.old_dy[i]
+
+    def positions(self):
+        cdef Py_ssize_t i
+        return [(self.x[i], self.y[i]) for i in range(self.node_count)]
+
+    def reset_forces(self):
+        self.old_dx[:] = self.dx
+        self.old_dy[:] = self.dy
+        self.dx[:] = 0.0
+        self.dy[:] = 0.0
+
+    def apply_repulsion(self, bint adjustSize, double coefficient):
+        if self.node_count < 2:
+            return
+
+        if self.accum_threads != self.threads:
+            self.dx_accum = view.array(shape=(self.threads, self.node_count), itemsize=sizeof(double), format="d")
+            self.dy_accum = view.array(shape=(self.threads, self.node_count), itemsize=sizeof(double), format="d")
+            self.accum_threads = self.threads
+
+        self.dx_accum[:, :] = 0.0
+        self.dy_accum[:, :] = 0.0
+        with nogil:
+            _apply_repulsion_parallel(self.x, self.y, self.mass, self.size, self.dx_accum, self.dy_accum,
+                                      adjustSize, coefficient, self.threads)
+            _reduce_accumulators(self.node_count, self.threads, self.dx_accum, self.dy_accum,
+                                 &self.dx[0], &self.dy[0])
+
+    def apply_repulsion_barneshut(self, bint adjustSize, double coefficient, double theta):
+        cdef int status
+        cdef double start
+
+        if self.node_count < 2:
+            return
+
+        start = time.perf_counter()
+        with nogil:
+            status = _quadtree_build(&self.tree, self.node_count, &self.x[0], &self.y[0], &self.mass[0])
+        self.quadtree_time += time.perf_counter() - start
+        if status < 0:
+            raise MemoryError()
+
+        with nogil:
+            _apply_repulsion_barneshut_parallel(&self.tree, self.node_count, &self.x[0], &self.y[0],
+                                                &self.mass[0], &self.size[0], &self.dx[0], &self.dy[0],
+                                                adjustSize, coefficient, theta, self.threads)
+
+    def apply_gravity(self, double gravity, double scalingRatio, bint useStrongGravity=False):
+        with nogil:
+            _apply_gravity(self.node_count, &self.x[0], &self.y[0], &self.mass[0], &self.dx[0], &self.dy[0],
+                           gravity, scalingRatio, useStrongGravity, self.threads)
+
+    def apply_attraction(self, bint distributedAttraction, double coefficient, double edgeWeightInfluence,
+                         bint linLogMode=False):
+        with nogil:
+            _apply_attraction(self.node_count, &self.incident_first[0], &self.incident_edge[0],
+                              &self.edge_node1[0], &self.edge_node2[0], &self.edge_weight[0],
+                              &self.x[0], &self.y[0], &self.mass[0], &self.size[0], &self.dx[0], &self.dy[0],
+                              distributedAttraction, coefficient, edgeWeightInfluence, linLogMode, self.threads)
+
+    def adjustSpeedAndApplyForces(self, double speed, double speedEfficiency, double jitterTolerance):
+        cdef double totalSwinging
+        cdef double totalEffectiveTraction
+        cdef double sums[5]
+
+        with nogil:
+            _measure_swinging(self.node_count, &self.mass[0], &self.dx[0], &self.dy[0],
+                              &self.old_dx[0], &self.old_dy[0], &totalSwinging, &totalEffectiveTraction,
+                              self.threads)
+
+        speed, speedEfficiency = adjustSpeed(self.node_count, totalSwinging, totalEffectiveTraction,
+                                             speed, speedEfficiency, jitterTolerance)
+
+        with nogil:
+            _apply_forces(self.node_count, &self.x[0], &self.y[0], &self.mass[0], &self.dx[0], &self.dy[0],
+                          &self.old_dx[0], &self.old_dy[0], &self.fixed[0], speed, sums, self.threads)
+
+        return speedValues(self.node_count, speed, speedEfficiency, totalSwinging, totalEffectiveTraction,
+                           sums[0], <Py_ssize_t> sums[4], sums[1], sums[2], sums[3])
+
+
+# The Node based entry points of the Python module, backed by Layout.
+def apply_repulsion(nodes, adjustSize, coefficient):
+    layout = Layout.from_nodes(nodes, [])
+    layout.apply_repulsion(adjustSize, coefficient)
+    layout.update_nodes(nodes)
+
+
+def apply_repulsion_barneshut(nodes, adjustSize, coefficient, theta):
+    layout = Layout.from_nodes(nodes, [])
+    layout.apply_repulsion_barneshut(adjustSize, coefficient, theta)
+    layout.update_nodes(nodes)
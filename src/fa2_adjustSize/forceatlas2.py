@@ -18,51 +18,725 @@
 #
 # Available under the GPLv3
 
+import collections
+import copy
+import csv
+import functools
+import importlib.util
+import json
+import math
+import os
 import random
+import threading
 import time
-from gi.repository import GLib
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 
 from . import fa2util
 from ..utils import normalized_size
 
+try:
+    import numpy as np
+    from . import fa2numpy
+except ImportError:
+    np = fa2numpy = None
+
+
+# The numpy backend has no Barnes-Hut approximation, so with
+# barnesHutOptimize its exact repulsion is only faster than the quadtree
+# of the python backend up to about this many nodes.
+NUMPY_BARNESHUT_MAX_NODES = 4000
+
+
+def available_backends():
+    """Return the names of the usable layout backends, fastest first"""
+    backends = []
+    if hasattr(fa2util, 'Layout'):
+        backends.append('cython')
+    if fa2numpy is not None:
+        backends.append('numpy')
+    backends.append('python')
+    return backends
+
+
+@functools.cache
+def python_kernels():
+    """Return the uncompiled fa2util module, which the python backend runs.
+
+    Importing fa2util picks the Cython extension when one is built, and
+    the extension compiles the Node based code of fa2util.py as well, so
+    the source file is loaded as a module of its own then.
+    """
+    if not hasattr(fa2util, 'Layout'):
+        return fa2util
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fa2util.py')
+    spec = importlib.util.spec_from_file_location(__package__ + '.fa2util_python', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def default_backend(node_count, barnesHutOptimize=True):
+    """Return the fastest available backend for a graph of `node_count` nodes"""
+    backends = available_backends()
+    if barnesHutOptimize and node_count > NUMPY_BARNESHUT_MAX_NODES and 'numpy' in backends:
+        backends.remove('numpy')
+    return backends[0]
+
+
+def available_initial_layouts():
+    """Return the names of the usable initial placements"""
+    layouts = ['random', 'radial']
+    if np is not None:
+        layouts.append('pivot-mds')
+    return layouts
+
+
+# Multilevel mode stops coarsening once a pass removes less than this
+# share of the nodes.
+MULTILEVEL_MIN_REDUCTION = 0.9
+# Starting speed of the refinement of each finer level, which begins from
+# a layout that is already roughly right.
+REFINE_SPEED = 0.1
+# Number of pivots of the pivot MDS initial placement
+PIVOTS = 50
+# Space left between the leaves of a star component, and between the
+# packed components of a component layout
+STAR_GAP = 2.0
+COMPONENT_GAP = 10.0
+
+
 class Timer:
     def __init__(self, name="Timer"):
         self.name = name
         self.start_time = 0.0
         self.total_time = 0.0
+        self.last_time = 0.0  # Duration of the latest start()/stop() pair
 
     def start(self):
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
 
     def stop(self):
-        self.total_time += (time.time() - self.start_time)
+        self.last_time = time.perf_counter() - self.start_time
+        self.total_time += self.last_time
 
     def display(self):
         print(self.name, " took ", "%.2f" % self.total_time, " seconds")
 
 
+def seed_positions(G, pos, rng=random):
+    """Complete a partial layout of G for warm starting.
+
+    Nodes missing from `pos` are placed at the barycentre of their placed
+    neighbours (in either direction), spreading outwards from the placed
+    part of the graph.  Nodes with no placed node in reach go to a random
+    spot within the RMS radius of the existing layout, drawn from `rng`.
+    """
+    seeded = {node: pos[node] for node in G.nodes() if node in pos}
+    pending = [node for node in G.nodes() if node not in seeded]
+
+    while pending:
+        placed = {}
+        for node in pending:
+            neighbors = [seeded[m] for m in _all_neighbors(G, node) if m in seeded]
+            if neighbors:
+                placed[node] = (sum(p[0] for p in neighbors) / len(neighbors),
+                                sum(p[1] for p in neighbors) / len(neighbors))
+        if not placed:
+            break
+        seeded.update(placed)
+        pending = [node for node in pending if node not in placed]
+
+    if pending:
+        if seeded:
+            cx = sum(p[0] for p in seeded.values()) / len(seeded)
+            cy = sum(p[1] for p in seeded.values()) / len(seeded)
+            radius = (sum((p[0] - cx) ** 2 + (p[1] - cy) ** 2 for p in seeded.values()) / len(seeded)) ** 0.5
+        else:
+            cx = cy = 0.0
+            radius = 1.0
+        for node in pending:
+            angle = rng.uniform(0, 2 * math.pi)
+            distance = radius * math.sqrt(rng.random())
+            seeded[node] = (cx + distance * math.cos(angle), cy + distance * math.sin(angle))
+
+    return seeded
+
+
+def _all_neighbors(G, node):
+    """Neighbours of `node` in G, following edges in both directions"""
+    if G.is_directed():
+        yield from G.predecessors(node)
+    yield from G.neighbors(node)
+
+
+def adjacency_to_edges(adjacency):
+    """Turn an adjacency matrix into the undirected edge list of the layout.
+
+    `adjacency` is a scipy sparse matrix, a dense 2D array, or a CSR tuple
+    (indptr, indices[, data]).  Entries in both directions and self-loops
+    collapse into at most one edge per node pair, kept in the direction
+    first seen.  Returns (edge_node1, edge_node2, edge_weight, degree), where
+    degree is the number of entries in each row, i.e. the out-degree.
+    """
+    if hasattr(adjacency, 'tocsr'):
+        csr = adjacency.tocsr()
+        indptr, indices, data = csr.indptr, csr.indices, csr.data
+    elif isinstance(adjacency, tuple):
+        indptr, indices = adjacency[0], adjacency[1]
+        data = adjacency[2] if len(adjacency) > 2 else None
+    else:
+        indptr = [0]
+        indices = []
+        data = []
+        for row in adjacency:
+            for j, weight in enumerate(row):
+                if weight:
+                    indices.append(j)
+                    data.append(weight)
+            indptr.append(len(indices))
+
+    node_count = len(indptr) - 1
+    edge_node1 = []
+    edge_node2 = []
+    edge_weight = []
+    degree = [0] * node_count
+    seen_edges = set()
+
+    for i in range(node_count):
+        degree[i] = indptr[i + 1] - indptr[i]
+        for k in range(indptr[i], indptr[i + 1]):
+            j = int(indices[k])
+            if j == i:
+                continue
+
+            edge_key = (i, j) if i < j else (j, i)
+            if edge_key in seen_edges:
+                continue
+            seen_edges.add(edge_key)
+
+            edge_node1.append(i)
+            edge_node2.append(j)
+            edge_weight.append(1.0 if data is None else float(data[k]))
+
+    return edge_node1, edge_node2, edge_weight, degree
+
+
+def networkx_to_adjacency(G):
+    """Read a NetworkX graph into what forceatlas2() takes.
+
+    Returns (node_list, adjacency, size): the nodes in row order, the
+    adjacency as a CSR tuple with the 'weight' edge attributes, and the
+    node sizes taken from the 'size' attribute, derived from the 'weight'
+    attribute, or None.
+    """
+    node_list = list(G.nodes())
+    index = {node: i for i, node in enumerate(node_list)}
+
+    # A graph is just an adjacency list, hand it over as CSR.
+    indptr = [0]
+    indices = []
+    data = []
+    for node in node_list:
+        for neighbor, attrs in G.adj[node].items():
+            indices.append(index[neighbor])
+            data.append(attrs.get('weight', 1.0) if isinstance(attrs, dict) else 1.0)
+        indptr.append(len(indices))
+
+    size = []
+    for node in node_list:
+        attrs = G.nodes[node]
+        if 'size' in attrs:
+            size.append(attrs['size'])
+        elif 'weight' in attrs:
+            size.append(normalized_size(attrs['weight']))
+        else:
+            size.append(None)
+
+    return node_list, (indptr, indices, data), size
+
+
+def _project_positions(positions, parent, coarse_size, rng):
+    """Place every node on its coarse node, scattered over the coarse disk"""
+    projected = []
+    for u in range(len(parent)):
+        x, y = positions[parent[u]]
+        angle = rng.uniform(0, 2 * math.pi)
+        distance = coarse_size[parent[u]] * math.sqrt(rng.random())
+        projected.append((x + distance * math.cos(angle), y + distance * math.sin(angle)))
+    return projected
+
+
+def coarsen(node_count, edge_node1, edge_node2, edge_weight, mass, size, rng=random):
+    """Collapse a graph into a smaller one for the multilevel layout.
+
+    Leaves are merged into their only neighbour first, which is what
+    shrinks dependency graphs the most since most libraries have a single
+    dependent.  The remaining nodes, in an order shuffled by `rng`, are
+    matched along their heaviest edge, normalized by the masses so that
+    hubs do not swallow everything, and isolated nodes are paired with
+    each other.  A coarse node carries the summed mass of its members and
+    the size of a disk of their combined area, parallel edges are summed
+    into one and edges inside a coarse node are dropped.
+
+    Returns (parent, coarse) where parent maps every node to its coarse
+    node and coarse is (node_count, edge_node1, edge_node2, edge_weight,
+    mass, size) for the coarse graph.
+    """
+    neighbors = [[] for _ in range(node_count)]
+    for a, b, w in zip(edge_node1, edge_node2, edge_weight):
+        neighbors[a].append((b, w))
+        neighbors[b].append((a, w))
+
+    parent = [-1] * node_count
+    coarse_count = 0
+
+    for u in range(node_count):
+        if len(neighbors[u]) != 1 or parent[u] != -1:
+            continue
+        v = neighbors[u][0][0]
+        if parent[v] == -1:
+            parent[v] = coarse_count
+            coarse_count += 1
+        parent[u] = parent[v]
+
+    order = list(range(node_count))
+    rng.shuffle(order)
+    isolated = -1
+    for u in order:
+        if parent[u] != -1:
+            continue
+        if not neighbors[u]:
+            if isolated == -1:
+                isolated = u
+                continue
+            parent[u] = parent[isolated] = coarse_count
+            coarse_count += 1
+            isolated = -1
+            continue
+
+        match = -1
+        best = 0.0
+        for v, w in neighbors[u]:
+            if parent[v] == -1 and v != u:
+                score = w / (mass[u] * mass[v])
+                if score > best:
+                    match, best = v, score
+        parent[u] = coarse_count
+        if match != -1:
+            parent[match] = coarse_count
+        coarse_count += 1
+    if isolated != -1:
+        parent[isolated] = coarse_count
+        coarse_count += 1
+
+    coarse_mass = [0.0] * coarse_count
+    coarse_area = [0.0] * coarse_count
+    for u in range(node_count):
+        coarse_mass[parent[u]] += mass[u]
+        coarse_area[parent[u]] += size[u] * size[u]
+
+    coarse_edges = {}
+    for a, b, w in zip(edge_node1, edge_node2, edge_weight):
+        pa, pb = parent[a], parent[b]
+        if pa == pb:
+            continue
+        edge_key = (pa, pb) if pa < pb else (pb, pa)
+        coarse_edges[edge_key] = coarse_edges.get(edge_key, 0.0) + w
+
+    coarse = (coarse_count,
+              [k[0] for k in coarse_edges], [k[1] for k in coarse_edges], list(coarse_edges.values()),
+              coarse_mass, [math.sqrt(area) for area in coarse_area])
+    return parent, coarse
+
+
+def _neighbor_lists(node_count, edge_node1, edge_node2):
+    neighbors = [[] for _ in range(node_count)]
+    for a, b in zip(edge_node1, edge_node2):
+        neighbors[a].append(b)
+        neighbors[b].append(a)
+    return neighbors
+
+
+def _bfs(neighbors, sources, depth, parent=None):
+    """Breadth-first search filling in `depth`, -1 marks unreached nodes.
+
+    Returns the reached nodes in visiting order.
+    """
+    order = []
+    for s in sources:
+        if depth[s] == -1:
+            depth[s] = 0
+            order.append(s)
+    head = 0
+    while head < len(order):
+        u = order[head]
+        head += 1
+        for v in neighbors[u]:
+            if depth[v] == -1:
+                depth[v] = depth[u] + 1
+                if parent is not None:
+                    parent[v] = u
+                order.append(v)
+    return order
+
+
+def radial_positions(node_count, edge_node1, edge_node2, roots=None):
+    """Place the nodes on rings around the roots of a breadth-first search.
+
+    Every connected component is searched from the roots it contains, or
+    from its best connected node if it has none.  The search trees hang
+    off a common centre, each subtree gets a wedge in proportion to its
+    node count, and a node sits in the middle of its wedge on the ring of
+    its depth.  Ring radii grow with the square root of the number of
+    nodes inside them, so the density stays even.
+    """
+    neighbors = _neighbor_lists(node_count, edge_node1, edge_node2)
+    depth = [-1] * node_count
+    parent = [-1] * node_count
+    order = _bfs(neighbors, [u for u in range(node_count) if roots is not None and roots[u]], depth, parent)
+    for u in sorted(range(node_count), key=lambda u: -len(neighbors[u])):
+        if depth[u] == -1:
+            order.extend(_bfs(neighbors, [u], depth, parent))
+
+    weight = [1] * node_count
+    for u in reversed(order):
+        if parent[u] != -1:
+            weight[parent[u]] += weight[u]
+    children = [[] for _ in range(node_count)]
+    for u in order:
+        if parent[u] != -1:
+            children[parent[u]].append(u)
+
+    ring_count = [0] * (max(depth) + 1)
+    for d in depth:
+        ring_count[d] += 1
+    radius = []
+    inside = 0
+    for count in ring_count:
+        radius.append(math.sqrt(inside + count / 2))
+        inside += count
+
+    # Wedge start and width of every node, roots share the full circle.
+    start = [0.0] * node_count
+    width = [0.0] * node_count
+    offset = 0.0
+    for u in order:
+        if parent[u] == -1:
+            start[u] = offset
+            width[u] = 2 * math.pi * weight[u] / node_count
+            offset += width[u]
+    positions = [None] * node_count
+    for u in order:
+        offset = start[u]
+        for v in children[u]:
+            start[v] = offset
+            width[v] = width[u] * weight[v] / (weight[u] - 1)
+            offset += width[v]
+        angle = start[u] + width[u] / 2
+        positions[u] = (radius[depth[u]] * math.cos(angle), radius[depth[u]] * math.sin(angle))
+    return positions
+
+
+def pivot_mds_positions(node_count, edge_node1, edge_node2, pivots=PIVOTS):
+    """Approximate the graph distances in the plane with pivot MDS.
+
+    Breadth-first distances from a few pivots, each one the node farthest
+    from the pivots before it, are turned into coordinates by classical
+    multidimensional scaling (Brandes and Pich, 2006).  Nodes out of reach
+    of a pivot count as one step farther than its farthest node.  Needs
+    NumPy.
+    """
+    if node_count < 3:
+        # Scaling needs two dimensions, a line does just as well here.
+        return [(float(u), 0.0) for u in range(node_count)]
+
+    neighbors = _neighbor_lists(node_count, edge_node1, edge_node2)
+    pivots = min(pivots, node_count)
+    distances = np.empty((pivots, node_count))
+    nearest = np.full(node_count, np.inf)
+    pivot = max(range(node_count), key=lambda u: len(neighbors[u]))
+    for i in range(pivots):
+        depth = [-1] * node_count
+        _bfs(neighbors, [pivot], depth)
+        row = np.array(depth, dtype=float)
+        row[row < 0] = row.max() + 1
+        distances[i] = row
+        nearest = np.minimum(nearest, row)
+        pivot = int(np.argmax(nearest))
+
+    squared = distances.T ** 2
+    centered = (squared - squared.mean(axis=0) - squared.mean(axis=1)[:, np.newaxis] + squared.mean()) * -0.5
+    _, vectors = np.linalg.eigh(centered.T @ centered)
+    coordinates = centered @ vectors[:, -2:]
+    return [(float(x), float(y)) for x, y in coordinates]
+
+
+def connected_components(node_count, edge_node1, edge_node2):
+    """Return the connected components as lists of nodes, largest first"""
+    neighbors = _neighbor_lists(node_count, edge_node1, edge_node2)
+    depth = [-1] * node_count
+    components = []
+    for u in range(node_count):
+        if depth[u] == -1:
+            components.append(_bfs(neighbors, [u], depth))
+    components.sort(key=len, reverse=True)
+    return components
+
+
+def star_positions(members, neighbors, size):
+    """Lay out a component whose edges all share one node in closed form.
+
+    The shared node goes in the middle and the others evenly around it,
+    as close as their sizes allow.  Returns the positions of `members`,
+    or None if the component is not a star.
+    """
+    hub = max(members, key=lambda u: len(neighbors[u]))
+    leaves = [u for u in members if u != hub]
+    if any(len(neighbors[u]) != 1 for u in leaves):
+        return None
+    if not leaves:
+        return [(0.0, 0.0)]
+
+    radius = max(size[hub] + max(size[u] for u in leaves) + STAR_GAP,
+                 sum(2 * size[u] + STAR_GAP for u in leaves) / (2 * math.pi))
+    positions = {hub: (0.0, 0.0)}
+    for k, u in enumerate(leaves):
+        angle = 2 * math.pi * k / len(leaves)
+        positions[u] = (radius * math.cos(angle), radius * math.sin(angle))
+    return [positions[u] for u in members]
+
+
+def pack_disks(radii, gap):
+    """Pack disks around the largest one, which stays at the origin.
+
+    The other disks go on rings around it, largest first, each ring as
+    wide as its first disk.  Returns the centre of every disk.
+    """
+    order = sorted(range(len(radii)), key=lambda i: -radii[i])
+    centers = [None] * len(radii)
+    centers[order[0]] = (0.0, 0.0)
+    ringInner = radii[order[0]] + gap
+    ringRadius = ringWidth = angle = 0.0
+    for i in order[1:]:
+        width = 2 * math.asin(min(1.0, (radii[i] + gap / 2) / ringRadius)) if ringRadius else 0.0
+        if not ringRadius or angle + width > 2 * math.pi:
+            if ringRadius:
+                ringInner = ringRadius + ringWidth / 2 + gap
+            ringWidth = 2 * radii[i]
+            ringRadius = ringInner + radii[i]
+            angle = 0.0
+            width = 2 * math.asin(min(1.0, (radii[i] + gap / 2) / ringRadius))
+        centers[i] = (ringRadius * math.cos(angle + width / 2), ringRadius * math.sin(angle + width / 2))
+        angle += width
+    return centers
+
+
+def _centered(positions):
+    cx = sum(p[0] for p in positions) / len(positions)
+    cy = sum(p[1] for p in positions) / len(positions)
+    return [(x - cx, y - cy) for x, y in positions]
+
+
+def _fit_positions(positions, mass, rng):
+    """Scale a structured layout to the size ForceAtlas2 settles at.
+
+    The RMS radius of a finished layout is close to the square root of the
+    total mass.  Every node is also nudged by a small random offset, as
+    nodes on the same spot never push each other apart.
+    """
+    count = len(positions)
+    cx = sum(p[0] for p in positions) / count
+    cy = sum(p[1] for p in positions) / count
+    radius = math.sqrt(sum((p[0] - cx) ** 2 + (p[1] - cy) ** 2 for p in positions) / count)
+    scale = math.sqrt(sum(mass)) / radius if radius > 0 else 1.0
+    return [((x - cx) * scale + rng.uniform(-1, 1), (y - cy) * scale + rng.uniform(-1, 1)) for x, y in positions]
+
+
+# Phases of an iteration, as timed in LayoutProgress.phaseTimes and
+# LayoutStats.  'quadtree' is the Barnes-Hut tree build, which is part of
+# the repulsion.
+PHASES = ('repulsion', 'gravity', 'attraction', 'speed')
+SUBPHASES = ('quadtree',)
+
+
+class LayoutStats:
+    """Where the time of one forceatlas2() run went.
+
+    phaseTimes holds the cumulative seconds per phase and iterationTimes
+    one row per iteration: the level followed by the seconds spent in
+    each of PHASES + SUBPHASES.  iterations and refineIterations are the
+    iterationsRun and refineIterationsRun of the layout, so iterationTimes
+    has as many rows as the two added up.  setupTime covers reading the
+    graph and coarsening it, totalTime the whole call.  A component layout adds up
+    the phase times of all its components, which may have run in parallel.
+    """
+
+    def __init__(self, backend, threads, nodeCount, edgeCount):
+        self.backend = backend
+        self.threads = threads
+        self.nodeCount = nodeCount
+        self.edgeCount = edgeCount
+        self.levels = 1
+        self.iterations = 0
+        self.refineIterations = 0
+        self.stopReason = None
+        self.setupTime = 0.0
+        self.totalTime = 0.0
+        self.phaseTimes = dict.fromkeys(PHASES + SUBPHASES, 0.0)
+        self.iterationTimes = []
+
+    def as_dict(self):
+        return {
+            'backend': self.backend,
+            'threads': self.threads,
+            'nodeCount': self.nodeCount,
+            'edgeCount': self.edgeCount,
+            'levels': self.levels,
+            'iterations': self.iterations,
+            'refineIterations': self.refineIterations,
+            'stopReason': self.stopReason,
+            'setupTime': self.setupTime,
+            'totalTime': self.totalTime,
+            'phaseTimes': dict(self.phaseTimes),
+        }
+
+    def write(self, path):
+        """Write the summary as JSON, or the per-iteration rows if `path` ends in .csv"""
+        with open(path, 'w', newline='') as f:
+            if path.endswith('.csv'):
+                writer = csv.writer(f)
+                writer.writerow(('iteration', 'level') + PHASES + SUBPHASES)
+                for i, row in enumerate(self.iterationTimes):
+                    writer.writerow((i + 1,) + tuple(row))
+            else:
+                json.dump(self.as_dict(), f, indent=2)
+
+    def display(self):
+        print(f"ForceAtlas2 ({self.backend}, {self.threads} threads): {self.nodeCount} nodes, "
+              f"{self.edgeCount} edges, {self.levels} levels, {self.iterations} iterations "
+              f"and {self.refineIterations} refining, {self.stopReason}")
+        print(f"  setup took {self.setupTime:.2f} seconds, total {self.totalTime:.2f} seconds")
+        for phase, seconds in self.phaseTimes.items():
+            print(f"  {phase} took {seconds:.2f} seconds")
+
+
+class LayoutProgress:
+    """State of a running layout, as handed to the progress callback.
+
+    iteration counts the iterations done so far over all levels, out of at
+    most totalIterations.  elapsed and eta are in seconds; eta assumes the
+    cost of an iteration is proportional to the number of nodes it moves
+    and that the layout does not converge early, so it is an upper bound.
+    phaseTimes holds the seconds spent in each of PHASES + SUBPHASES so
+    far.  convergence is
+    the last displacement relative to the layout radius, the quantity
+    averaged and compared against convergenceThreshold, or None before
+    the first iteration.  level counts down to 0, the full graph, in multilevel mode.
+    """
+
+    def __init__(self, iteration, totalIterations, elapsed, eta, phaseTimes, convergence, level):
+        self.iteration = iteration
+        self.totalIterations = totalIterations
+        self.elapsed = elapsed
+        self.eta = eta
+        self.phaseTimes = phaseTimes
+        self.convergence = convergence
+        self.level = level
+
+    @property
+    def fraction(self):
+        return self.iteration / self.totalIterations if self.totalIterations else 1.0
+
+
+class _Throttle:
+    """Lets an event through once `iterations` iterations or `interval`
+    seconds have passed since the previous one.  0 lets every iteration
+    through; None or a negative value disables that limit."""
+
+    def __init__(self, iterations, interval):
+        self.iterations = iterations
+        self.interval = interval
+        self.lastIteration = 0
+        self.lastTime = time.monotonic()
+
+    def due(self, iteration):
+        if self.iterations is not None and self.iterations >= 0 \
+                and iteration - self.lastIteration >= self.iterations:
+            return True
+        return self.interval is not None and self.interval >= 0 \
+            and time.monotonic() - self.lastTime >= self.interval
+
+    def mark(self, iteration):
+        self.lastIteration = iteration
+        self.lastTime = time.monotonic()
+
+
+class _Snapshots(_Throttle):
+    """Throttles the position snapshots handed out during a layout.
+
+    While a coarse level of a multilevel layout runs, every node is
+    reported at the position of the coarse node it belongs to.
+    """
+
+    def __init__(self, callback, iterations, interval):
+        super().__init__(iterations, interval)
+        self.callback = callback
+        self.ancestor = None
+
+    def set_level(self, parents):
+        """Use the chain of parent maps from the full graph to the current level"""
+        self.ancestor = None
+        for parent in parents:
+            if self.ancestor is None:
+                self.ancestor = list(parent)
+            else:
+                self.ancestor = [parent[a] for a in self.ancestor]
+
+    def publish(self, iteration, layout):
+        positions = layout.positions()
+        if self.ancestor is not None:
+            positions = [positions[a] for a in self.ancestor]
+        self.mark(iteration)
+        self.callback(positions)
+
+
 class ForceAtlas2:
     def __init__(self,
                  # Behavior alternatives
                  outboundAttractionDistribution=False,  # Dissuade hubs
-                 linLogMode=False,  # NOT IMPLEMENTED
+                 linLogMode=False,  # Logarithmic attraction, for tighter clusters
                  adjustSizes=False,  # Prevent overlap (NOT IMPLEMENTED)
                  edgeWeightInfluence=1.0,
 
                  # Performance
                  jitterTolerance=1.0,  # Tolerance
-                 barnesHutOptimize=True,
+                 barnesHutOptimize=True,  # Approximate repulsion in O(n log n); exact on the numpy backend
                  barnesHutTheta=1.2,
-                 multiThreaded=False,  # NOT IMPLEMENTED
+                 multiThreaded=True,  # Thread count of the Cython kernels; True uses every core, False one
+                 backend=None,  # 'cython', 'numpy' or 'python'; None picks the fastest for the graph
+                 componentLayout=False,  # Lay out connected components apart, in parallel, and pack them
 
                  # Tuning
                  scalingRatio=2.0,
                  strongGravityMode=False,
                  gravity=1.0,
 
+                 # Initial placement
+                 initialLayout='random',  # 'random', 'radial' or 'pivot-mds', used when no pos is given
+                 seed=None,  # Seed of every random choice, None for a different layout on each run
+
+                 # Convergence
+                 convergenceThreshold=0.0,  # Relative displacement below which the layout counts as settled; 0 disables
+                 convergenceIterations=10,  # Iterations the relative displacement is averaged over
+
+                 # Multilevel
+                 multilevel=False,  # Lay out a coarsened graph first, then refine it level by level
+                 multilevelMinNodes=100,  # Stop coarsening at this many nodes
+                 refineIterations=50,  # Iterations spent on each finer level
+
                  # Log
-                 verbose=True):
-        assert linLogMode == multiThreaded == False, "You selected a feature that has not been implemented yet..."
+                 verbose=False):
         self.outboundAttractionDistribution = outboundAttractionDistribution
         self.linLogMode = linLogMode
         self.adjustSizes = adjustSizes
@@ -70,60 +744,54 @@ class ForceAtlas2:
         self.jitterTolerance = jitterTolerance
         self.barnesHutOptimize = barnesHutOptimize
         self.barnesHutTheta = barnesHutTheta
+        if multiThreaded is True:
+            self.threads = 0
+        elif multiThreaded is False:
+            self.threads = 1
+        elif multiThreaded >= 1:
+            self.threads = int(multiThreaded)
+        else:
+            raise ValueError("multiThreaded must be a boolean or a positive thread count")
         self.scalingRatio = scalingRatio
         self.strongGravityMode = strongGravityMode
         self.gravity = gravity
+        if initialLayout not in available_initial_layouts():
+            raise ValueError(f"Initial layout '{initialLayout}' is not available")
+        self.initialLayout = initialLayout
+        self.seed = seed
+        self.convergenceThreshold = convergenceThreshold
+        self.convergenceIterations = convergenceIterations
+        self.multilevel = multilevel
+        self.multilevelMinNodes = multilevelMinNodes
+        self.refineIterations = refineIterations
+        if backend is not None and backend not in available_backends():
+            raise ValueError(f"Layout backend '{backend}' is not available")
+        self.backend = backend
+        self.componentLayout = componentLayout
         self.verbose = verbose
 
-    def init(self, G, pos=None):
-        """Initialize nodes and edges from NetworkX graph"""
-        node_list = list(G.nodes())
-        n_nodes = len(node_list)
-        
-        # Put nodes into a data structure we can understand
-        nodes = []
-        for i, node in enumerate(node_list):
-            n = fa2util.Node()
-            n.mass = 1 + len(list(G.neighbors(node)))
-            
-            # Get weight and size from networkx graph
-            weight = G.nodes[node].get('weight', n.mass)
-            n.size = G.nodes[node].get('size', normalized_size(weight))
-            
-            n.old_dx = 0
-            n.old_dy = 0
-            n.dx = 0
-            n.dy = 0
-            if pos is None:
-                n.x = random.random()
-                n.y = random.random()
-            else:
-                n.x = pos[i][0]
-                n.y = pos[i][1]
-            nodes.append(n)
+        # Outcome of the last forceatlas2() call
+        self.iterationsRun = 0
+        self.refineIterationsRun = 0
+        self.stopReason = None
+        self.stats = None
 
-        # Put edges into a data structure we can understand
-        edges = []
-        seen_edges = set()
-        
-        for i, node1 in enumerate(node_list):
-            for node2 in G.neighbors(node1):
-                j = node_list.index(node2)
-                if j <= i:  # Avoid duplicate edges for undirected graphs
-                    continue
-                
-                edge_key = (min(i, j), max(i, j))
-                if edge_key in seen_edges:
-                    continue
-                seen_edges.add(edge_key)
-                
-                edge = fa2util.Edge()
-                edge.node1 = i
-                edge.node2 = j
-                edge.weight = G[node1][node2].get('weight', 1.0) if isinstance(G[node1][node2], dict) else 1.0
-                edges.append(edge)
-
-        return nodes, edges
+    def init(self, G, mass=None, size=None):
+        """Read an adjacency matrix into the arrays describing the graph.
+
+        Returns (node_count, edge_node1, edge_node2, edge_weight, mass, size),
+        the same shape coarsen() produces.
+        """
+        edge_node1, edge_node2, edge_weight, degree = adjacency_to_edges(G)
+        node_count = len(degree)
+
+        if mass is None:
+            mass = [1 + d for d in degree]
+        if size is None:
+            size = [None] * node_count
+        size = [normalized_size(mass[i]) if size[i] is None else size[i] for i in range(node_count)]
+
+        return node_count, edge_node1, edge_node2, edge_weight, mass, size
 
     # Given an adjacency matrix, this function computes the node positions
     # according to the ForceAtlas2 layout algorithm.  It takes the same
@@ -139,65 +807,396 @@ class ForceAtlas2:
     # output to a more usable format.  If you do use networkx, use the
     # "forceatlas2_networkx_layout" function below.
     #
-    # Currently, only undirected graphs are supported so the adjacency matrix
-    # should be symmetric.
+    # Currently, only undirected graphs are supported, so a directed
+    # adjacency matrix is read as its symmetric closure.
+    #
+    # `iterations` is an upper bound.  When convergenceThreshold is set, the
+    # loop stops as soon as the mean node displacement, relative to the RMS
+    # radius of the layout and averaged over the last convergenceIterations
+    # iterations, drops below it.  A single iteration is too noisy to go
+    # by: the adaptive speed keeps the displacement jittering by a factor
+    # of two around the level it settles at.  iterationsRun and stopReason
+    # ('converged' or 'iterations') record what happened.
+    #
+    # In multilevel mode the graph is coarsened until it has at most
+    # multilevelMinNodes nodes or stops shrinking.  The coarsest graph gets
+    # the full `iterations`, then every finer level starts from the
+    # positions of its coarse nodes and is refined for at most
+    # refineIterations, stopping early on convergence as well.  The run as
+    # a whole therefore takes up to refineIterations per finer level more
+    # than `iterations`.  iterationsRun and stopReason describe the
+    # coarsest level, which does the actual layout, and
+    # refineIterationsRun counts the iterations of all finer levels.
+    # A starting layout or pinned nodes only mean something for the graph
+    # as given, so passing `pos` or `fixed` runs a single level.
+    #
+    # Without `pos`, the nodes start out as initialLayout places them:
+    # uniformly at random, on rings around the `roots` (radial), or at
+    # coordinates approximating their graph distances (pivot-mds).  Both
+    # structured placements start close to the finished shape, so with a
+    # convergence threshold far fewer iterations are needed, except for
+    # radial placements around many roots, which share the centre and
+    # settle about as slowly as random ones.  With a seed, every run on
+    # the same graph starts from the same placement.
+    #
+    # `snapshot` lets a caller watch the layout as it forms.  It is called
+    # on the thread running the layout, at most as often as
+    # snapshotIterations and snapshotInterval allow, with a fresh list of
+    # positions it may keep.  It should hand the list off and return
+    # quickly, since the layout waits for it.
+    #
+    # `progress` is called the same way with a LayoutProgress, at most
+    # every progressInterval seconds and once more when the layout ends.
+    # A progressInterval of 0 reports every iteration, None or a negative
+    # value only the start of every level and the end.
+    #
+    # With componentLayout, a graph of several connected components is
+    # laid out one component at a time, so unrelated components never push
+    # each other around: the largest first on every thread, then the others
+    # on a thread pool as large as the thread count, one thread each.
+    # Stars get their closed-form layout, and the results are packed in
+    # rings around the largest component.  Progress and snapshots follow
+    # the largest component, iterationsRun is the longest run of any.
+    #
+    # Every call leaves a LayoutStats in `stats`; verbose prints it.
     def forceatlas2(self,
-                    G,  # a graph in 2D numpy ndarray format (or) scipy sparse matrix format
+                    G,  # adjacency as a scipy sparse matrix, a 2D array or an (indptr, indices[, data]) CSR tuple
                     pos=None,  # Array of initial positions
                     iterations=100,  # Number of times to iterate the main loop
-                    progress_bar=None
+                    progress=None,  # Called from the layout loop with a LayoutProgress
+                    progressInterval=0.1,  # Minimum seconds between progress reports, 0 for every iteration, None for none mid-level
+                    fixed=None,  # Per-node flags, True for nodes that must not move
+                    initialSpeed=1.0,  # Lower values make a gentle refinement of `pos`
+                    mass=None,  # Per-node masses, 1 + out-degree by default
+                    size=None,  # Per-node sizes, None entries are derived from the mass
+                    snapshot=None,  # Called from the layout loop with a copy of the positions
+                    snapshotIterations=0,  # Publish a snapshot every this many iterations, 0 to disable
+                    snapshotInterval=0.25,  # Publish a snapshot every this many seconds, 0 to disable
+                    roots=None,  # Per-node flags, True for the centre nodes of the radial initial layout
                     ):
+        startTime = time.perf_counter()
+        rng = random.Random(self.seed)
+        self.iterationsRun = 0
+        self.refineIterationsRun = 0
+        self.stopReason = 'iterations'
+        levels = [self.init(G, mass, size)]
+        self._backend = self.backend or default_backend(levels[0][0], self.barnesHutOptimize)
+        if 'cython' not in available_backends():
+            warnings.warn("Uncompiled fa2util module.  Compile it with Cython for a 10-100x speed boost.")
+        if self.backend == 'numpy' and self.barnesHutOptimize:
+            warnings.warn("The numpy layout backend has no Barnes-Hut approximation, "
+                          "repulsion is computed exactly", RuntimeWarning, stacklevel=2)
+        self.stats = LayoutStats(self._backend, 1, levels[0][0], len(levels[0][1]))
+        if levels[0][0] == 0:
+            return []
+
+        if self.componentLayout and pos is None and fixed is None:
+            components = connected_components(*levels[0][:3])
+            if len(components) > 1:
+                return self._layout_components(levels[0], components, roots, rng, startTime, iterations,
+                                               initialSpeed, progress, progressInterval,
+                                               snapshot, snapshotIterations, snapshotInterval)
+
+        parents = []
+        if self.multilevel and pos is None and fixed is None:
+            while levels[-1][0] > self.multilevelMinNodes:
+                parent, coarse = coarsen(*levels[-1], rng=rng)
+                if coarse[0] > MULTILEVEL_MIN_REDUCTION * levels[-1][0]:
+                    break
+                parents.append(parent)
+                levels.append(coarse)
+        self.stats.levels = len(levels)
+        if pos is None:
+            pos = self._initial_positions(levels[-1], roots, parents, rng)
+        self.stats.setupTime = time.perf_counter() - startTime
+
+        self._snapshots = None
+        if snapshot is not None:
+            # For snapshots, 0 keeps meaning disabled.
+            self._snapshots = _Snapshots(snapshot, snapshotIterations or None, snapshotInterval or None)
+        self._progress = progress
+        self._progressThrottle = _Throttle(None, progressInterval)
+        self._convergence = None
+        self._startTime = startTime
+        self._iteration = 0
+
+        refineIterations = min(self.refineIterations, iterations)
+        self._totalIterations = iterations + refineIterations * (len(levels) - 1)
+        self._workDone = 0
+        self._workTotal = iterations * levels[-1][0] + refineIterations * sum(level[0] for level in levels[:-1])
+        positions = pos
+        for depth in reversed(range(len(levels))):
+            node_count, edge_node1, edge_node2, edge_weight, masses, sizes = levels[depth]
+            if depth == len(levels) - 1:
+                levelIterations = iterations
+                speed = initialSpeed
+            else:
+                levelIterations = refineIterations
+                speed = REFINE_SPEED
+                positions = _project_positions(positions, parents[depth], levels[depth + 1][5], rng)
+
+            layout = self._layout_class()([p[0] for p in positions], [p[1] for p in positions], masses, sizes,
+                                          edge_node1, edge_node2, edge_weight, fixed, self.threads)
+            self.stats.threads = layout.threads
+            if self._snapshots is not None:
+                self._snapshots.set_level(parents[:depth])
+            self._level = depth
+            self._report_progress()
+            levelIterationsRun, stopReason = self._run(layout, masses, levelIterations, speed)
+            if depth == len(levels) - 1:
+                self.iterationsRun, self.stopReason = levelIterationsRun, stopReason
+            else:
+                self.refineIterationsRun += levelIterationsRun
+            positions = layout.positions()
+
+        self._report_progress(finished=True)
+        self._snapshots = self._progress = None
+
+        self.stats.iterations = self.iterationsRun
+        self.stats.refineIterations = self.refineIterationsRun
+        self.stats.stopReason = self.stopReason
+        self.stats.totalTime = time.perf_counter() - startTime
+        if self.verbose:
+            self.stats.display()
+        return positions
+
+    def _layout_components(self, level, components, roots, rng, startTime, iterations, initialSpeed,
+                           progress, progressInterval, snapshot, snapshotIterations, snapshotInterval):
+        """Lay out every connected component on its own and pack them together"""
+        node_count, edge_node1, edge_node2, edge_weight, masses, sizes = level
+        neighbors = _neighbor_lists(node_count, edge_node1, edge_node2)
+        component = [0] * node_count
+        for c, members in enumerate(components):
+            for u in members:
+                component[u] = c
+        rows = [[] for _ in range(node_count)]
+        for a, b, w in zip(edge_node1, edge_node2, edge_weight):
+            rows[a].append((b, w))
+
+        # Component positions, centred on the origin.  Stars are done right
+        # away, the others by a ForceAtlas2 run each.
+        results = [star_positions(members, neighbors, sizes) for members in components]
+        tasks = [c for c in range(len(components)) if results[c] is None]
+        seeds = {c: rng.getrandbits(32) for c in tasks} if self.seed is not None else {}
+        self.stats.setupTime = time.perf_counter() - startTime
+
+        # Snapshots follow the largest component, which takes longest.  The
+        # others are shown where the estimate of their size puts them,
+        # collapsed onto their centre until they are done.
+        lock = threading.Lock()
+        largestSnapshot = None
+        if snapshot is not None and tasks:
+            estimate = [math.sqrt(sum(masses[u] for u in members)) * 2 for members in components]
+            estimatedCenters = pack_disks(estimate, COMPONENT_GAP)
+
+            def largestSnapshot(positions):
+                with lock:
+                    results[tasks[0]] = _centered(positions)
+                    composed = self._place_components(components, results, estimatedCenters)
+                snapshot(composed)
+
+        def run(c):
+            members = components[c]
+            index = {u: k for k, u in enumerate(members)}
+            indptr = [0]
+            indices = []
+            data = []
+            for u in members:
+                for v, w in rows[u]:
+                    indices.append(index[v])
+                    data.append(w)
+                indptr.append(len(indices))
+
+            largest = c == tasks[0]
+            fa2 = copy.copy(self)
+            fa2.componentLayout = False
+            fa2.verbose = False
+            fa2.seed = seeds.get(c)
+            # The largest component runs alone on every thread, the others
+            # one thread each in the pool.
+            fa2.threads = self.threads if largest else 1
+            positions = fa2.forceatlas2((indptr, indices, data), iterations=iterations,
+                                        progress=progress if largest else None,
+                                        progressInterval=progressInterval, initialSpeed=initialSpeed,
+                                        mass=[masses[u] for u in members], size=[sizes[u] for u in members],
+                                        snapshot=largestSnapshot if largest else None,
+                                        snapshotIterations=snapshotIterations, snapshotInterval=snapshotInterval,
+                                        roots=None if roots is None else [roots[u] for u in members])
+            with lock:
+                results[c] = _centered(positions)
+            return fa2
+
+        # The largest component goes first, on its own, so that its kernels
+        # and the pool never have more threads busy than there are cores.
+        runs = [run(tasks[0])] if tasks else []
+        workers = self.threads or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            runs.extend(pool.map(run, tasks[1:]))
+
+        radii = [max(math.hypot(*p) + sizes[u] for u, p in zip(members, positions))
+                 for members, positions in zip(components, results)]
+        positions = self._place_components(components, results, pack_disks(radii, COMPONENT_GAP))
+
+        self.iterationsRun = max((fa2.iterationsRun for fa2 in runs), default=0)
+        self.refineIterationsRun = max((fa2.refineIterationsRun for fa2 in runs), default=0)
+        # Closed-form components are settled by definition.
+        self.stopReason = 'converged' if all(fa2.stopReason == 'converged' for fa2 in runs) else 'iterations'
+        if runs:
+            self.stats.threads = runs[0].stats.threads
+            self.stats.levels = max(fa2.stats.levels for fa2 in runs)
+        for fa2 in runs:
+            for phase, seconds in fa2.stats.phaseTimes.items():
+                self.stats.phaseTimes[phase] += seconds
+            self.stats.iterationTimes.extend(fa2.stats.iterationTimes)
+        self.stats.iterations = self.iterationsRun
+        self.stats.refineIterations = self.refineIterationsRun
+        self.stats.stopReason = self.stopReason
+        self.stats.totalTime = time.perf_counter() - startTime
+        if self.verbose:
+            self.stats.display()
+        return positions
+
+    def _place_components(self, components, results, centers):
+        """Move the component positions onto their packed centres"""
+        positions = [None] * sum(len(members) for members in components)
+        for members, local, (cx, cy) in zip(components, results, centers):
+            for k, u in enumerate(members):
+                positions[u] = (cx, cy) if local is None else (cx + local[k][0], cy + local[k][1])
+        return positions
+
+    def _initial_positions(self, level, roots, parents, rng):
+        """Place the nodes of the coarsest level according to initialLayout"""
+        node_count, edge_node1, edge_node2, _, masses, _ = level
+        if self.initialLayout == 'random':
+            return [(rng.random(), rng.random()) for _ in range(node_count)]
+
+        if self.initialLayout == 'radial':
+            if roots is not None:
+                for parent in parents:
+                    coarseRoots = [False] * (max(parent) + 1)
+                    for u, isRoot in enumerate(roots):
+                        if isRoot:
+                            coarseRoots[parent[u]] = True
+                    roots = coarseRoots
+            positions = radial_positions(node_count, edge_node1, edge_node2, roots)
+        else:
+            positions = pivot_mds_positions(node_count, edge_node1, edge_node2)
+        return _fit_positions(positions, masses, rng)
+
+    def _run(self, layout, masses, iterations, speed):
+        """Iterate the layout until it converges or runs out of iterations.
+
+        Returns the number of iterations run and the stop reason.
+        """
         # Initializing, initAlgo()
         # ================================================================
 
         # speed and speedEfficiency describe a scaling factor of dx and dy
         # before x and y are adjusted.  These are modified as the
         # algorithm runs to help ensure convergence.
-        speed = 1.0
         speedEfficiency = 1.0
-        nodes, edges = self.init(G, pos)
+        stopReason = 'iterations'
         outboundAttCompensation = 1.0
         if self.outboundAttractionDistribution:
-            masses = [n.mass for n in nodes]
             outboundAttCompensation = sum(masses) / len(masses)
         # ================================================================
 
         # Main loop, i.e. goAlgo()
         # ================================================================
 
+        timers = {phase: Timer(phase) for phase in PHASES}
+        phaseTimes = self.stats.phaseTimes
+        iterationTimes = self.stats.iterationTimes
+        quadtreeTime = layout.quadtree_time
+        recentConvergence = collections.deque(maxlen=max(self.convergenceIterations, 1))
+        iterationsRun = 0
         for i in range(iterations):
-            GLib.idle_add(self._update_progress, progress_bar, i, iterations)
-
-            for n in nodes:
-                n.old_dx = n.dx
-                n.old_dy = n.dy
-                n.dx = 0
-                n.dy = 0
+            layout.reset_forces()
 
             # Charge repulsion forces
-            # parallelization should be implemented here
-            fa2util.apply_repulsion(nodes, self.adjustSizes, self.scalingRatio)
+            timers['repulsion'].start()
+            if self.barnesHutOptimize:
+                layout.apply_repulsion_barneshut(self.adjustSizes, self.scalingRatio, self.barnesHutTheta)
+            else:
+                layout.apply_repulsion(self.adjustSizes, self.scalingRatio)
+            timers['repulsion'].stop()
 
             # Gravitational forces
-            fa2util.apply_gravity(nodes, self.gravity, scalingRatio=self.scalingRatio, useStrongGravity=self.strongGravityMode)
+            timers['gravity'].start()
+            layout.apply_gravity(self.gravity, scalingRatio=self.scalingRatio, useStrongGravity=self.strongGravityMode)
+            timers['gravity'].stop()
 
-            # If other forms of attraction were implemented they would be selected here.
-            fa2util.apply_attraction(nodes, edges, self.outboundAttractionDistribution, outboundAttCompensation,
-                                     self.edgeWeightInfluence)
+            # Attraction forces
+            timers['attraction'].start()
+            layout.apply_attraction(self.outboundAttractionDistribution, outboundAttCompensation,
+                                    self.edgeWeightInfluence, self.linLogMode)
+            timers['attraction'].stop()
 
             # Adjust speeds and apply forces
-            values = fa2util.adjustSpeedAndApplyForces(nodes, speed, speedEfficiency, self.jitterTolerance)
+            timers['speed'].start()
+            values = layout.adjustSpeedAndApplyForces(speed, speedEfficiency, self.jitterTolerance)
+            timers['speed'].stop()
+
+            row = [self._level]
+            for phase in PHASES:
+                phaseTimes[phase] += timers[phase].last_time
+                row.append(timers[phase].last_time)
+            row.append(layout.quadtree_time - quadtreeTime)
+            phaseTimes['quadtree'] += row[-1]
+            quadtreeTime = layout.quadtree_time
+            iterationTimes.append(row)
+
             speed = values['speed']
             speedEfficiency = values['speedEfficiency']
+            iterationsRun += 1
+            self._iteration += 1
+            self._workDone += layout.node_count
+            if values['radius'] > 0:
+                self._convergence = values['displacement'] / values['radius']
 
+            if self._snapshots is not None and self._snapshots.due(self._iteration):
+                self._snapshots.publish(self._iteration, layout)
+            if self._progress is not None and self._progressThrottle.due(self._iteration):
+                self._report_progress()
+
+            if self.convergenceThreshold > 0 and values['radius'] > 0:
+                recentConvergence.append(self._convergence)
+                if (len(recentConvergence) == recentConvergence.maxlen
+                        and sum(recentConvergence) <= self.convergenceThreshold * len(recentConvergence)):
+                    stopReason = 'converged'
+                    break
         # ================================================================
-        return [(n.x, n.y) for n in nodes]
+
+        return iterationsRun, stopReason
+
+    def _report_progress(self, finished=False):
+        """Hand the current LayoutProgress to the progress callback"""
+        if self._progress is None:
+            return
+
+        elapsed = time.perf_counter() - self._startTime
+        eta = 0.0
+        if self._workDone and not finished:
+            eta = elapsed / self._workDone * (self._workTotal - self._workDone)
+        self._progressThrottle.mark(self._iteration)
+        self._progress(LayoutProgress(self._iteration, self._totalIterations, elapsed, eta,
+                                      dict(self.stats.phaseTimes), self._convergence, self._level))
+
+    def _layout_class(self):
+        """Return the Layout implementation of the selected backend"""
+        if self._backend == 'cython':
+            return fa2util.Layout
+        if self._backend == 'numpy':
+            return fa2numpy.Layout
+        return python_kernels().NodeLayout
 
     # A layout for NetworkX.
     #
     # This function returns a NetworkX layout, which is really just a
     # dictionary of node positions (2D X-Y tuples) indexed by the node name.
-    def forceatlas2_networkx_layout(self, G, pos=None, iterations=100, weight_attr=None, progress_bar=None):
+    def forceatlas2_networkx_layout(self, G, pos=None, iterations=100, weight_attr=None, progress=None,
+                                    progressInterval=0.1, fixed=None, initialSpeed=1.0, snapshot=None,
+                                    snapshotIterations=0, snapshotInterval=0.25, roots=None):
         """
         Return a NetworkX layout dictionary of node positions
         
@@ -206,19 +1205,42 @@ class ForceAtlas2:
             pos: Dictionary of initial positions (optional)
             iterations: Number of iterations to run
             weight_attr: Edge weight attribute (ignored, weights are auto-detected)
+            progress: Called with a LayoutProgress as the layout runs (optional)
+            progressInterval: Minimum number of seconds between progress reports,
+                0 to report every iteration, None to report only as levels start and at the end
+            fixed: Nodes to keep at their initial position (optional, requires pos)
+            initialSpeed: Starting speed, lower it to refine an existing layout
+            snapshot: Called with a dictionary of intermediate positions (optional)
+            snapshotIterations: Iterations between snapshots, 0 to disable
+            snapshotInterval: Seconds between snapshots, 0 to disable
+            roots: Centre nodes of the radial initial layout (optional)
             
         Returns:
             Dictionary mapping nodes to (x, y) positions
         """
-        if pos is None:
-            l = self.forceatlas2(G, pos=None, iterations=iterations, progress_bar=progress_bar)
-        else:
-            poslist = [[pos[i][0], pos[i][1]] for i in G.nodes()]
-            l = self.forceatlas2(G, pos=poslist, iterations=iterations, progress_bar=progress_bar)
-        return dict(zip(G.nodes(), l))
-
-    def _update_progress(self, progress_bar, current, total):
-        """Update progress bar from main thread"""
-        progress_bar.set_fraction(current / total)
-        progress_bar.set_text(f"Iteration {current + 1}/{total}")
-        return False
+        node_list, adjacency, size = networkx_to_adjacency(G)
+
+        fixedlist = None
+        if fixed is not None:
+            fixed = set(fixed)
+            fixedlist = [node in fixed for node in node_list]
+
+        poslist = None
+        if pos is not None:
+            poslist = [pos[node] for node in node_list]
+
+        rootlist = None
+        if roots is not None:
+            roots = set(roots)
+            rootlist = [node in roots for node in node_list]
+
+        snapshotlist = None
+        if snapshot is not None:
+            def snapshotlist(positions):
+                snapshot(dict(zip(node_list, positions)))
+
+        l = self.forceatlas2(adjacency, pos=poslist, iterations=iterations, progress=progress,
+                             progressInterval=progressInterval, fixed=fixedlist, initialSpeed=initialSpeed, size=size,
+                             snapshot=snapshotlist, snapshotIterations=snapshotIterations,
+                             snapshotInterval=snapshotInterval, roots=rootlist)
+        return dict(zip(node_list, l))
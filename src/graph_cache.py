@@ -0,0 +1,64 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+CACHE_PATH = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'graphite')
+# The graph of the local system together with its layout
+GRAPH_CACHE = os.path.join(CACHE_PATH, 'dependency_graph.pkl')
+# Separate graph and position caches of earlier versions
+LEGACY_CACHES = (os.path.join(CACHE_PATH, 'node_graph.pkl'), os.path.join(CACHE_PATH, 'pos_dict.pkl'))
+
+
+def cache_path(status_path=None):
+    """Return the cache file of the graph read from a dpkg status file.
+
+    The local system, status_path None, shares GRAPH_CACHE with the
+    application.  Other status files get a file of their own, named after
+    their absolute path.
+    """
+    if status_path is None:
+        return GRAPH_CACHE
+    key = hashlib.sha1(os.path.abspath(status_path).encode()).hexdigest()
+    return os.path.join(CACHE_PATH, 'status', f'{key}.pkl')
+
+
+def load_graph(path=GRAPH_CACHE):
+    """Return the cached DependencyGraph, or None if there is none usable.
+
+    A cache written by another version of the application may name classes
+    or attributes that no longer exist; it is not usable either, and the
+    graph gets rebuilt.
+    """
+    if path == GRAPH_CACHE:
+        for legacy in LEGACY_CACHES:
+            remove_graph(legacy)
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError,
+            AttributeError, ImportError, TypeError, KeyError):
+        return None
+
+
+def write_graph(graph, path=GRAPH_CACHE):
+    # Written aside and moved into place, so that the application and any
+    # number of exports can share a cache file without reading half of it.
+    # Every write gets a temporary file of its own, since a write that was
+    # superseded can still be running on another thread.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(prefix=os.path.basename(path) + '.', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(graph, f)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def remove_graph(path=GRAPH_CACHE):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,77 @@
+from array import array
+
+
+class InstallPaths:
+    """Shortest dependency chains from the manually installed packages.
+
+    A single breadth-first search, started from every manually installed
+    package at once and following dependencies, gives every package its
+    distance from the nearest of them, and keeps as its parents the
+    dependents one step closer.  Following parents from any package leads
+    back to a manually installed one in `distance` steps, so a chain costs
+    time proportional to its length, however large the graph.  Packages
+    no manually installed package needs have no distance; apt would
+    autoremove them.
+    """
+
+    def __init__(self, graph):
+        node_count = len(graph)
+        self.distance = array('i', [-1]) * node_count
+        parents = [[] for _ in range(node_count)]
+
+        frontier = [node for node in graph.nodes() if graph.manual[node]]
+        for node in frontier:
+            self.distance[node] = 0
+        level = 0
+        while frontier:
+            level += 1
+            next_frontier = []
+            for node in frontier:
+                for dependency in graph.successors(node):
+                    if self.distance[dependency] == -1:
+                        self.distance[dependency] = level
+                        next_frontier.append(dependency)
+                    if self.distance[dependency] == level:
+                        parents[dependency].append(node)
+            frontier = next_frontier
+
+        self.parent_indptr = array('i', [0])
+        self.parent_indices = array('i')
+        for nodes in parents:
+            self.parent_indices.extend(nodes)
+            self.parent_indptr.append(len(self.parent_indices))
+
+    def parents(self, node):
+        """Dependents of `node` on a shortest chain to it"""
+        return self.parent_indices[self.parent_indptr[node]:self.parent_indptr[node + 1]]
+
+    def chains(self, node, count):
+        """Return up to `count` shortest chains that lead to `node`.
+
+        Every chain is a list of nodes that starts with a manually
+        installed package, each depending on the next, and ends with
+        `node`.  Chains are enumerated depth first from the manually
+        installed end, so consecutive ones tend to start from different
+        packages.  Returns an empty list if nothing manually installed
+        needs `node`.
+        """
+        distance = self.distance
+        if distance[node] == -1 or count <= 0:
+            return []
+        if distance[node] == 0:
+            return [[node]]
+
+        chains = []
+        path = [node]
+        pending = [iter(self.parents(node))]
+        while pending and len(chains) < count:
+            parent = next(pending[-1], None)
+            if parent is None:
+                pending.pop()
+                path.pop()
+            elif distance[parent] == 0:
+                chains.append([parent, *reversed(path)])
+            else:
+                path.append(parent)
+                pending.append(iter(self.parents(parent)))
+        return chains
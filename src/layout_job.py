@@ -0,0 +1,189 @@
+import multiprocessing
+import queue
+import traceback
+
+from .fa2_adjustSize import ForceAtlas2, available_initial_layouts, seed_positions
+from .utils import get_pkg_id_from_node
+
+# GTK runs threads of its own, which a forked child would inherit in an
+# undefined state, so workers always start from a fresh interpreter.
+_context = multiprocessing.get_context('spawn')
+
+# How often the waiting thread looks at the worker while no message arrives
+POLL_INTERVAL = 0.1
+
+# Starting speed of a warm-started layout; small, so that the refinement
+# nudges the previous picture instead of shaking it apart.
+WARM_START_SPEED = 0.05
+
+
+def layout_options(strongGravityMode=True, gravity=0.1, linLogMode=False, convergenceThreshold=0.002,
+                   multilevel=False, componentLayout=False, initialLayout='pivot-mds', seed=0, threads=0):
+    """ForceAtlas2 options of a Graphite layout, defaulting to the default settings"""
+    if initialLayout not in available_initial_layouts():
+        # Pivot MDS needs NumPy.
+        initialLayout = 'radial'
+    return {
+        'adjustSizes': True,
+        'scalingRatio': 1,
+        'strongGravityMode': strongGravityMode,
+        'gravity': gravity,
+        'linLogMode': linLogMode,
+        'outboundAttractionDistribution': True,
+        'convergenceThreshold': convergenceThreshold,
+        'multilevel': multilevel,
+        'componentLayout': componentLayout,
+        'initialLayout': initialLayout,
+        'seed': seed,
+        'multiThreaded': threads or True,
+        'verbose': False,
+    }
+
+
+def warm_start_positions(node_graph, previous_graph, rng):
+    """Seed a graph from the layout of a previous one.
+
+    Packages are matched by name and architecture, so upgraded packages
+    keep their place. Returns the initial positions and the nodes that
+    were carried over.
+    """
+    previous = {get_pkg_id_from_node(name): xy for name, xy in zip(previous_graph.names, previous_graph.positions())}
+    pos = {}
+    for node, name in enumerate(node_graph.names):
+        xy = previous.get(get_pkg_id_from_node(name))
+        if xy is not None:
+            pos[node] = xy
+    unchanged = list(pos)
+
+    pos = seed_positions(node_graph, pos, rng)
+    return [pos[node] for node in node_graph.nodes()], unchanged
+
+
+class LayoutJob:
+    """Handle on a ForceAtlas2 layout computed in a worker process.
+
+    run() blocks the calling thread until the layout is done, relaying
+    progress reports and snapshots from the worker to the callbacks on
+    that thread.  cancel() may be called from any thread and terminates
+    the worker right away.  Positions come back through a shared memory
+    array rather than the message queue.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.cancelled = False
+        self.iterationsRun = 0
+        self.refineIterationsRun = 0
+        self.stopReason = None
+        self.stats = None
+        self._process = None
+
+    def run(self, G, progress=None, snapshot=None, pos=None, fixed=None, roots=None, **kwargs):
+        """Lay out the DependencyGraph G.
+
+        `pos` lists the initial (x, y) of every node in node order, `fixed`
+        and `roots` are collections of nodes, and the other arguments are
+        those of ForceAtlas2.forceatlas2().  Snapshots are lists of (x, y)
+        like the result.  Returns the positions, or None if the job was
+        cancelled.  Raises RuntimeError if the layout fails, or the worker
+        dies without a result.
+        """
+        if self.cancelled:
+            return None
+
+        node_count = len(G)
+        adjacency = G.adjacency()
+        size = G.size.tolist()
+        if pos is not None:
+            kwargs['pos'] = list(pos)
+        if fixed is not None:
+            fixed = set(fixed)
+            kwargs['fixed'] = [node in fixed for node in range(node_count)]
+        if roots is not None:
+            roots = set(roots)
+            kwargs['roots'] = [node in roots for node in range(node_count)]
+
+        positions = _context.Array('d', 2 * max(node_count, 1))
+        messages = _context.Queue()
+        process = _context.Process(target=_layout_process, daemon=True,
+                                   args=(self.options, adjacency, size, kwargs, progress is not None,
+                                         snapshot is not None, positions, messages))
+        self._process = process
+        process.start()
+        # A cancel() that came in before the process existed could not stop it.
+        if self.cancelled:
+            process.terminate()
+
+        try:
+            while True:
+                message = self._receive(messages, process)
+                if message is None:
+                    return None
+
+                kind = message[0]
+                if kind == 'progress':
+                    progress(message[1])
+                elif kind == 'snapshot':
+                    snapshot(_read_positions(positions, node_count))
+                elif kind == 'done':
+                    self.iterationsRun, self.refineIterationsRun, self.stopReason, self.stats = message[1:]
+                    return _read_positions(positions, node_count)
+                elif kind == 'error':
+                    raise RuntimeError(f"Layout worker failed:\n{message[1]}")
+        finally:
+            process.join(POLL_INTERVAL)
+            messages.cancel_join_thread()
+            messages.close()
+
+    def cancel(self):
+        """Stop the job, and its worker process if one is running"""
+        self.cancelled = True
+        if self._process is not None and self._process.is_alive():
+            self._process.terminate()
+
+    def _receive(self, messages, process):
+        # Wake up regularly to notice cancellation and dead workers.  None
+        # means cancelled; a worker killed from outside, or crashed in a
+        # kernel, is an error.
+        while not self.cancelled:
+            try:
+                return messages.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if not process.is_alive() and messages.empty():
+                    if self.cancelled:
+                        break
+                    raise RuntimeError(f"Layout worker exited with code {process.exitcode} without a result")
+        return None
+
+
+def _read_positions(positions, node_count):
+    with positions.get_lock():
+        flat = positions[:2 * node_count]
+    return list(zip(flat[0::2], flat[1::2]))
+
+
+def _write_positions(positions, layout_positions):
+    flat = [c for xy in layout_positions for c in xy]
+    with positions.get_lock():
+        positions[:len(flat)] = flat
+
+
+def _layout_process(options, adjacency, size, kwargs, report_progress, report_snapshots, positions, messages):
+    # Entry point of the worker process.
+    def progress(report):
+        messages.put(('progress', report))
+
+    def snapshot(layout_positions):
+        _write_positions(positions, layout_positions)
+        messages.put(('snapshot',))
+
+    try:
+        fa2 = ForceAtlas2(**options)
+        result = fa2.forceatlas2(adjacency, size=size,
+                                 progress=progress if report_progress else None,
+                                 snapshot=snapshot if report_snapshots else None,
+                                 **kwargs)
+        _write_positions(positions, result)
+        messages.put(('done', fa2.iterationsRun, fa2.refineIterationsRun, fa2.stopReason, fa2.stats))
+    except Exception:
+        messages.put(('error', traceback.format_exc()))
@@ -1,10 +1,43 @@
-from gi.repository import Adw, Gtk
+from gi.repository import Adw, Gtk, GLib
 
 @Gtk.Template(resource_path='/io/github/cacheuseonly/graphite/ui/loading-page.ui')
 class LoadingPage(Adw.Bin):
     __gtype_name__ = 'LoadingPage'
 
     progress_bar = Gtk.Template.Child()
+    build_label = Gtk.Template.Child()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+
+    def report_build_progress(self, text, fraction):
+        """BuildProgress callback, safe to call from the build thread"""
+        GLib.idle_add(self._show_build_progress, text, fraction)
+
+    def _show_build_progress(self, text, fraction):
+        self.progress_bar.set_fraction(fraction)
+        self.progress_bar.set_text(text)
+        return False
+
+    def show_build_times(self, phase_times):
+        """Show how long each phase of the graph build took, None hides them"""
+        if phase_times is None:
+            self.build_label.set_visible(False)
+            return
+
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in phase_times.items())
+        self.build_label.set_label(f"Graph built in {sum(phase_times.values()):.2f}s ({phases})")
+        self.build_label.set_visible(True)
+
+    def report_layout_progress(self, progress):
+        """ForceAtlas2 progress callback, safe to call from the layout thread"""
+        GLib.idle_add(self._show_layout_progress, progress)
+
+    def _show_layout_progress(self, progress):
+        self.progress_bar.set_fraction(progress.fraction)
+        text = f"Iteration {progress.iteration}/{progress.totalIterations}"
+        if progress.eta >= 1:
+            minutes, seconds = divmod(round(progress.eta), 60)
+            text += f", up to {minutes}:{seconds:02d} left" if minutes else f", up to {seconds}s left"
+        self.progress_bar.set_text(text)
+        return False
@@ -41,6 +41,10 @@ class GraphiteApplication(Adw.Application):
         self.create_action('show-orphans', self.on_show_orphans_action, ['<primary>o'])
         self.create_action('regenerate', lambda *_: self.state.emit('regenerate-requested'), ['<primary>r'])
 
+        self.settings = Gio.Settings.new('io.github.cacheuseonly.graphite.common')
+        self.add_action(self.settings.create_action('transitive-highlight'))
+        self.set_accels_for_action('app.transitive-highlight', ['<primary>t'])
+
     def do_activate(self):
         """Called when the application is activated.
 
@@ -1,4 +1,5 @@
 from gi.repository import Adw
+from gi.repository import Gio
 from gi.repository import Gtk
 from gi.repository import GObject
 
@@ -13,6 +14,8 @@ class Panel(Adw.Bin):
     version_row = Gtk.Template.Child()
     arch_row = Gtk.Template.Child()
     manual_row = Gtk.Template.Child()
+    install_chains_group = Gtk.Template.Child()
+    install_chains_list = Gtk.Template.Child()
     deps_group = Gtk.Template.Child()
     deps_list = Gtk.Template.Child()
     reverse_deps_group = Gtk.Template.Child()
@@ -23,11 +26,13 @@ class Panel(Adw.Bin):
 
         self.state = None
         self.node_graph = None
+        self.settings = Gio.Settings.new('io.github.cacheuseonly.graphite.common')
 
     def set_state(self, state: GraphState):
         self.state = state
         self.state.connect('node-selected', self._on_node_selected)
         self.state.connect('node-deselected', self._on_node_deselected)
+        self.state.connect('job-finished', self._on_job_finished)
 
     def set_node_graph(self, node_graph):
         """Set the node graph and update the panel"""
@@ -42,34 +47,71 @@ class Panel(Adw.Bin):
         self.version_row.set_label("-")
         self.arch_row.set_label("-")
         self.manual_row.set_label("-")
+        self.install_chains_list.remove_all()
+        self.install_chains_group.set_visible(False)
         self.deps_list.remove_all()
         self.deps_group.set_description("0")
         self.reverse_deps_list.remove_all()
         self.reverse_deps_group.set_description("0")
 
-    def _on_goto_clicked(self, node: str):
+    def _on_goto_clicked(self, node: int):
         """Handler for when a goto button is clicked"""
         self.state.selected_node = node
 
-    def _on_node_selected(self, _state, node: str):
-        name = get_pkg_name_from_node(node)
-        version = get_pkg_version_from_node(node)
-        arch = get_pkg_arch_from_node(node)
-        manual = 'Manual' if self.node_graph.nodes[node].get('manual', False) else 'Auto'
+    def _on_node_selected(self, _state, node: int):
+        names = self.node_graph.names
+        name = get_pkg_name_from_node(names[node])
+        version = get_pkg_version_from_node(names[node])
+        arch = get_pkg_arch_from_node(names[node])
+        manual = 'Manual' if self.node_graph.manual[node] else 'Auto'
 
         self.header_label.set_markup(f"<b>{name}</b>")
         self.version_row.set_label(version)
         self.arch_row.set_label(arch)
         self.manual_row.set_label(manual)
 
+        # Update installation chains, from the manually installed end
+        self.install_chains_list.remove_all()
+        count = self.settings.get_int('install-chains')
+        show_chains = not self.node_graph.manual[node] and count > 0
+        self.install_chains_group.set_visible(show_chains)
+        # Install paths are built by the same background job.
+        install_paths = self.node_graph.install_paths(build=False)
+        if show_chains and install_paths is None:
+            self.install_chains_group.set_description("Looking for install chains...")
+        elif show_chains:
+            chains = install_paths.chains(node, count)
+            if chains:
+                self.install_chains_group.set_description(f"{len(chains)} shortest")
+            else:
+                self.install_chains_group.set_description("Not needed by any manual install")
+            for chain in chains:
+                root = chain[0]
+                row = Adw.ActionRow(
+                    title=get_pkg_name_from_node(names[root]),
+                    subtitle=" → ".join(get_pkg_name_from_node(names[n]) for n in chain[1:]),
+                    title_selectable=True,
+                )
+                button = Gtk.Button(icon_name="go-next-symbolic", valign=Gtk.Align.CENTER)
+                button.add_css_class("flat")
+                button.connect("clicked", lambda btn, n=root: self._on_goto_clicked(n))
+                row.add_suffix(button)
+                self.install_chains_list.append(row)
+
         # Update dependencies list
         self.deps_list.remove_all()
-        deps = list(self.node_graph.neighbors(node))
-        self.deps_group.set_description(str(len(deps)))
+        deps = self.node_graph.successors(node)
+        # The reachability index comes from a background job; until it is
+        # done only the direct counts are shown.
+        reachability = self.node_graph.reachability(build=False)
+        if reachability is None:
+            self.deps_group.set_description(f"{len(deps)} direct")
+        else:
+            self.deps_group.set_description(f"{len(deps)} direct, {len(reachability.dependencies(node))} in total")
         for dep in deps:
             row = Adw.ActionRow(
-                title=get_pkg_name_from_node(dep),
-                subtitle=get_pkg_version_from_node(dep),
+                title=get_pkg_name_from_node(names[dep]),
+                subtitle=get_pkg_version_from_node(names[dep]),
                 title_selectable=True,
             )
             button = Gtk.Button(icon_name="go-next-symbolic", valign=Gtk.Align.CENTER)
@@ -80,12 +122,16 @@ class Panel(Adw.Bin):
 
         # Update reverse dependencies list
         self.reverse_deps_list.remove_all()
-        rev_deps = list(self.node_graph.predecessors(node))
-        self.reverse_deps_group.set_description(str(len(rev_deps)))
+        rev_deps = self.node_graph.predecessors(node)
+        if reachability is None:
+            self.reverse_deps_group.set_description(f"{len(rev_deps)} direct")
+        else:
+            self.reverse_deps_group.set_description(
+                f"{len(rev_deps)} direct, {len(reachability.dependents(node))} in total")
         for rev_dep in rev_deps:
             row = Adw.ActionRow(
-                title=get_pkg_name_from_node(rev_dep),
-                subtitle=get_pkg_version_from_node(rev_dep),
+                title=get_pkg_name_from_node(names[rev_dep]),
+                subtitle=get_pkg_version_from_node(names[rev_dep]),
                 title_selectable=True,
             )
             button = Gtk.Button(icon_name="go-next-symbolic", valign=Gtk.Align.CENTER)
@@ -94,11 +140,17 @@ class Panel(Adw.Bin):
             row.add_suffix(button)
             self.reverse_deps_list.append(row)
 
+    def _on_job_finished(self, _state, name):
+        if name == 'query-index' and self.node_graph is not None and self.state.selected_node is not None:
+            self._on_node_selected(self.state, self.state.selected_node)
+
     def _on_node_deselected(self, _state):
         self.header_label.set_text("-")
         self.version_row.set_label("-")
         self.arch_row.set_label("-")
         self.manual_row.set_label("-")
+        self.install_chains_list.remove_all()
+        self.install_chains_group.set_visible(False)
         self.deps_list.remove_all()
         self.deps_group.set_description("0")
         self.reverse_deps_list.remove_all()
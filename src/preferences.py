@@ -1,12 +1,32 @@
 from gi.repository import Gtk, Adw, Gio
 
+# Values of the initial-layout and graph-source keys, in the order of the
+# initial_layout and graph_source rows
+INITIAL_LAYOUTS = ('random', 'radial', 'pivot-mds')
+GRAPH_SOURCES = ('apt', 'dpkg')
+
 @Gtk.Template(resource_path='/io/github/cacheuseonly/graphite/ui/preferences.ui')
 class Preferences(Adw.PreferencesDialog):
     __gtype_name__ = 'Preferences'
 
     iterations = Gtk.Template.Child()
+    graph_source = Gtk.Template.Child()
     gravity = Gtk.Template.Child()
     strong_gravity_mode = Gtk.Template.Child()
+    lin_log_mode = Gtk.Template.Child()
+    convergence_threshold = Gtk.Template.Child()
+    multilevel = Gtk.Template.Child()
+    component_layout = Gtk.Template.Child()
+    initial_layout = Gtk.Template.Child()
+    layout_seed = Gtk.Template.Child()
+    layout_threads = Gtk.Template.Child()
+    live_layout = Gtk.Template.Child()
+    warm_start = Gtk.Template.Child()
+    warm_start_iterations = Gtk.Template.Child()
+    pin_unchanged_nodes = Gtk.Template.Child()
+    watch_packages = Gtk.Template.Child()
+    orphan_threshold = Gtk.Template.Child()
+    install_chains = Gtk.Template.Child()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -19,6 +39,14 @@ class Preferences(Adw.PreferencesDialog):
             'value',
             Gio.SettingsBindFlags.DEFAULT
         )
+        self.graph_source.set_selected(GRAPH_SOURCES.index(self.settings.get_string('graph-source')))
+        self.graph_source.connect('notify::selected', self._on_graph_source_selected)
+        self.settings.bind(
+            'lin-log-mode',
+            self.lin_log_mode,
+            'active',
+            Gio.SettingsBindFlags.DEFAULT
+        )
         self.settings.bind(
             'gravity',
             self.gravity,
@@ -31,3 +59,83 @@ class Preferences(Adw.PreferencesDialog):
             'active',
             Gio.SettingsBindFlags.DEFAULT
         )
+        self.settings.bind(
+            'convergence-threshold',
+            self.convergence_threshold,
+            'value',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'multilevel',
+            self.multilevel,
+            'active',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'component-layout',
+            self.component_layout,
+            'active',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.initial_layout.set_selected(INITIAL_LAYOUTS.index(self.settings.get_string('initial-layout')))
+        self.initial_layout.connect('notify::selected', self._on_initial_layout_selected)
+        self.settings.bind(
+            'layout-seed',
+            self.layout_seed,
+            'value',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'layout-threads',
+            self.layout_threads,
+            'value',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'live-layout',
+            self.live_layout,
+            'active',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'warm-start',
+            self.warm_start,
+            'active',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'warm-start-iterations',
+            self.warm_start_iterations,
+            'value',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'pin-unchanged-nodes',
+            self.pin_unchanged_nodes,
+            'active',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'watch-packages',
+            self.watch_packages,
+            'active',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'orphan-threshold',
+            self.orphan_threshold,
+            'value',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+        self.settings.bind(
+            'install-chains',
+            self.install_chains,
+            'value',
+            Gio.SettingsBindFlags.DEFAULT
+        )
+
+    def _on_initial_layout_selected(self, row, _):
+        self.settings.set_string('initial-layout', INITIAL_LAYOUTS[row.get_selected()])
+
+    def _on_graph_source_selected(self, row, _):
+        self.settings.set_string('graph-source', GRAPH_SOURCES[row.get_selected()])
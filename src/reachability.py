@@ -0,0 +1,206 @@
+from array import array
+from bisect import bisect_right
+
+
+class ReachabilityIndex:
+    """Transitive dependencies and dependents of every node of a DependencyGraph.
+
+    Dependency cycles are condensed into strongly connected components,
+    numbered so that a component only depends on lower numbered ones.  The
+    condensed graph is a DAG, labelled in each direction with intervals
+    (Agrawal, Borgida and Jagadish): a depth-first spanning forest numbers
+    the components in postorder, so that every tree covers a range of
+    numbers, and the components a component reaches are the union of its
+    own range and the ranges its other edges lead to.  Packages depending
+    on the same hubs share most of those ranges, which merge, so labels
+    stay short where per-component bitsets would grow with the square of
+    the graph.
+
+    depends_on() is a binary search in one label; dependencies() and
+    dependents() cost time proportional to the number of packages they
+    return.
+    """
+
+    def __init__(self, graph):
+        self.scc, scc_count = _condense(graph)
+
+        # Members of every component, in CSR form
+        self.scc_indptr = array('i', bytes(4 * (scc_count + 1)))
+        for c in self.scc:
+            self.scc_indptr[c + 1] += 1
+        for c in range(scc_count):
+            self.scc_indptr[c + 1] += self.scc_indptr[c]
+        self.scc_nodes = array('i', bytes(4 * len(graph)))
+        cursor = self.scc_indptr[:-1]
+        for node, c in enumerate(self.scc):
+            self.scc_nodes[cursor[c]] = node
+            cursor[c] += 1
+
+        scc = self.scc
+        dependencies = [set() for _ in range(scc_count)]
+        dependents = [set() for _ in range(scc_count)]
+        for i, j in graph.edges():
+            if scc[i] != scc[j]:
+                dependencies[scc[i]].add(scc[j])
+                dependents[scc[j]].add(scc[i])
+
+        # Dependencies have lower numbers: label them first, and go down
+        # from the top for dependents.
+        self._down = _IntervalLabels(dependencies, range(scc_count))
+        self._up = _IntervalLabels(dependents, reversed(range(scc_count)))
+
+    def members(self, c):
+        """Nodes of strongly connected component c"""
+        return self.scc_nodes[self.scc_indptr[c]:self.scc_indptr[c + 1]]
+
+    def depends_on(self, node, other):
+        """Whether `node` needs `other`, directly or through other packages"""
+        return node != other and self._down.reaches(self.scc[node], self.scc[other])
+
+    def dependencies(self, node):
+        """Every package `node` needs, directly or not"""
+        return self._expand(self._down, node)
+
+    def dependents(self, node):
+        """Every package that needs `node`, directly or not"""
+        return self._expand(self._up, node)
+
+    def _expand(self, labels, node):
+        nodes = []
+        for c in labels.reached(self.scc[node]):
+            nodes.extend(self.members(c))
+        nodes.remove(node)
+        return nodes
+
+
+class _IntervalLabels:
+    """Interval labels of a DAG given as per-vertex child sets.
+
+    `order` must list every vertex after all of its children.
+    """
+
+    def __init__(self, children, order):
+        count = len(children)
+        self.post = array('i', bytes(4 * count))
+        self.by_post = array('i', bytes(4 * count))
+        self.labels = [None] * count
+        order = list(order)
+
+        # Postorder numbers of a depth-first forest, started from the
+        # vertices nothing leads to.  The subtree of a vertex is numbered
+        # from the next free number when it is entered to its own number.
+        tree_low = array('i', bytes(4 * count))
+        visited = bytearray(count)
+        number = 0
+        for root in reversed(order):
+            if visited[root]:
+                continue
+            visited[root] = 1
+            tree_low[root] = number
+            work = [(root, iter(children[root]))]
+            while work:
+                vertex, pending = work[-1]
+                for child in pending:
+                    if not visited[child]:
+                        visited[child] = 1
+                        tree_low[child] = number
+                        work.append((child, iter(children[child])))
+                        break
+                else:
+                    work.pop()
+                    self.post[vertex] = number
+                    self.by_post[number] = vertex
+                    number += 1
+
+        # A vertex reaches its own subtree, plus whatever its children
+        # reach through edges that leave it.
+        for vertex in order:
+            intervals = [(tree_low[vertex], self.post[vertex])]
+            for child in children[vertex]:
+                label = self.labels[child]
+                intervals.extend(zip(label[0::2], label[1::2]))
+            self.labels[vertex] = _merge(intervals)
+
+    def reaches(self, vertex, other):
+        label = self.labels[vertex]
+        post = self.post[other]
+        k = bisect_right(label, post)
+        # Inside an interval when the search lands between a start and its end
+        return k % 2 == 1 or (k > 0 and label[k - 1] == post)
+
+    def reached(self, vertex):
+        """Every vertex `vertex` reaches, itself included"""
+        label = self.labels[vertex]
+        by_post = self.by_post
+        for k in range(0, len(label), 2):
+            yield from by_post[label[k]:label[k + 1] + 1]
+
+
+def _merge(intervals):
+    # Sorted, coalesced and flattened to [start, end, start, end, ...]
+    intervals.sort()
+    merged = array('i')
+    for start, end in intervals:
+        if merged and start <= merged[-1] + 1:
+            if end > merged[-1]:
+                merged[-1] = end
+        else:
+            merged.append(start)
+            merged.append(end)
+    return merged
+
+
+def _condense(graph):
+    """Number the strongly connected components of `graph`.
+
+    Iterative Tarjan.  Components are numbered as they complete, and a
+    component completes only after everything it reaches, which gives
+    dependencies the lower numbers.  Returns the component of every node
+    and the number of components.
+    """
+    node_count = len(graph)
+    indptr, indices = graph.out_indptr, graph.out_indices
+    scc = array('i', [-1]) * node_count
+    order = array('i', [-1]) * node_count
+    low = array('i', bytes(4 * node_count))
+    on_stack = bytearray(node_count)
+    stack = []
+    counter = 0
+    scc_count = 0
+
+    for root in range(node_count):
+        if order[root] != -1:
+            continue
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [(root, indptr[root])]
+        while work:
+            node, k = work[-1]
+            if k < indptr[node + 1]:
+                work[-1] = (node, k + 1)
+                target = indices[k]
+                if order[target] == -1:
+                    order[target] = low[target] = counter
+                    counter += 1
+                    stack.append(target)
+                    on_stack[target] = 1
+                    work.append((target, indptr[target]))
+                elif on_stack[target] and order[target] < low[node]:
+                    low[node] = order[target]
+                continue
+
+            work.pop()
+            if work and low[node] < low[work[-1][0]]:
+                low[work[-1][0]] = low[node]
+            if low[node] == order[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    scc[member] = scc_count
+                    if member == node:
+                        break
+                scc_count += 1
+
+    return scc, scc_count
@@ -0,0 +1,158 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+from gi.repository import GLib
+
+from .state_manager import GraphState
+
+PRIORITY_HIGH = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_LOW = 2
+
+# Longest stretch, in seconds, the main loop spends handing out results
+# before it lets GTK draw and handle input again.
+FLUSH_BUDGET = 0.01
+
+
+class Job:
+    """A unit of background work, as returned by JobScheduler.submit()"""
+
+    def __init__(self, scheduler, name, func, priority, on_done, on_result):
+        self.name = name
+        self.func = func
+        self.priority = priority
+        self.on_done = on_done
+        self.on_result = on_result
+        self.cancelled = False
+        self._scheduler = scheduler
+        self._cancel_callbacks = []
+
+    def cancel(self):
+        self.cancelled = True
+        for callback in self._cancel_callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """Call `callback` when the job is cancelled, e.g. to stop a subprocess"""
+        self._cancel_callbacks.append(callback)
+        if self.cancelled:
+            callback()
+
+    def deliver(self, value):
+        """Hand a partial result to on_result on the main loop, from the worker thread"""
+        self._scheduler._post(self, 'result', value)
+
+
+class JobScheduler:
+    """Runs background jobs on worker threads and reports back on the main loop.
+
+    Jobs run in priority order, lowest value first.  Submitting a job under
+    the name of one that is still pending or running cancels the older
+    one, so only the newest of them ever reports back.  Everything a job
+    produces, partial results from Job.deliver() as well as the return
+    value of its function for on_done, reaches the main loop in batches
+    of at most FLUSH_BUDGET seconds of work.  Progress is announced
+    through the job-* signals of GraphState.
+
+    submit() and cancel() are meant to be called from the main loop.
+    """
+
+    def __init__(self, state: GraphState, workers=2):
+        self.state = state
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._queue = []
+        self._order = itertools.count()
+        self._jobs = {}
+        self._outbox = []
+        self._flush_pending = False
+
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, name, func, priority=PRIORITY_DEFAULT, on_done=None, on_result=None):
+        """Run func(job) on a worker thread and pass its return value to on_done"""
+        job = Job(self, name, func, priority, on_done, on_result)
+        with self._lock:
+            superseded = self._jobs.get(name)
+            self._jobs[name] = job
+            heapq.heappush(self._queue, (priority, next(self._order), job))
+            self._wakeup.notify()
+
+        if superseded is not None:
+            self._cancel(superseded)
+        return job
+
+    def cancel(self, *names):
+        """Cancel the pending or running jobs with the given names"""
+        with self._lock:
+            jobs = [self._jobs.pop(name) for name in names if name in self._jobs]
+        for job in jobs:
+            self._cancel(job)
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            self._cancel(job)
+
+    def _cancel(self, job):
+        job.cancel()
+        self.state.emit('job-cancelled', job.name)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._wakeup.wait()
+                _, _, job = heapq.heappop(self._queue)
+            if job.cancelled:
+                continue
+
+            self._post(job, 'started', None)
+            try:
+                value = job.func(job)
+            except Exception:
+                traceback.print_exc()
+                self._post(job, 'failed', None)
+            else:
+                self._post(job, 'done', value)
+
+    def _post(self, job, kind, value):
+        with self._lock:
+            self._outbox.append((job, kind, value))
+            if self._flush_pending:
+                return
+            self._flush_pending = True
+        GLib.idle_add(self._flush)
+
+    def _flush(self):
+        deadline = time.monotonic() + FLUSH_BUDGET
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._outbox:
+                    self._flush_pending = False
+                    return False
+                job, kind, value = self._outbox.pop(0)
+                if kind in ('done', 'failed') and self._jobs.get(job.name) is job:
+                    del self._jobs[job.name]
+
+            if job.cancelled:
+                continue
+            if kind == 'started':
+                self.state.emit('job-started', job.name)
+            elif kind == 'result':
+                job.on_result(value)
+            elif kind == 'done':
+                if job.on_done is not None:
+                    job.on_done(value)
+                self.state.emit('job-finished', job.name)
+            else:
+                self.state.emit('job-failed', job.name)
+
+        # Out of time, carry on in the next main loop iteration.
+        return True
@@ -6,14 +6,18 @@ class GraphState(GObject.Object):
     """Centralized state management for the graph application"""
     
     __gsignals__ = {
-        'node-hovered': (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        'node-hovered': (GObject.SignalFlags.RUN_FIRST, None, (int,)),
         'node-unhovered': (GObject.SignalFlags.RUN_FIRST, None, ()),
-        'node-selected': (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        'node-selected': (GObject.SignalFlags.RUN_FIRST, None, (int,)),
         'node-deselected': (GObject.SignalFlags.RUN_FIRST, None, ()),
         'regenerate-requested': (GObject.SignalFlags.RUN_FIRST, None, ()),
         'regenerate-progress': (GObject.SignalFlags.RUN_FIRST, None, ()),
         'regenerate-complete': (GObject.SignalFlags.RUN_FIRST, None, ()),
         'show-orphans-requested': (GObject.SignalFlags.RUN_FIRST, None, ()),
+        'job-started': (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        'job-finished': (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        'job-cancelled': (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        'job-failed': (GObject.SignalFlags.RUN_FIRST, None, (str,)),
     }
 
     def __init__(self):
@@ -27,10 +31,10 @@ class GraphState(GObject.Object):
         return self._hovered_node
 
     @hovered_node.setter
-    def hovered_node(self, node: Optional[str]):
+    def hovered_node(self, node: Optional[int]):
         if node != self._hovered_node:
             self._hovered_node = node
-            if node:
+            if node is not None:
                 self.emit('node-hovered', node)
             else:
                 self.emit('node-unhovered')
@@ -40,10 +44,10 @@ class GraphState(GObject.Object):
         return self._selected_node
 
     @selected_node.setter
-    def selected_node(self, node: Optional[str]):
+    def selected_node(self, node: Optional[int]):
         if node != self._selected_node:
             self._selected_node = node
-            if node:
+            if node is not None:
                 self.emit('node-selected', node)
             else:
                 self.emit('node-deselected')
@@ -26,4 +26,9 @@ def get_pkg_version_from_node(node: str) -> str:
 def get_pkg_arch_from_node(node: str) -> str:
     """Extract the package architecture from a node string."""
     parts = node.split(':')
-    return parts[-1] if len(parts) > 1 else 'Unknown'
\ No newline at end of file
+    return parts[-1] if len(parts) > 1 else 'Unknown'
+
+
+def get_pkg_id_from_node(node: str) -> str:
+    """Extract the {name}:{arch} identity of a node, which survives upgrades."""
+    return f"{get_pkg_name_from_node(node)}:{get_pkg_arch_from_node(node)}"
\ No newline at end of file
@@ -18,7 +18,7 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 import re
 import os
-import pickle
+import random
 import threading
 
 from gi.repository import Adw
@@ -26,8 +26,13 @@ from gi.repository import Gtk
 from gi.repository import GLib
 from gi.repository import Gio
 
-from .apt_dependency import build_dependency_graph
-from .fa2_adjustSize import ForceAtlas2
+from .apt_dependency import (DPKG_STATUS, EXTENDED_STATES, BuildProgress, available_graph_sources,
+                             build_dependency_graph, build_dependency_graph_from_status, changed_nodes,
+                             diff_dependency_graphs)
+from .fa2_adjustSize import seed_positions
+from .graph_cache import load_graph, remove_graph, write_graph
+from .layout_job import WARM_START_SPEED, LayoutJob, layout_options, warm_start_positions
+from .scheduler import JobScheduler, PRIORITY_HIGH, PRIORITY_LOW
 from .utils import *
 
 from .panel import Panel
@@ -35,9 +40,19 @@ from .loading_page import LoadingPage
 from .canvas import Canvas
 from .search_row import SearchRow
 
-CACHE_PATH = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'graphite')
-NODE_GRAPH_CACHE = os.path.join(CACHE_PATH, 'node_graph.pkl')
-POS_DICT_CACHE = os.path.join(CACHE_PATH, 'pos_dict.pkl')
+# Optional .json or .csv path that receives the timings of every layout run
+LAYOUT_STATS_PATH = os.getenv('GRAPHITE_LAYOUT_STATS')
+
+# Search rows handed to the main loop at a time while the index is built
+SEARCH_INDEX_CHUNK = 200
+# Seconds the dpkg state has to stay quiet before the graph is refreshed;
+# one apt run rewrites the status file once per package it touches.
+REFRESH_DELAY = 2
+# Packages with more dependencies and dependents than this keep their place
+# when the layout is refreshed around them.  A few changed edges barely
+# pull on them, and moving them would drag their whole neighbourhood into
+# the refinement.
+REFRESH_HUB_DEGREE = 50
 
 @Gtk.Template(resource_path='/io/github/cacheuseonly/graphite/ui/window.ui')
 class GraphiteWindow(Adw.ApplicationWindow):
@@ -50,6 +65,7 @@ class GraphiteWindow(Adw.ApplicationWindow):
     panel: Panel = Gtk.Template.Child()
     content_stack = Gtk.Template.Child()
     loading_page: LoadingPage = Gtk.Template.Child()
+    error_page = Gtk.Template.Child()
     canvas: Canvas = Gtk.Template.Child()
 
     search_page = Gtk.Template.Child()
@@ -64,7 +80,13 @@ class GraphiteWindow(Adw.ApplicationWindow):
     def __init__(self, state, **kwargs):
         super().__init__(**kwargs)
         self.node_graph = None
-        self.pos_dict = {}
+        self._loading = False
+        self._indexing = False
+        self._refresh_source = None
+
+        # Newest layout snapshot not yet shown, handed over from the layout thread
+        self._snapshot_lock = threading.Lock()
+        self._snapshot = None
 
         self.setting = Gio.Settings.new('io.github.cacheuseonly.graphite.common')
 
@@ -74,55 +96,338 @@ class GraphiteWindow(Adw.ApplicationWindow):
 
         self.state.connect('regenerate-requested', self._on_regenerate_requested)
         self.state.connect('regenerate-progress', self._on_regenerate_progress)
-        self.state.connect('regenerate-complete', self._on_regenerate_complete)
+        self.state.connect('job-finished', self._on_job_finished)
+        self.state.connect('job-failed', self._on_job_failed)
+        self.scheduler = JobScheduler(self.state)
 
         self.search_bar.connect("notify::search-mode-enabled", self._on_search_mode_enabled)
         self.search_results_list.set_filter_func(self.search_filter)
+        self.connect('close-request', self._on_close_request)
+
+        # Kept referenced, a monitor stops when it is collected.
+        self._monitors = []
+        for path in (DPKG_STATUS, EXTENDED_STATES):
+            monitor = Gio.File.new_for_path(path).monitor_file(Gio.FileMonitorFlags.NONE, None)
+            monitor.connect('changed', self._on_package_state_changed)
+            self._monitors.append(monitor)
 
-        threading.Thread(target=self.load_data, daemon=True).start()
+        self._start_loading()
 
-    def load_data(self):
+    def _start_loading(self, regenerate=False):
+        self._loading = True
         self.state.emit('regenerate-progress')
+        self.loading_page.show_build_times(None)
+        # Whatever the previous load still had in flight is stale now.
+        self.scheduler.cancel('layout', 'cache-write', 'stats', 'search-index', 'query-index',
+                              'refresh', 'refresh-layout')
+        source = self._graph_source()
+        self.scheduler.submit('graph', lambda job: self._load_graph(job, source, regenerate),
+                              priority=PRIORITY_HIGH,
+                              on_done=self._on_graph_loaded)
+
+    def _graph_source(self):
+        source = self.setting.get_string('graph-source')
+        if source not in available_graph_sources():
+            # python-apt is missing.
+            source = 'dpkg'
+        return source
+
+    def _build_graph(self, source, progress):
+        if source == 'dpkg':
+            return build_dependency_graph_from_status(progress=progress)
+        return build_dependency_graph(progress)
+
+    def _load_graph(self, _job, source, regenerate):
+        # Runs on a scheduler thread.  Returns the cached graph, laid out,
+        # and None twice, or the graph, the build phase times and the
+        # previous layout to warm start from when the graph had to be built.
+        # Regenerating always builds, from the cached graph if any.
+        previous_graph = load_graph()
+        if regenerate:
+            remove_graph()
+        elif previous_graph is not None:
+            return previous_graph, None, None
+        progress = BuildProgress(self.loading_page.report_build_progress)
+        return self._build_graph(source, progress), progress.phaseTimes, previous_graph
+
+    def _on_graph_loaded(self, result):
+        self.node_graph, build_times, previous_graph = result
+        if build_times is None:
+            self.on_loading_complete()
+            self._start_indexing()
+            if self.setting.get_boolean('watch-packages'):
+                # Packages may have changed while Graphite was closed.
+                self._refresh_graph()
+            return
+
+        self.loading_page.show_build_times(build_times)
+        seed = self.setting.get_int('layout-seed')
+        layout_job = self._layout_job(seed)
+        kwargs = {
+            'progress': self.loading_page.report_layout_progress,
+            'snapshot': self._on_layout_snapshot if self.setting.get_boolean('live-layout') else None,
+            'roots': [node for node in self.node_graph.nodes() if self.node_graph.manual[node]],
+        }
+        warm_start = previous_graph is not None and self.setting.get_boolean('warm-start')
+        if warm_start:
+            kwargs['iterations'] = self.setting.get_int('warm-start-iterations')
+            kwargs['initialSpeed'] = WARM_START_SPEED
+        else:
+            kwargs['iterations'] = self.setting.get_int('iterations')
+        pin_unchanged = self.setting.get_boolean('pin-unchanged-nodes')
+        node_graph = self.node_graph
+
+        def run_layout(job):
+            job.on_cancel(layout_job.cancel)
+            if warm_start:
+                pos, unchanged = warm_start_positions(node_graph, previous_graph, random.Random(seed))
+                kwargs['pos'] = pos
+                if pin_unchanged:
+                    kwargs['fixed'] = unchanged
+            return layout_job.run(node_graph, **kwargs)
+
+        self.scheduler.submit('layout', run_layout,
+                              on_done=lambda positions: self._on_layout_done(layout_job, positions))
+
+    def _layout_job(self, seed):
+        return LayoutJob(**layout_options(strongGravityMode=self.setting.get_boolean('strong-gravity-mode'),
+                                          gravity=self.setting.get_double('gravity'),
+                                          linLogMode=self.setting.get_boolean('lin-log-mode'),
+                                          convergenceThreshold=self.setting.get_double('convergence-threshold'),
+                                          multilevel=self.setting.get_boolean('multilevel'),
+                                          componentLayout=self.setting.get_boolean('component-layout'),
+                                          initialLayout=self.setting.get_string('initial-layout'),
+                                          seed=seed,
+                                          threads=self.setting.get_int('layout-threads')))
+
+    def _on_layout_done(self, layout_job, positions):
+        if positions is None:
+            # Cancelled; a worker that died raised, and the job failed.
+            return
+        self.node_graph.set_positions(positions)
+        self._report_layout(layout_job.iterationsRun, layout_job.refineIterationsRun, layout_job.stopReason)
+        self.on_loading_complete()
+
+        self._write_cache_later()
+        if LAYOUT_STATS_PATH:
+            self.scheduler.submit('stats', lambda _job: layout_job.stats.write(LAYOUT_STATS_PATH),
+                                  priority=PRIORITY_LOW)
+        self._start_indexing()
+
+    def _start_indexing(self):
+        self._indexing = True
+        self._index_queries()
+        self.search_results_list.remove_all()
+        names = self.node_graph.names
+
+        def index(job):
+            # Only the row data is prepared here, the rows themselves are
+            # widgets and get created on the main loop.
+            for start in range(0, len(names), SEARCH_INDEX_CHUNK):
+                if job.cancelled:
+                    return
+                job.deliver([(node, get_pkg_name_from_node(names[node]), get_pkg_version_from_node(names[node]))
+                             for node in range(start, min(start + SEARCH_INDEX_CHUNK, len(names)))])
+
+        self.scheduler.submit('search-index', index,
+                              priority=PRIORITY_LOW,
+                              on_result=self._append_search_rows)
+
+    def _index_queries(self):
+        # Built off the main loop; until the job is done, selections show
+        # direct relations only and get updated once it finishes.
+        node_graph = self.node_graph
+
+        def index(job):
+            node_graph.reachability()
+            if not job.cancelled:
+                node_graph.install_paths()
+
+        self.scheduler.submit('query-index', index, priority=PRIORITY_LOW)
+
+    def _append_search_rows(self, rows):
+        for node, name, version in rows:
+            self.search_results_list.append(SearchRow(node, name, version))
+
+    def _on_package_state_changed(self, _monitor, _file, _other_file, _event):
+        if not self.setting.get_boolean('watch-packages'):
+            return
+        # Restart the wait, so that a whole apt run results in one refresh.
+        if self._refresh_source is not None:
+            GLib.source_remove(self._refresh_source)
+        self._refresh_source = GLib.timeout_add_seconds(REFRESH_DELAY, self._refresh_graph)
+
+    def _refresh_graph(self):
+        if self._loading:
+            # Try again once the running load is done.
+            return True
+        self._refresh_source = None
+        if self.node_graph is None:
+            # The load failed, and loading again reads the packages anyway.
+            return False
+        source = self._graph_source()
+        old_graph = self.node_graph
+        seed = self.setting.get_int('layout-seed')
+        self.scheduler.submit('refresh', lambda _job: self._diff_graph(old_graph, source, seed),
+                              on_done=lambda result: self._on_graph_refreshed(old_graph, result))
+        return False
+
+    def _diff_graph(self, old_graph, source, seed):
+        # Runs on a scheduler thread.  Builds the graph again and returns it
+        # with its diff against old_graph and the packages whose dependencies
+        # changed, or None if no package did.  Packages that stayed keep their
+        # place and new ones are placed next to their neighbours.
+        new_graph = self._build_graph(source, BuildProgress())
+        diff = diff_dependency_graphs(old_graph, new_graph)
+        if not diff:
+            return None
+
+        pos = {node: (old_graph.x[old_node], old_graph.y[old_node]) for old_node, node in diff.kept.items()}
+        pos = seed_positions(new_graph, pos, random.Random(seed))
+        new_graph.set_positions([pos[node] for node in new_graph.nodes()])
+        return new_graph, diff, changed_nodes(old_graph, new_graph, diff)
+
+    def _on_graph_refreshed(self, old_graph, result):
+        """Bring the graph on screen up to date with the packages that changed.
+
+        The refresh job has done the comparison and placed the new graph;
+        here it is swapped in and only the packages whose dependencies
+        changed are laid out again.
+        """
+        if result is None or old_graph is not self.node_graph:
+            # Nothing changed, or a load has replaced the graph meanwhile.
+            return
+        new_graph, diff, affected = result
+
+        # Node ids are not stable between graphs, the selection has to be
+        # carried over.
+        selected = self.state.selected_node
+        if selected is not None:
+            selected = diff.kept.get(selected)
+        self.state.selected_node = None
+        self.state.hovered_node = None
+
+        self.node_graph = new_graph
+        self._index_queries()
+        self.canvas.update_graph(new_graph)
+        self.panel.set_node_graph(new_graph)
+        self.state.selected_node = selected
+        self._update_search_rows(diff)
+        if affected:
+            self._refresh_layout(affected, diff.added)
+        else:
+            self._write_cache_later()
+
+    def _update_search_rows(self, diff):
+        if self._indexing:
+            # The index being built still lists the old packages.
+            self._start_indexing()
+            return
+        names = self.node_graph.names
+        row = self.search_results_list.get_first_child()
+        while row is not None:
+            next_row = row.get_next_sibling()
+            node = diff.kept.get(row.pkg_node)
+            if node is None:
+                self.search_results_list.remove(row)
+            else:
+                if row.pkg_node in diff.upgraded:
+                    row.set_subtitle(get_pkg_version_from_node(names[node]))
+                row.pkg_node = node
+            row = next_row
+        self._append_search_rows([(node, get_pkg_name_from_node(names[node]), get_pkg_version_from_node(names[node]))
+                                  for node in diff.added])
+
+    def _refresh_layout(self, affected, added):
+        """Lay out the affected packages again, against their fixed neighbours"""
+        node_graph = self.node_graph
+        moving = {node for node in affected if node_graph.weight[node] <= REFRESH_HUB_DEGREE}
+        moving.update(added)
+        if not moving:
+            self._write_cache_later()
+            return
+        neighbors = set()
+        for node in moving:
+            neighbors.update(node_graph.predecessors(node))
+            neighbors.update(node_graph.successors(node))
+        fixed = neighbors - moving
+        nodes = list(moving | fixed)
+        subgraph = node_graph.subgraph(nodes)
+        fixed = [i for i, node in enumerate(nodes) if node in fixed]
+
+        layout_job = self._layout_job(self.setting.get_int('layout-seed'))
+        iterations = self.setting.get_int('warm-start-iterations')
+
+        def run_layout(job):
+            job.on_cancel(layout_job.cancel)
+            return layout_job.run(subgraph, pos=subgraph.positions(), fixed=fixed,
+                                  iterations=iterations, initialSpeed=WARM_START_SPEED)
+
+        self.scheduler.submit('refresh-layout', run_layout,
+                              on_done=lambda positions: self._on_refresh_layout_done(node_graph, nodes, positions))
+
+    def _on_refresh_layout_done(self, node_graph, nodes, positions):
+        if positions is None or node_graph is not self.node_graph:
+            # Cancelled, or a later refresh has replaced the graph.
+            return
+        for node, (x, y) in zip(nodes, positions):
+            node_graph.x[node] = x
+            node_graph.y[node] = y
+        self.canvas.positions_changed()
+        self._write_cache_later()
+
+    def _write_cache_later(self):
+        node_graph = self.node_graph
+        self.scheduler.submit('cache-write', lambda _job: write_graph(node_graph),
+                              priority=PRIORITY_LOW)
+
+    def _on_layout_snapshot(self, positions):
+        # Runs on the scheduler thread waiting for the layout.  Only the newest snapshot is kept and
+        # at most one hand-off is queued, so a slow redraw drops snapshots
+        # instead of holding up the layout.
+        with self._snapshot_lock:
+            pending = self._snapshot is not None
+            self._snapshot = positions
+        if not pending:
+            GLib.idle_add(self._show_layout_snapshot)
+
+    def _show_layout_snapshot(self):
+        with self._snapshot_lock:
+            positions, self._snapshot = self._snapshot, None
+        if positions is None or self.node_graph is None or len(positions) != len(self.node_graph):
+            # Nothing new, or left over from a graph that was replaced or failed.
+            return False
+
+        self.node_graph.set_positions(positions)
+        if self.canvas.node_graph is not self.node_graph:
+            self.canvas.set_data(self.node_graph)
+            self.panel.set_node_graph(self.node_graph)
+            self.content_stack.set_visible_child(self.canvas)
+        else:
+            self.canvas.positions_changed()
+        self.canvas.set_layout_progress(self.loading_page.progress_bar.get_fraction())
+        return False
 
-        try:
-            with open(NODE_GRAPH_CACHE, 'rb') as f:
-                self.node_graph = pickle.load(f)
-            with open(POS_DICT_CACHE, 'rb') as f:
-                self.pos_dict = pickle.load(f)
-        except (FileNotFoundError, pickle.UnpicklingError):
-            self.node_graph = build_dependency_graph()
-
-            fa2 = ForceAtlas2(adjustSizes=True,
-                              scalingRatio=1,
-                              strongGravityMode=self.setting.get_boolean('strong-gravity-mode'),
-                              gravity=self.setting.get_double('gravity'),
-                              outboundAttractionDistribution=True,
-                              verbose=False,
-                              )
-            self.pos_dict = fa2.forceatlas2_networkx_layout(self.node_graph,
-                                                            iterations=self.setting.get_int('iterations'),
-                                                            progress_bar=self.loading_page.progress_bar
-                                                            )
-
-            os.makedirs(CACHE_PATH, exist_ok=True)
-            with open(NODE_GRAPH_CACHE, 'wb') as f:
-                pickle.dump(self.node_graph, f)
-            with open(POS_DICT_CACHE, 'wb') as f:
-                pickle.dump(self.pos_dict, f)
-
-        for node in self.node_graph.nodes:
-            self.search_results_list.append(SearchRow(
-                node,
-                get_pkg_name_from_node(node),
-                get_pkg_version_from_node(node)
-            ))
-
-        GLib.idle_add(self.on_loading_complete)
+    def _report_layout(self, iterations, refine_iterations, reason):
+        progress_bar = self.loading_page.progress_bar
+        progress_bar.set_fraction(1.0)
+        refined = f", refined in {refine_iterations} more" if refine_iterations else ""
+        if reason == 'converged':
+            progress_bar.set_text(f"Converged after {iterations} iterations{refined}")
+        else:
+            progress_bar.set_text(f"Stopped after {iterations} iterations{refined}")
+        return False
 
     def on_loading_complete(self):
-        self.canvas.set_data(self.node_graph, self.pos_dict)
+        if self.canvas.node_graph is self.node_graph:
+            # The graph is already on screen from the live layout.
+            self.canvas.positions_changed()
+        else:
+            self.canvas.set_data(self.node_graph)
+        self.canvas.set_layout_progress(None)
         self.panel.set_node_graph(self.node_graph)
         self.content_stack.set_visible_child(self.canvas)
+        self._loading = False
         self.state.emit('regenerate-complete')
 
         return False
@@ -131,17 +436,37 @@ class GraphiteWindow(Adw.ApplicationWindow):
         self.content_stack.set_visible_child(self.loading_page)
         self.state.selected_node = None
         self.state.hovered_node = None
-
-        os.remove(os.path.join(CACHE_PATH, 'node_graph.pkl'))
-        os.remove(os.path.join(CACHE_PATH, 'pos_dict.pkl'))
-
-        threading.Thread(target=self.load_data, daemon=True).start()
+        self._start_loading(regenerate=True)
+
+    def _on_close_request(self, _window):
+        for monitor in self._monitors:
+            monitor.cancel()
+        if self._refresh_source is not None:
+            GLib.source_remove(self._refresh_source)
+            self._refresh_source = None
+        self.scheduler.cancel_all()
+        return False
 
     def _on_regenerate_progress(self, _state):
         self.search_button.set_sensitive(False)
 
-    def _on_regenerate_complete(self, _state):
-        self.search_button.set_sensitive(True)
+    def _on_job_finished(self, _state, name):
+        if name == 'search-index':
+            self._indexing = False
+            self.search_button.set_sensitive(True)
+
+    def _on_job_failed(self, _state, name):
+        # The scheduler has printed the traceback.
+        if name == 'graph':
+            description = "Reading the installed packages failed."
+        elif name == 'layout':
+            description = "Laying out the dependency graph failed."
+        else:
+            return
+        self.node_graph = None
+        self._loading = False
+        self.error_page.set_description(description)
+        self.content_stack.set_visible_child(self.error_page)
 
     @Gtk.Template.Callback()
     def _on_collapse_clicked(self, _button):
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import the sources as the benchmarks do, from the top of the tree.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,116 @@
+from src.apt_dependency import build_dependency_graph_from_status, changed_nodes, diff_dependency_graphs
+
+STATUS = """\
+Package: editor
+Status: install ok installed
+Architecture: amd64
+Version: 1.0
+Section: editors
+Depends: libeditor (>= 1.0) | libalt, mail-transport-agent
+
+Package: libeditor
+Status: install ok installed
+Architecture: amd64
+Version: 1.2
+Depends: libc6
+
+Package: libalt
+Status: install ok installed
+Architecture: amd64
+Version: 3.0
+
+Package: postfix
+Status: install ok installed
+Architecture: amd64
+Version: 3.7
+Provides: mail-transport-agent
+Pre-Depends: adduser
+Depends: libc6
+
+Package: adduser
+Status: install ok installed
+Architecture: all
+Version: 3.134
+
+Package: libc6
+Status: install ok installed
+Architecture: amd64
+Version: 2.36
+
+Package: leftover
+Status: install ok installed
+Architecture: amd64
+Version: 0.1
+Depends: libc6
+
+Package: desktop
+Status: install ok installed
+Architecture: amd64
+Version: 1
+Section: metapackages
+Depends: editor
+
+Package: removed
+Status: deinstall ok config-files
+Architecture: amd64
+Version: 1
+"""
+
+EXTENDED_STATES = "".join(f"Package: {name}\nArchitecture: amd64\nAuto-Installed: 1\n\n"
+                          for name in ('libeditor', 'libalt', 'postfix', 'adduser', 'libc6', 'leftover'))
+
+
+def build_graph(tmp_path, status=STATUS, extended_states=EXTENDED_STATES):
+    (tmp_path / 'status').write_text(status)
+    (tmp_path / 'extended_states').write_text(extended_states)
+    return build_dependency_graph_from_status(tmp_path / 'status', tmp_path / 'extended_states')
+
+
+def named_edges(graph):
+    return {(graph.names[i].split('=')[0], graph.names[j].split('=')[0]) for i, j in graph.edges()}
+
+
+def test_graph_holds_everything_manual_packages_need(tmp_path):
+    graph = build_graph(tmp_path)
+    assert sorted(graph.names) == ['adduser=3.134:amd64', 'editor=1.0:amd64', 'libc6=2.36:amd64',
+                                   'libeditor=1.2:amd64', 'postfix=3.7:amd64']
+    # Dependencies of automatically installed packages are followed; the
+    # unused alternative, packages nothing manual needs and metapackages
+    # are left out.
+    assert named_edges(graph) == {('editor', 'libeditor'), ('editor', 'postfix'), ('libeditor', 'libc6'),
+                                  ('postfix', 'adduser'), ('postfix', 'libc6')}
+    assert [graph.names[node] for node in graph.nodes() if graph.manual[node]] == ['editor=1.0:amd64']
+    weights = {graph.names[node].split('=')[0]: graph.weight[node] for node in graph.nodes()}
+    assert weights == {'editor': 2, 'libeditor': 2, 'postfix': 3, 'adduser': 1, 'libc6': 2}
+
+
+def test_refreshed_graphs_are_diffed_by_package(tmp_path):
+    old = build_graph(tmp_path)
+    # libeditor is upgraded, postfix marked manual, adduser removed and a
+    # new viewer installed.
+    stanzas = [stanza for stanza in STATUS.split("\n\n") if not stanza.startswith("Package: adduser\n")]
+    stanzas.append("Package: viewer\nStatus: install ok installed\nArchitecture: amd64\nVersion: 1\nDepends: libc6\n")
+    status = "\n\n".join(stanzas).replace("Version: 1.2", "Version: 1.3").replace("Pre-Depends: adduser\n", "")
+    extended_states = EXTENDED_STATES.replace("Package: postfix\n", "Package: postfix-unrelated\n")
+    new = build_graph(tmp_path, status, extended_states)
+    old_node = {name.split('=')[0]: i for i, name in enumerate(old.names)}
+    new_node = {name.split('=')[0]: i for i, name in enumerate(new.names)}
+
+    diff = diff_dependency_graphs(old, new)
+    assert diff
+    assert diff.added == [new_node['viewer']]
+    assert diff.removed == [old_node['adduser']]
+    assert diff.upgraded == {old_node['libeditor']: new_node['libeditor']}
+    assert diff.manual_changed == [new_node['postfix']]
+    assert diff.kept == {old_node[name]: new_node[name] for name in ('editor', 'libeditor', 'postfix', 'libc6')}
+
+    # Upgrading libeditor left its dependencies alone.
+    assert changed_nodes(old, new, diff) == {new_node['viewer'], new_node['libc6'], new_node['postfix']}
+
+
+def test_unchanged_packages_give_an_empty_diff(tmp_path):
+    old = build_graph(tmp_path)
+    new = build_graph(tmp_path)
+    diff = diff_dependency_graphs(old, new)
+    assert not diff
+    assert changed_nodes(old, new, diff) == set()
@@ -0,0 +1,91 @@
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+from src import cli, graph_cache
+from tests.test_apt_dependency import STATUS
+
+GRAPHML = '{http://graphml.graphdrawing.org/xmlns}'
+
+
+@pytest.fixture
+def system(tmp_path):
+    # A system root laid out like /, with its dpkg status and APT's auto-installed marks
+    root = tmp_path / 'bookworm'
+    (root / 'var/lib/dpkg').mkdir(parents=True)
+    (root / 'var/lib/apt').mkdir(parents=True)
+    (root / 'var/lib/dpkg/status').write_text(STATUS)
+    (root / 'var/lib/apt/extended_states').write_text(
+        "Package: libc6\nArchitecture: amd64\nAuto-Installed: 1\n")
+    return root
+
+
+def test_output_names(tmp_path, system):
+    assert cli.output_name(None) == 'graphite'
+    assert cli.output_name(str(system)) == 'bookworm'
+    assert cli.output_name(str(system) + os.sep) == 'bookworm'
+    assert cli.output_name(str(system / 'var/lib/dpkg/status')) == 'bookworm'
+    assert cli.output_name(str(tmp_path / 'hosts/web1/status')) == 'web1'
+    assert cli.output_name(str(tmp_path / 'web1.status')) == 'web1'
+
+
+def test_input_files(system, tmp_path):
+    assert cli.input_files(str(system)) == (str(system / 'var/lib/dpkg/status'),
+                                            str(system / 'var/lib/apt/extended_states'))
+    assert cli.input_files(str(tmp_path / 'web1/status')) == (str(tmp_path / 'web1/status'),
+                                                              str(tmp_path / 'web1/extended_states'))
+
+
+@pytest.mark.parametrize('argv', [['-f', 'json,bmp'], ['--size', '20x'], ['-j', '0'],
+                                  ['--initial-layout', 'bogus'], ['--threads', '-1']])
+def test_invalid_arguments_are_rejected(argv):
+    with pytest.raises(SystemExit):
+        cli.parse_args(argv)
+
+
+def test_exports_a_system_root(system, tmp_path):
+    out = tmp_path / 'out'
+    assert cli.main([str(system), '-o', str(out), '-f', 'json, graphml',
+                     '--iterations', '20', '--no-cache']) == 0
+    assert sorted(os.listdir(out)) == ['bookworm.graphml', 'bookworm.json']
+
+    with open(out / 'bookworm.json') as f:
+        exported = json.load(f)
+    packages = {node['package']: node for node in exported['nodes']}
+    assert set(packages) == {'editor', 'libeditor', 'libalt', 'postfix', 'adduser', 'libc6', 'leftover'}
+    assert not packages['libc6']['manual'] and packages['editor']['manual']
+    assert packages['editor']['section'] == 'editors'
+    ids = {node['name']: i for i, node in enumerate(exported['nodes'])}
+    assert [ids[packages['postfix']['name']], ids[packages['adduser']['name']]] in exported['edges']
+    # Laid out, not left at the origin
+    assert len({(node['x'], node['y']) for node in exported['nodes']}) == len(exported['nodes'])
+
+    graph = ElementTree.parse(out / 'bookworm.graphml').getroot().find(GRAPHML + 'graph')
+    assert len(graph.findall(GRAPHML + 'node')) == len(exported['nodes'])
+    assert len(graph.findall(GRAPHML + 'edge')) == len(exported['edges'])
+
+
+def test_cached_layouts_are_reused(system, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(graph_cache, 'CACHE_PATH', str(tmp_path / 'cache'))
+    argv = [str(system), '-o', str(tmp_path / 'out'), '--iterations', '20']
+
+    assert cli.main(argv) == 0
+    assert "reusing the cached layout" not in capsys.readouterr().err
+    with open(tmp_path / 'out/bookworm.json') as f:
+        first = json.load(f)
+
+    assert cli.main(argv) == 0
+    assert "bookworm: reusing the cached layout" in capsys.readouterr().err
+    with open(tmp_path / 'out/bookworm.json') as f:
+        assert json.load(f) == first
+
+
+def test_failed_inputs_are_counted(system, tmp_path, capsys):
+    argv = [str(tmp_path / 'missing'), str(system), '-o', str(tmp_path / 'out'),
+            '--iterations', '20', '--no-cache']
+    assert cli.main(argv) == 1
+    assert "missing: failed" in capsys.readouterr().err
+    # The other input is still exported.
+    assert os.listdir(tmp_path / 'out') == ['bookworm.json']
@@ -0,0 +1,66 @@
+import pickle
+
+import pytest
+
+from src.dependency_graph import DependencyGraph
+
+NAMES = ['app=1:amd64', 'lib=2:amd64', 'libc=3:amd64', 'tool=1:all']
+
+
+def make_graph():
+    # app needs lib twice, as Pre-Depends and Depends, and libc; lib needs libc
+    return DependencyGraph(NAMES, [1, 0, 0, 1], ['admin', 'libs', 'libs', None],
+                           [(0, 1), (0, 1), (0, 2), (1, 2)])
+
+
+def test_dependencies_are_stored_in_both_directions():
+    graph = make_graph()
+    assert len(graph) == 4
+    assert graph.number_of_edges() == 3
+    assert list(graph.edges()) == [(0, 1), (0, 2), (1, 2)]
+    assert list(graph.successors(0)) == [1, 2]
+    assert list(graph.predecessors(2)) == [0, 1]
+    assert list(graph.successors(3)) == list(graph.predecessors(3)) == []
+    assert list(graph.weight) == [2, 2, 2, 0]
+    assert graph.ids['libc=3:amd64'] == 2
+    assert [graph.section_name(node) for node in graph.nodes()] == ['admin', 'libs', 'libs', None]
+    assert graph.adjacency() == (graph.out_indptr, graph.out_indices)
+
+
+def test_subgraphs_keep_the_attributes_of_their_nodes():
+    graph = make_graph()
+    graph.set_positions([(float(i), -float(i)) for i in graph.nodes()])
+    subgraph = graph.subgraph([2, 0])
+    assert subgraph.names == ['libc=3:amd64', 'app=1:amd64']
+    assert list(subgraph.edges()) == [(1, 0)]
+    assert list(subgraph.manual) == [0, 1]
+    # Weights and sizes are those of the whole graph, not recomputed.
+    assert list(subgraph.weight) == [2, 2]
+    assert list(subgraph.size) == [graph.size[2], graph.size[0]]
+    assert subgraph.positions() == [(2.0, -2.0), (0.0, 0.0)]
+
+
+def test_pickled_graphs_leave_the_indexes_out():
+    graph = make_graph()
+    graph.set_positions([(1.0, 2.0)] * 4)
+    graph.reachability()
+    graph.install_paths()
+
+    copy = pickle.loads(pickle.dumps(graph))
+    assert copy.names == graph.names
+    assert copy.ids == graph.ids
+    assert copy.positions() == graph.positions()
+    assert list(copy.edges()) == list(graph.edges())
+    assert copy.reachability(build=False) is None
+    assert copy.install_paths(build=False) is None
+    assert sorted(copy.reachability().dependencies(0)) == [1, 2]
+
+
+def test_graphs_export_to_networkx():
+    pytest.importorskip('networkx')
+    exported = make_graph().to_networkx()
+    assert sorted(exported.edges()) == [('app=1:amd64', 'lib=2:amd64'), ('app=1:amd64', 'libc=3:amd64'),
+                                        ('lib=2:amd64', 'libc=3:amd64')]
+    assert exported.nodes['app=1:amd64'] == {'weight': 2, 'size': make_graph().size[0],
+                                             'manual': True, 'section': 'admin'}
+    assert exported.nodes['tool=1:all'] == {'weight': 0, 'size': make_graph().size[3], 'manual': True}
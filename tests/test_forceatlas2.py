@@ -0,0 +1,359 @@
+import math
+import random
+import types
+
+import pytest
+
+from benchmarks.layout_benchmark import dependency_graph
+from src.fa2_adjustSize import (ForceAtlas2, adjacency_to_edges, available_backends, connected_components, fa2numpy,
+                                fa2util, forceatlas2, networkx_to_adjacency, pack_disks, python_kernels)
+
+# A small tree: 0 depends on 1 and 2, which depend on 3
+ADJACENCY = ([0, 2, 3, 4, 4], [1, 2, 3, 3])
+
+
+def progress_iterations(**kwargs):
+    fa2 = ForceAtlas2(convergenceThreshold=0, verbose=False, seed=0)
+    reports = []
+    fa2.forceatlas2(ADJACENCY, iterations=20, progress=reports.append, **kwargs)
+    return [report.iteration for report in reports]
+
+
+def test_progress_interval_zero_reports_every_iteration():
+    # The start of the layout, every iteration, and the end
+    assert progress_iterations(progressInterval=0) == [0, *range(1, 21), 20]
+
+
+def test_progress_interval_none_disables_reports_during_the_layout():
+    assert progress_iterations(progressInterval=None) == [0, 20]
+    assert progress_iterations(progressInterval=-1) == [0, 20]
+
+
+@pytest.mark.parametrize('convergenceThreshold', [0, 0.05])
+def test_multilevel_reports_the_coarsest_level(convergenceThreshold):
+    adjacency, size = dependency_graph(400)
+    fa2 = ForceAtlas2(multilevel=True, multilevelMinNodes=50, refineIterations=30,
+                      convergenceThreshold=convergenceThreshold, seed=0)
+    fa2.forceatlas2(adjacency, iterations=200, size=size)
+    finerLevels = fa2.stats.levels - 1
+    assert finerLevels > 0
+    if convergenceThreshold:
+        assert fa2.stopReason == 'converged'
+        assert fa2.iterationsRun < 200
+    else:
+        assert fa2.stopReason == 'iterations'
+        assert fa2.iterationsRun == 200
+        assert fa2.refineIterationsRun == 30 * finerLevels
+    assert 0 < fa2.refineIterationsRun <= 30 * finerLevels
+    assert (fa2.stats.iterations, fa2.stats.refineIterations) == (fa2.iterationsRun, fa2.refineIterationsRun)
+    assert len(fa2.stats.iterationTimes) == fa2.iterationsRun + fa2.refineIterationsRun
+
+
+@pytest.mark.parametrize('backend', available_backends())
+def test_layouts_print_nothing_by_default(backend, capsys):
+    # numpy has no Barnes-Hut, asking it for one warns
+    fa2 = ForceAtlas2(backend=backend, barnesHutOptimize=backend != 'numpy', seed=0)
+    fa2.forceatlas2(ADJACENCY, iterations=2)
+    assert capsys.readouterr().out == ''
+
+
+def test_uncompiled_installs_warn(monkeypatch):
+    monkeypatch.setattr(forceatlas2, 'available_backends', lambda: ['python'])
+    with pytest.warns(UserWarning, match='Uncompiled fa2util'):
+        ForceAtlas2(backend='python', seed=0).forceatlas2(ADJACENCY, iterations=2)
+
+
+def test_numpy_backend_warns_that_barnes_hut_is_exact():
+    fa2 = ForceAtlas2(backend='numpy', barnesHutOptimize=True, verbose=False, seed=0)
+    with pytest.warns(RuntimeWarning, match='Barnes-Hut'):
+        fa2.forceatlas2(ADJACENCY, iterations=2)
+
+
+def test_barnes_hut_picks_numpy_only_for_small_graphs(monkeypatch):
+    monkeypatch.setattr(forceatlas2, 'available_backends', lambda: ['numpy', 'python'])
+    limit = forceatlas2.NUMPY_BARNESHUT_MAX_NODES
+    assert forceatlas2.default_backend(limit) == 'numpy'
+    assert forceatlas2.default_backend(limit + 1) == 'python'
+    assert forceatlas2.default_backend(limit + 1, barnesHutOptimize=False) == 'numpy'
+
+
+def test_picking_the_numpy_backend_does_not_warn(monkeypatch, recwarn):
+    monkeypatch.setattr(forceatlas2, 'available_backends', lambda: ['numpy', 'python'])
+    fa2 = ForceAtlas2(barnesHutOptimize=True, verbose=False, seed=0)
+    fa2.forceatlas2(ADJACENCY, iterations=2)
+    assert fa2.stats.backend == 'numpy'
+    assert not [w for w in recwarn if issubclass(w.category, RuntimeWarning)]
+
+
+def require_backend(backend):
+    if backend not in available_backends():
+        pytest.skip(f"the {backend} backend is not available")
+
+
+def layout_class(backend):
+    require_backend(backend)
+    if backend == 'cython':
+        return fa2util.Layout
+    if backend == 'numpy':
+        return fa2numpy.Layout
+    return python_kernels().NodeLayout
+
+
+def test_the_python_backend_runs_uncompiled_kernels():
+    fa2 = ForceAtlas2(backend='python', seed=0)
+    fa2.forceatlas2(ADJACENCY, iterations=2)
+    assert fa2._layout_class() is python_kernels().NodeLayout
+    assert isinstance(python_kernels().apply_gravity, types.FunctionType)
+
+
+@pytest.mark.parametrize('backend', ['python', 'cython', 'numpy'])
+def test_a_node_without_forces_stays_put(backend):
+    # Strong gravity pulls nothing at the origin, and a lone node feels no repulsion.
+    layout = layout_class(backend)([0.0], [0.0], [1.0], [1.0], [], [], [])
+    layout.reset_forces()
+    layout.apply_gravity(1.0, scalingRatio=1.0, useStrongGravity=True)
+    values = layout.adjustSpeedAndApplyForces(1.0, 1.0, 1.0)
+    assert layout.positions() == [(0.0, 0.0)]
+    assert values['displacement'] == 0.0
+
+
+def forces(layout):
+    nodes = [types.SimpleNamespace() for _ in range(layout.node_count)]
+    layout.update_nodes(nodes)
+    return [(n.dx, n.dy) for n in nodes]
+
+
+def random_layout_arguments(node_count, seed=0):
+    rng = random.Random(seed)
+    return ([rng.uniform(-50, 50) for _ in range(node_count)], [rng.uniform(-50, 50) for _ in range(node_count)],
+            [1.0 + rng.randrange(5) for _ in range(node_count)], [rng.uniform(0.5, 1.5) for _ in range(node_count)])
+
+
+def relative_error(forces, reference):
+    error = sum(abs(f[0] - r[0]) + abs(f[1] - r[1]) for f, r in zip(forces, reference))
+    return error / sum(abs(r[0]) + abs(r[1]) for r in reference)
+
+
+@pytest.mark.parametrize('backend', ['python', 'cython'])
+def test_barnes_hut_approximates_the_exact_repulsion(backend):
+    Layout = layout_class(backend)
+    x, y, mass, size = random_layout_arguments(300)
+
+    def repulsion(adjustSize, theta=None):
+        layout = Layout(x, y, mass, size, [], [], [])
+        layout.reset_forces()
+        if theta is None:
+            layout.apply_repulsion(adjustSize, 1.0)
+        else:
+            layout.apply_repulsion_barneshut(adjustSize, 1.0, theta)
+        return forces(layout)
+
+    for adjustSize in (False, True):
+        # Without approximation, the tree sums the same forces.
+        assert relative_error(repulsion(adjustSize, 0.0), repulsion(adjustSize)) < 1e-9
+    exact = repulsion(False)
+    assert relative_error(repulsion(False, 0.5), exact) < 0.01
+    assert relative_error(repulsion(False, 1.2), exact) < 0.05
+
+
+def run_steps(layout, iterations):
+    speed, speedEfficiency = 1.0, 1.0
+    for _ in range(iterations):
+        layout.reset_forces()
+        layout.apply_repulsion(True, 2.0)
+        layout.apply_gravity(1.0, 2.0)
+        layout.apply_attraction(True, 1.5, 1.0)
+        values = layout.adjustSpeedAndApplyForces(speed, speedEfficiency, 1.0)
+        speed, speedEfficiency = values['speed'], values['speedEfficiency']
+    return layout.positions()
+
+
+@pytest.mark.parametrize('backend', ['cython', 'numpy'])
+def test_array_layouts_follow_the_node_layout(backend):
+    x, y, mass, size = random_layout_arguments(100)
+    rng = random.Random(1)
+    edges = [(rng.randrange(100), rng.randrange(100), rng.uniform(0.5, 2)) for _ in range(150)]
+    edges = [e for e in edges if e[0] != e[1]]
+    arguments = (x, y, mass, size, [e[0] for e in edges], [e[1] for e in edges], [e[2] for e in edges])
+
+    # Only a few iterations: the backends sum in different orders, and the
+    # adaptive speed soon amplifies the rounding differences.
+    expected = run_steps(python_kernels().NodeLayout(*arguments), 5)
+    positions = run_steps(layout_class(backend)(*arguments), 5)
+    assert [c for p in positions for c in p] == pytest.approx([c for p in expected for c in p], abs=1e-6)
+
+
+@pytest.mark.parametrize('backend', ['python', 'cython', 'numpy'])
+def test_layouts_carry_node_state_over(backend):
+    kernels = python_kernels()
+    nodes = []
+    for i in range(3):
+        n = kernels.Node()
+        n.x, n.y, n.mass, n.size = float(i), -float(i), 1.0 + i, 1.0
+        n.dx, n.dy, n.old_dx, n.old_dy = 0.5 * i, 0.25, -0.5, 0.125 * i
+        nodes.append(n)
+    edge = kernels.Edge()
+    edge.node1, edge.node2, edge.weight = 0, 2, 1.0
+
+    copies = [types.SimpleNamespace() for _ in nodes]
+    layout_class(backend).from_nodes(nodes, [edge]).update_nodes(copies)
+    for n, copy in zip(nodes, copies):
+        assert (copy.x, copy.y, copy.dx, copy.dy, copy.old_dx, copy.old_dy) == \
+            (n.x, n.y, n.dx, n.dy, n.old_dx, n.old_dy)
+
+
+@pytest.mark.parametrize('barnesHutOptimize', [False, True])
+def test_parallel_kernels_match_a_single_thread(barnesHutOptimize):
+    require_backend('cython')
+    adjacency, size = dependency_graph(500)
+    positions = {}
+    for threads in (1, 4):
+        fa2 = ForceAtlas2(backend='cython', multiThreaded=threads, barnesHutOptimize=barnesHutOptimize,
+                          adjustSizes=True, outboundAttractionDistribution=True, seed=0)
+        positions[threads] = fa2.forceatlas2(adjacency, iterations=5, size=size)
+        assert fa2.stats.threads == threads
+    assert [c for p in positions[4] for c in p] == pytest.approx([c for p in positions[1] for c in p], abs=1e-6)
+
+
+# 0 -> 1 and 1 -> 0 collapse into one edge, 2 -> 2 is dropped
+DENSE = [[0, 2.0, 0],
+         [1.0, 0, 3.0],
+         [0, 0, 5.0]]
+CSR = ([0, 1, 3, 4], [1, 0, 2, 2], [2.0, 1.0, 3.0, 5.0])
+
+
+def test_adjacency_formats_give_the_same_edges():
+    expected = ([0, 1], [1, 2], [2.0, 3.0], [1, 2, 1])
+    assert adjacency_to_edges(DENSE) == expected
+    assert adjacency_to_edges(CSR) == expected
+    # Without data, every edge weighs 1
+    assert adjacency_to_edges(CSR[:2]) == ([0, 1], [1, 2], [1.0, 1.0], [1, 2, 1])
+
+
+def test_sparse_matrices_give_the_same_edges():
+    sparse = pytest.importorskip('scipy.sparse')
+    assert adjacency_to_edges(sparse.csr_matrix(DENSE)) == adjacency_to_edges(DENSE)
+    assert adjacency_to_edges(sparse.coo_matrix(DENSE)) == adjacency_to_edges(DENSE)
+
+
+def test_networkx_graphs_keep_every_edge():
+    nx = pytest.importorskip('networkx')
+    G = nx.DiGraph()
+    G.add_nodes_from(['c', 'b', 'a'])
+    # Edges to nodes earlier in the node order, which once got lost
+    G.add_edge('a', 'b', weight=2.0)
+    G.add_edge('b', 'c')
+    G.add_edge('a', 'c')
+    G.nodes['a']['size'] = 4.0
+
+    node_list, adjacency, size = networkx_to_adjacency(G)
+    assert node_list == ['c', 'b', 'a']
+    edge_node1, edge_node2, edge_weight, degree = adjacency_to_edges(adjacency)
+    assert sorted(zip((node_list[i] for i in edge_node1), (node_list[j] for j in edge_node2), edge_weight)) == \
+        [('a', 'b', 2.0), ('a', 'c', 1.0), ('b', 'c', 1.0)]
+    assert degree == [0, 1, 2]
+    assert size == [None, None, 4.0]
+
+    pos = ForceAtlas2(seed=0).forceatlas2_networkx_layout(G, iterations=5)
+    assert set(pos) == {'a', 'b', 'c'}
+
+
+@pytest.mark.parametrize('backend', ['python', 'cython', 'numpy'])
+@pytest.mark.parametrize('distributedAttraction', [False, True])
+def test_lin_log_attraction_grows_with_the_log_of_the_distance(backend, distributedAttraction):
+    # Sizes of 1 leave a distance of 8 between the borders of the nodes.
+    layout = layout_class(backend)([0.0, 10.0], [0.0, 0.0], [2.0, 1.0], [1.0, 1.0], [0], [1], [2.0])
+    layout.reset_forces()
+    layout.apply_attraction(distributedAttraction, 1.5, 1.0, linLogMode=True)
+    factor = -1.5 * 2.0 * math.log(1 + 8) / 8
+    if distributedAttraction:
+        factor /= 2.0
+    (dx0, dy0), (dx1, dy1) = forces(layout)
+    assert (dx0, dy0, dx1, dy1) == pytest.approx((-10 * factor, 0.0, 10 * factor, 0.0))
+
+
+def test_multi_threaded_takes_a_thread_count():
+    assert ForceAtlas2(multiThreaded=True).threads == 0
+    assert ForceAtlas2(multiThreaded=False).threads == 1
+    assert ForceAtlas2(multiThreaded=3).threads == 3
+    for multiThreaded in (0, -2):
+        with pytest.raises(ValueError, match='multiThreaded'):
+            ForceAtlas2(multiThreaded=multiThreaded)
+
+
+def test_snapshots_follow_the_layout():
+    snapshots = []
+    fa2 = ForceAtlas2(seed=0)
+    positions = fa2.forceatlas2(ADJACENCY, iterations=20, snapshot=snapshots.append,
+                                snapshotIterations=5, snapshotInterval=0)
+    assert len(snapshots) == 4
+    assert all(len(snapshot) == 4 for snapshot in snapshots)
+    assert snapshots[-1] == positions
+    assert snapshots[0] != positions
+
+
+def test_multilevel_snapshots_cover_every_node():
+    adjacency, size = dependency_graph(400)
+    snapshots = []
+    fa2 = ForceAtlas2(multilevel=True, multilevelMinNodes=50, refineIterations=10, seed=0)
+    positions = fa2.forceatlas2(adjacency, iterations=20, size=size, snapshot=snapshots.append,
+                                snapshotIterations=10, snapshotInterval=0)
+    assert fa2.stats.levels > 2
+    assert len(snapshots) == 2 + (fa2.stats.levels - 1)
+    assert all(len(snapshot) == 400 for snapshot in snapshots)
+    # Coarse levels show every member of a coarse node at its position.
+    assert len(set(snapshots[0])) < 400
+    assert snapshots[-1] == positions
+
+
+def edges_to_csr(node_count, edges):
+    rows = [[] for _ in range(node_count)]
+    for i, j in edges:
+        rows[i].append(j)
+    indptr = [0]
+    indices = []
+    for row in rows:
+        indices.extend(row)
+        indptr.append(len(indices))
+    return indptr, indices
+
+
+def test_packed_disks_do_not_overlap():
+    rng = random.Random(0)
+    radii = [rng.uniform(0.5, 20) for _ in range(40)]
+    centers = pack_disks(radii, 2.0)
+    assert centers[radii.index(max(radii))] == (0.0, 0.0)
+    for i in range(len(radii)):
+        for j in range(i):
+            distance = math.dist(centers[i], centers[j])
+            assert distance >= radii[i] + radii[j] + 2.0 - 1e-9
+
+
+def test_components_are_laid_out_apart():
+    # A chain of 30 nodes, a tree of 15, a star around node 45 and two
+    # isolated nodes
+    edges = [(i, i + 1) for i in range(29)]
+    edges += [(30 + i, 30 + (i - 1) // 2) for i in range(1, 15)]
+    edges += [(45, 46 + i) for i in range(5)]
+    node_count = 53
+    size = [1.0] * node_count
+    fa2 = ForceAtlas2(componentLayout=True, multiThreaded=2, seed=0)
+    positions = fa2.forceatlas2(edges_to_csr(node_count, edges), iterations=30, size=size)
+    assert len(positions) == node_count
+    assert fa2.iterationsRun == 30
+
+    components = connected_components(node_count, [e[0] for e in edges], [e[1] for e in edges])
+    assert [len(c) for c in components] == [30, 15, 6, 1, 1]
+    disks = []
+    for members in components:
+        cx = sum(positions[u][0] for u in members) / len(members)
+        cy = sum(positions[u][1] for u in members) / len(members)
+        disks.append(((cx, cy), max(math.dist((cx, cy), positions[u]) + size[u] for u in members)))
+    for i in range(len(disks)):
+        for j in range(i):
+            assert math.dist(disks[i][0], disks[j][0]) > disks[i][1] + disks[j][1]
+
+    # The star is laid out in closed form, its leaves evenly around the hub.
+    hub = positions[45]
+    distances = [math.dist(hub, positions[u]) for u in range(46, 51)]
+    assert max(distances) - min(distances) < 1e-9
@@ -0,0 +1,67 @@
+import os
+import pickle
+import threading
+
+from src import graph_cache
+from src.dependency_graph import GRAPH_VERSION, DependencyGraph
+
+
+def test_unusable_caches_are_rebuilt(tmp_path):
+    path = tmp_path / 'graph.pkl'
+    assert graph_cache.load_graph(str(path)) is None
+    # Truncated, and naming a module or a class that no longer exists
+    for data in (pickle.dumps(list(range(100)))[:20], b'csrc.missing\nGraph\n.', b'csrc.graph_cache\nGraph\n.'):
+        path.write_bytes(data)
+        assert graph_cache.load_graph(str(path)) is None
+
+
+def test_legacy_caches_are_removed(tmp_path, monkeypatch):
+    legacy = (tmp_path / 'node_graph.pkl', tmp_path / 'pos_dict.pkl')
+    for path in legacy:
+        path.write_bytes(pickle.dumps({}))
+    path = str(tmp_path / 'dependency_graph.pkl')
+    monkeypatch.setattr(graph_cache, 'GRAPH_CACHE', path)
+    monkeypatch.setattr(graph_cache, 'LEGACY_CACHES', tuple(map(str, legacy)))
+
+    graph_cache.write_graph({'nodes': 3}, path)
+    assert graph_cache.load_graph(path) == {'nodes': 3}
+    assert not any(path.exists() for path in legacy)
+
+
+def test_graphs_cached_by_other_versions_are_rebuilt(tmp_path):
+    graph = DependencyGraph(['a=1:all', 'b=1:all'], [1, 0], ['admin', 'admin'], [(0, 1)])
+    path = str(tmp_path / 'graph.pkl')
+    graph_cache.write_graph(graph, path)
+    assert graph_cache.load_graph(path).names == graph.names
+
+    # As cached before graphs had a version, or components were indexed
+    del graph.version
+    del graph.component
+    graph_cache.write_graph(graph, path)
+    assert graph_cache.load_graph(path) is None
+
+    graph.version = GRAPH_VERSION - 1
+    graph_cache.write_graph(graph, path)
+    assert graph_cache.load_graph(path) is None
+
+
+def test_concurrent_writes_do_not_share_a_temporary_file(tmp_path):
+    path = str(tmp_path / 'graph.pkl')
+    graphs = [list(range(n * 100000)) for n in range(1, 9)]
+    errors = []
+
+    def write(graph):
+        try:
+            graph_cache.write_graph(graph, path)
+        except OSError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=write, args=(graph,)) for graph in graphs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert graph_cache.load_graph(path) in graphs
+    assert os.listdir(tmp_path) == ['graph.pkl']
@@ -0,0 +1,136 @@
+import random
+
+import pytest
+
+from src.apt_dependency import build_dependency_graph_from_status
+from src.dependency_graph import DependencyGraph
+
+STATUS = """\
+Package: editor
+Status: install ok installed
+Architecture: amd64
+Version: 1.0
+Depends: libeditor (>= 1.0)
+
+Package: libeditor
+Status: install ok installed
+Architecture: amd64
+Version: 1.2
+Depends: libc6
+
+Package: libc6
+Status: install ok installed
+Architecture: amd64
+Version: 2.36
+
+Package: unused
+Status: install ok installed
+Architecture: amd64
+Version: 0.1
+Depends: libc6
+"""
+
+EXTENDED_STATES = """\
+Package: libeditor
+Architecture: amd64
+Auto-Installed: 1
+
+Package: libc6
+Architecture: amd64
+Auto-Installed: 1
+
+Package: unused
+Architecture: amd64
+Auto-Installed: 1
+"""
+
+
+def build_graph(tmp_path):
+    (tmp_path / 'status').write_text(STATUS)
+    (tmp_path / 'extended_states').write_text(EXTENDED_STATES)
+    return build_dependency_graph_from_status(tmp_path / 'status', tmp_path / 'extended_states')
+
+
+def test_automatically_installed_dependencies_are_followed(tmp_path):
+    graph = build_graph(tmp_path)
+    node = {name.split('=')[0]: i for i, name in enumerate(graph.names)}
+    assert set(node) == {'editor', 'libeditor', 'libc6'}
+    assert list(graph.successors(node['libeditor'])) == [node['libc6']]
+
+
+def test_chains_lead_through_automatically_installed_packages(tmp_path):
+    graph = build_graph(tmp_path)
+    node = {name.split('=')[0]: i for i, name in enumerate(graph.names)}
+    paths = graph.install_paths()
+    assert paths.chains(node['libeditor'], 3) == [[node['editor'], node['libeditor']]]
+    assert paths.chains(node['libc6'], 3) == [[node['editor'], node['libeditor'], node['libc6']]]
+
+
+def make_graph(manual, edges):
+    node_count = len(manual)
+    return DependencyGraph([f'p{i}=1:all' for i in range(node_count)], manual, ['admin'] * node_count, edges)
+
+
+def shortest_distances(graph):
+    """Distance of every node from the nearest manually installed one, by breadth-first search"""
+    distance = {node: 0 for node in graph.nodes() if graph.manual[node]}
+    queue = list(distance)
+    for node in queue:
+        for dependency in graph.successors(node):
+            if dependency not in distance:
+                distance[dependency] = distance[node] + 1
+                queue.append(dependency)
+    return distance
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_graphs_match_a_search(seed):
+    rng = random.Random(seed)
+    node_count = 80
+    manual = [rng.random() < 0.1 for _ in range(node_count)]
+    edges = [(rng.randrange(node_count), rng.randrange(node_count)) for _ in range(120)]
+    graph = make_graph(manual, edges)
+    paths = graph.install_paths()
+    distance = shortest_distances(graph)
+
+    # Number of shortest paths from a manual package to every node
+    path_count = {}
+    for node in sorted(distance, key=distance.get):
+        path_count[node] = 1 if distance[node] == 0 else sum(path_count[p] for p in paths.parents(node))
+
+    for node in graph.nodes():
+        assert paths.distance[node] == distance.get(node, -1)
+        expected = {p for p in graph.predecessors(node)
+                    if node in distance and distance.get(p) == distance[node] - 1}
+        assert sorted(paths.parents(node)) == sorted(expected)
+
+        chains = paths.chains(node, 1000)
+        if node not in distance:
+            assert chains == []
+            continue
+        # The chains are the distinct shortest paths from a manual package
+        assert len({tuple(chain) for chain in chains}) == len(chains) == min(path_count[node], 1000)
+        for chain in chains:
+            assert len(chain) == distance[node] + 1
+            assert graph.manual[chain[0]] and chain[-1] == node
+            assert all(b in graph.successors(a) for a, b in zip(chain, chain[1:]))
+
+
+def test_packages_nothing_manual_needs_have_no_chain():
+    # 0 is manual and needs 1; 2 needs 3, but nothing manual needs 2
+    graph = make_graph([1, 0, 0, 0], [(0, 1), (2, 3)])
+    paths = graph.install_paths()
+    assert paths.distance[2] == paths.distance[3] == -1
+    assert paths.chains(3, 5) == []
+    assert paths.chains(0, 5) == [[0]]
+    assert paths.chains(1, 0) == []
+
+
+def test_chains_start_from_every_nearest_manual_package():
+    # 0 and 1 are manual and both need 2 through a package of their own,
+    # 5 is manual as well but further away; 2 needs 6.
+    graph = make_graph([1, 1, 0, 0, 0, 1, 0], [(0, 3), (1, 4), (3, 2), (4, 2), (5, 0), (2, 6)])
+    paths = graph.install_paths()
+    assert paths.distance[6] == 3
+    assert sorted(paths.chains(6, 5)) == [[0, 3, 2, 6], [1, 4, 2, 6]]
+    assert len(paths.chains(6, 1)) == 1
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.layout_benchmark import dependency_graph
+from src.dependency_graph import DependencyGraph
+from src.fa2_adjustSize import ForceAtlas2
+from src.layout_job import LayoutJob, layout_options
+
+
+def test_default_layout_converges_before_the_iteration_limit():
+    adjacency, size = dependency_graph(1000)
+    fa2 = ForceAtlas2(**layout_options())
+    fa2.forceatlas2(adjacency, iterations=800, size=size)
+    assert fa2.stopReason == 'converged'
+    assert fa2.iterationsRun < 800
+
+
+def test_pivot_mds_converges_in_fewer_iterations_than_random():
+    adjacency, size = dependency_graph(1000)
+    iterations = {}
+    for initialLayout in ('random', 'pivot-mds'):
+        fa2 = ForceAtlas2(**layout_options(initialLayout=initialLayout))
+        fa2.forceatlas2(adjacency, iterations=800, size=size)
+        iterations[initialLayout] = fa2.iterationsRun
+    assert iterations['pivot-mds'] < iterations['random'] * 3 // 4
+
+
+def test_a_killed_worker_fails_the_job():
+    graph = DependencyGraph([f'p{i}=1:all' for i in range(200)], [1] * 200, ['admin'] * 200,
+                            [(i, (i * 7 + 1) % 200) for i in range(200)])
+    job = LayoutJob(**layout_options(convergenceThreshold=0))
+    killer = threading.Thread(target=_kill_when_running, args=(job,))
+    killer.start()
+    with pytest.raises(RuntimeError, match='exited with code'):
+        job.run(graph, iterations=1000000)
+    killer.join()
+
+
+def test_a_cancelled_job_returns_none():
+    graph = DependencyGraph(['a=1:all', 'b=1:all'], [1, 0], ['admin', 'admin'], [(0, 1)])
+    job = LayoutJob(**layout_options())
+    job.cancel()
+    assert job.run(graph) is None
+
+
+def _kill_when_running(job):
+    while job._process is None or not job._process.is_alive():
+        time.sleep(0.01)
+    time.sleep(0.5)
+    job._process.kill()
+
+
+def test_pivot_mds_falls_back_to_radial_without_numpy(monkeypatch):
+    monkeypatch.setattr('src.layout_job.available_initial_layouts', lambda: ['random', 'radial'])
+    assert layout_options()['initialLayout'] == 'radial'
+    assert layout_options(initialLayout='random')['initialLayout'] == 'random'
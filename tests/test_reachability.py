@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from src.dependency_graph import DependencyGraph
+
+
+def make_graph(node_count, edges):
+    return DependencyGraph([f'p{i}=1:all' for i in range(node_count)], [0] * node_count,
+                           ['admin'] * node_count, edges)
+
+
+def random_graph(seed, node_count, edge_count, acyclic):
+    rng = random.Random(seed)
+    edges = []
+    for _ in range(edge_count):
+        i, j = rng.randrange(node_count), rng.randrange(node_count)
+        if acyclic:
+            if i == j:
+                continue
+            # Dependencies always have the lower number
+            i, j = max(i, j), min(i, j)
+        edges.append((i, j))
+    return make_graph(node_count, edges)
+
+
+def reached(neighbors, node):
+    """Nodes reachable from `node` over at least one edge, by breadth-first search"""
+    seen = set()
+    frontier = [node]
+    while frontier:
+        frontier = [m for n in frontier for m in neighbors(n) if m not in seen]
+        seen.update(frontier)
+    seen.discard(node)
+    return seen
+
+
+def check_against_search(graph):
+    index = graph.reachability()
+    for node in graph.nodes():
+        dependencies = reached(graph.successors, node)
+        dependents = reached(graph.predecessors, node)
+        assert sorted(index.dependencies(node)) == sorted(dependencies)
+        assert sorted(index.dependents(node)) == sorted(dependents)
+        for other in graph.nodes():
+            assert index.depends_on(node, other) == (other in dependencies)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_dags_match_a_search(seed):
+    check_against_search(random_graph(seed, 60, 120, acyclic=True))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_cyclic_graphs_match_a_search(seed):
+    # Sparse enough to leave several components, cycles and self-loops
+    check_against_search(random_graph(seed, 60, 75, acyclic=False))
+
+
+def test_cycles_are_condensed():
+    # 1 -> 2 -> 3 -> 1 is a cycle between 0 above and 4 below, 4 depends on itself
+    graph = make_graph(6, [(0, 1), (1, 2), (2, 3), (3, 1), (3, 4), (4, 4)])
+    index = graph.reachability()
+    cycle = index.scc[1]
+    assert index.scc[2] == index.scc[3] == cycle
+    assert sorted(index.members(cycle)) == [1, 2, 3]
+    assert list(index.members(index.scc[4])) == [4]
+    # Dependencies have the lower numbers
+    assert index.scc[4] < cycle < index.scc[0]
+
+    assert sorted(index.dependencies(2)) == [1, 3, 4]
+    assert sorted(index.dependents(2)) == [0, 1, 3]
+    assert sorted(index.dependencies(4)) == []
+    assert index.depends_on(3, 2) and index.depends_on(2, 3)
+    assert not index.depends_on(2, 2)
+    assert not index.depends_on(4, 1)
+    assert index.dependencies(5) == [] and index.dependents(5) == []
+    check_against_search(graph)